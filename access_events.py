@@ -0,0 +1,404 @@
+"""
+access_events.py
+
+This script keeps every verification outcome (identity, closest match,
+distance, door, latency) in an indexed SQLite database, so audit questions
+such as "who entered the back door last week" are an index lookup instead of
+a grep through sys.log. The verification threads only queue the event; a
+background writer inserts them in batches, one transaction per batch, and
+deletes events older than ACCESS_EVENT_RETENTION_DAYS on a schedule.
+
+Query the store from the command line:
+    python access_events.py --identity alice --since 7d
+    python access_events.py --door back --rejected --since 2026-10-01 --until 2026-10-08
+    python access_events.py --summary --since 30d
+"""
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+import argparse  # For the query command line
+import atexit   # For writing queued events at exit
+import logging  # For logging events and errors
+import os       # For checking the database exists before querying it
+import queue    # For handing events to the writer thread
+import sqlite3  # For the indexed event database
+import sys      # For the CLI's error output
+import threading  # For the writer thread
+import time     # For timestamps and timing operations
+from datetime import datetime  # For parsing and printing query times
+from audit_log import configure_logging  # For the CLI's log writer
+from config import *  # Import all configuration variables from config.py
+
+#------------------------------------------------------------------------------
+# Logging
+#------------------------------------------------------------------------------
+logger = logging.getLogger(__name__)  # Get a logger instance for this module
+
+#------------------------------------------------------------------------------
+# Schema
+#------------------------------------------------------------------------------
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS access_events (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    door TEXT NOT NULL,
+    identity TEXT,
+    closest TEXT,
+    distance REAL,
+    latency_ms REAL,
+    granted INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS access_events_timestamp ON access_events (timestamp);
+CREATE INDEX IF NOT EXISTS access_events_identity ON access_events (identity, timestamp);
+CREATE INDEX IF NOT EXISTS access_events_door ON access_events (door, timestamp);
+"""
+# timestamp: Unix time of the verification
+# identity: Verified name, NULL when the face was rejected
+# closest: Closest enrolled name whatever the outcome, NULL for an empty gallery
+#          or a face that produced no encoding (distance is NULL too)
+# latency_ms: Frame capture to verification decision
+
+INSERT = ("INSERT INTO access_events (timestamp, door, identity, closest, distance, latency_ms, granted) "
+          "VALUES (?, ?, ?, ?, ?, ?, ?)")
+
+
+def open_database(path, read_only=False):
+    """
+    Opens the event database, creating the table and indexes if needed
+
+    Args:
+        path: SQLite database file
+        read_only: Open without creating or changing anything, for queries
+
+    Returns:
+        sqlite3.Connection: The open database
+    """
+    if read_only:
+        return sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA auto_vacuum = INCREMENTAL")  # Only takes effect on a new database
+    connection.execute("PRAGMA journal_mode = WAL")  # Queries do not block the writer
+    connection.execute("PRAGMA synchronous = NORMAL")  # Safe with WAL, far fewer SD-card syncs
+    connection.executescript(SCHEMA)
+    return connection
+
+#------------------------------------------------------------------------------
+# Event Store
+#------------------------------------------------------------------------------
+class AccessEventStore:
+    """
+    Batched, indexed store of verification outcomes
+
+    record() only queues the event. Events are never dropped: like security
+    log records they are the audit trail.
+
+    Attributes:
+        path: SQLite database file
+        written: Events inserted so far
+        deleted: Events removed by retention so far
+    """
+
+    def __init__(self, path=ACCESS_EVENT_DB, batch_size=ACCESS_EVENT_BATCH_SIZE,
+                 flush_interval=ACCESS_EVENT_FLUSH_INTERVAL, retention_days=ACCESS_EVENT_RETENTION_DAYS,
+                 retention_interval=ACCESS_EVENT_RETENTION_INTERVAL):
+        """
+        Args:
+            path: SQLite database file
+            batch_size: Events inserted per transaction at most
+            flush_interval: Maximum seconds an event waits before it is written
+            retention_days: Events older than this are deleted, 0 keeps everything
+            retention_interval: Seconds between retention passes
+        """
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self.retention_interval = retention_interval
+        self.events = queue.Queue()
+        self.written = 0
+        self.deleted = 0
+        self.thread = threading.Thread(target=self._run, name="access-event-writer", daemon=True)
+
+    def start(self):
+        """Opens the database and starts the writer thread"""
+        open_database(self.path).close()  # Creates the schema here so startup errors reach the caller
+        self.thread.start()
+
+    def stop(self):
+        """Writes everything queued and stops the writer thread"""
+        self.events.put(None)  # Sentinel, queued behind every pending event
+        self.thread.join(timeout=5)
+
+    def record(self, door, identity, closest, distance, latency):
+        """
+        Queues one verification outcome
+
+        Args:
+            door: Door name
+            identity: Verified name, or None if the face was rejected
+            closest: Closest enrolled name, or None for an empty gallery
+            distance: Distance to the closest enrolled face
+            latency: Seconds from frame capture to the decision, or None if unknown
+        """
+        self.events.put_nowait((time.time(), door, identity, closest,
+                                None if distance is None else float(distance),
+                                None if latency is None else latency * 1000.0,
+                                int(identity is not None)))
+
+    def _run(self):
+        connection = open_database(self.path)  # sqlite3 connections belong to the thread that opened them
+        next_retention = time.monotonic()
+        stopping = False
+        try:
+            while not stopping:
+                try:
+                    batch = [self.events.get(timeout=self.flush_interval)]
+                except queue.Empty:
+                    batch = []
+                # Gather events for up to flush_interval so a burst becomes one transaction
+                deadline = time.monotonic() + self.flush_interval
+                while batch and batch[-1] is not None and len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self.events.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+                if None in batch:
+                    stopping = True
+                    batch = [event for event in batch if event is not None]
+                if batch:
+                    self._write(connection, batch)
+                if self.retention_days and time.monotonic() >= next_retention:
+                    self._apply_retention(connection)
+                    next_retention = time.monotonic() + self.retention_interval
+        finally:
+            connection.close()
+
+    def _write(self, connection, batch):
+        """Inserts a batch in one transaction"""
+        try:
+            with connection:
+                connection.executemany(INSERT, batch)
+            self.written += len(batch)
+        except sqlite3.Error as e:
+            logger.error(f"Error writing {len(batch)} access events: {e}")
+
+    def _apply_retention(self, connection):
+        """Deletes events older than retention_days and returns their pages to the file system"""
+        cutoff = time.time() - self.retention_days * 24 * 60 * 60
+        try:
+            with connection:
+                deleted = connection.execute("DELETE FROM access_events WHERE timestamp < ?", (cutoff,)).rowcount
+            if deleted:
+                connection.execute("PRAGMA incremental_vacuum")
+                self.deleted += deleted
+                logger.info(f"Access event retention removed {deleted} events older than {self.retention_days} days")
+        except sqlite3.Error as e:
+            logger.error(f"Error applying access event retention: {e}")
+
+#------------------------------------------------------------------------------
+# Setup
+#------------------------------------------------------------------------------
+event_store = None  # Started AccessEventStore, None records nothing
+
+
+def start_event_store(path=ACCESS_EVENT_DB):
+    """
+    Starts recording verification outcomes when ACCESS_EVENTS_ENABLED is set
+
+    Args:
+        path: SQLite database file
+
+    Returns:
+        AccessEventStore: The started store, or None if disabled or it could not be opened
+    """
+    global event_store
+    if not ACCESS_EVENTS_ENABLED:
+        return None
+    try:
+        store = AccessEventStore(path)
+        store.start()
+    except sqlite3.Error as e:
+        logger.error(f"Error opening access event store {path}: {e}")
+        return None
+    event_store = store
+    atexit.register(stop_event_store)
+    return store
+
+
+def stop_event_store():
+    """Writes the queued events and stops recording"""
+    global event_store
+    store, event_store = event_store, None
+    if store is not None:
+        store.stop()
+
+
+def record_access(door, identity, closest, distance, latency=None):
+    """
+    Records a verification outcome if the event store is running, see AccessEventStore.record
+
+    Args:
+        door: Door name, None for the single-door setup
+        identity: Verified name, or None if the face was rejected
+        closest: Closest enrolled name, None if the face produced no encoding
+        distance: Distance to the closest enrolled face, None if the face produced no encoding
+        latency: Seconds from frame capture to the decision
+    """
+    store = event_store
+    if store is not None:
+        store.record(door if door is not None else METRICS_LABELS.get("door", "front"), identity, closest, distance, latency)
+
+#------------------------------------------------------------------------------
+# Queries
+#------------------------------------------------------------------------------
+def parse_time(text):
+    """
+    Parses a query time: "7d", "12h" or "30m" ago, or an ISO date/time
+
+    Returns:
+        float: Unix time
+    """
+    units = {"d": 24 * 60 * 60, "h": 60 * 60, "m": 60}
+    if text[-1:] in units and text[:-1].replace(".", "", 1).isdigit():
+        return time.time() - float(text[:-1]) * units[text[-1]]
+    return datetime.fromisoformat(text).timestamp()
+
+
+def query_events(connection, identity=None, door=None, since=None, until=None, granted=None, limit=100):
+    """
+    Newest events first, filtered on the indexed columns
+
+    Args:
+        connection: Open event database
+        identity: Verified name
+        door: Door name
+        since: Unix time of the oldest event
+        until: Unix time of the newest event
+        granted: True for unlocks, False for rejections, None for both
+        limit: Maximum number of events
+
+    Returns:
+        list: (timestamp, door, identity, closest, distance, latency_ms, granted) rows
+    """
+    conditions, parameters = [], []
+    if identity is not None:
+        conditions.append("identity = ?")
+        parameters.append(identity)
+    if door is not None:
+        conditions.append("door = ?")
+        parameters.append(door)
+    if since is not None:
+        conditions.append("timestamp >= ?")
+        parameters.append(since)
+    if until is not None:
+        conditions.append("timestamp <= ?")
+        parameters.append(until)
+    if granted is not None:
+        conditions.append("granted = ?")
+        parameters.append(int(granted))
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return connection.execute(f"SELECT timestamp, door, identity, closest, distance, latency_ms, granted "
+                              f"FROM access_events {where} ORDER BY timestamp DESC LIMIT ?",
+                              parameters + [limit]).fetchall()
+
+
+def summarize_events(connection, since=None, until=None):
+    """
+    Unlocks and rejections per door and identity
+
+    Returns:
+        list: (door, identity or None, granted count, rejected count, last timestamp) rows
+    """
+    conditions, parameters = [], []
+    if since is not None:
+        conditions.append("timestamp >= ?")
+        parameters.append(since)
+    if until is not None:
+        conditions.append("timestamp <= ?")
+        parameters.append(until)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return connection.execute(f"SELECT door, identity, SUM(granted), SUM(1 - granted), MAX(timestamp) "
+                              f"FROM access_events {where} GROUP BY door, identity ORDER BY door, identity",
+                              parameters).fetchall()
+
+
+def _format_time(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def main(argv=None):
+    """
+    Query command line, see the module docstring
+
+    Args:
+        argv: Arguments, None reads sys.argv
+
+    Returns:
+        int: Exit status, 1 if the database cannot be read
+    """
+    parser = argparse.ArgumentParser(description="Query the access event store")
+    parser.add_argument("--db", default=ACCESS_EVENT_DB, help="Event database")
+    parser.add_argument("--identity", help="Verified name")
+    parser.add_argument("--door", help="Door name")
+    parser.add_argument("--since", help="Oldest event: 7d, 12h, 30m ago or an ISO date/time")
+    parser.add_argument("--until", help="Newest event: 7d, 12h, 30m ago or an ISO date/time")
+    outcome = parser.add_mutually_exclusive_group()
+    outcome.add_argument("--granted", action="store_true", help="Only unlocks")
+    outcome.add_argument("--rejected", action="store_true", help="Only rejections")
+    parser.add_argument("--limit", type=int, default=100, help="Maximum events listed")
+    parser.add_argument("--summary", action="store_true", help="Counts per door and identity instead of events")
+    args = parser.parse_args(argv)
+
+    try:
+        since = parse_time(args.since) if args.since else None
+        until = parse_time(args.until) if args.until else None
+    except ValueError as e:
+        parser.error(f"Invalid time: {e}")
+    if not os.path.exists(args.db):
+        print(f"Access event database {args.db} not found, events are recorded while main.py runs "
+              f"with ACCESS_EVENTS_ENABLED", file=sys.stderr)
+        return 1
+    try:
+        connection = open_database(args.db, read_only=True)
+    except sqlite3.Error as e:
+        print(f"Cannot open access event database {args.db}: {e}", file=sys.stderr)
+        return 1
+    started = time.perf_counter()
+    try:
+        if args.summary:
+            rows = summarize_events(connection, since, until)
+            elapsed = time.perf_counter() - started
+            for door, identity, granted, rejected, last in rows:
+                print(f"{door:<12} {identity or '(rejected)':<24} granted {granted:>6}  rejected {rejected:>6}  "
+                      f"last {_format_time(last)}")
+        else:
+            granted = True if args.granted else False if args.rejected else None
+            rows = query_events(connection, args.identity, args.door, since, until, granted, args.limit)
+            elapsed = time.perf_counter() - started
+            for timestamp, door, identity, closest, distance, latency_ms, was_granted in rows:
+                if was_granted:
+                    outcome_text = f"granted  {identity}"
+                elif distance is None and closest is None:
+                    outcome_text = "rejected (no encoding)"
+                else:
+                    outcome_text = f"rejected (closest {closest})"
+                distance_text = f"{distance:.3f}" if distance is not None else "-"
+                latency_text = f"{latency_ms:.0f} ms" if latency_ms is not None else "-"
+                print(f"{_format_time(timestamp)}  {door:<12} {outcome_text:<36} distance {distance_text}  "
+                      f"latency {latency_text}")
+    except sqlite3.Error as e:
+        print(f"Cannot query access event database {args.db}: {e}", file=sys.stderr)
+        return 1
+    finally:
+        connection.close()
+    print(f"{len(rows)} rows in {elapsed * 1000:.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    configure_logging()
+    sys.exit(main())
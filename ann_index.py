@@ -0,0 +1,241 @@
+"""
+ann_index.py
+
+This script builds and searches an inverted-file (IVF) approximate nearest
+neighbour index over the gallery, so matching only scans the few clusters
+closest to the probe instead of every authorized face.
+"""
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+import hashlib  # For fingerprinting the gallery an index was built from
+import logging  # For logging events and errors
+import os       # For atomic file replacement
+import numpy as np  # For numerical operations
+from config import *  # Import all configuration variables from config.py
+
+#------------------------------------------------------------------------------
+# Logging
+#------------------------------------------------------------------------------
+logger = logging.getLogger(__name__)  # Get a logger instance for this module
+
+#------------------------------------------------------------------------------
+# Helpers
+#------------------------------------------------------------------------------
+def gallery_fingerprint(gallery):
+    """
+    Computes a fingerprint of a gallery so a stale index can be detected
+
+    Every stored row (and int8 scale) is hashed, so any change to an
+    embedding or to the row order yields a different fingerprint.
+
+    Args:
+        gallery: FaceGallery the index belongs to
+
+    Returns:
+        int: Signed 64-bit BLAKE2b digest of the gallery rows
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(f"{gallery.dtype}:{len(gallery)}".encode("ascii"))
+    digest.update(np.ascontiguousarray(gallery.encodings).view(np.uint8))
+    if gallery.scales is not None:
+        digest.update(np.ascontiguousarray(gallery.scales, dtype="<f4").view(np.uint8))
+    return int.from_bytes(digest.digest(), "little", signed=True)
+
+
+def _squared_distances(points, centroids):
+    """Squared Euclidean distances between every point and every centroid, shape (len(points), len(centroids))"""
+    squared = (np.einsum("ij,ij->i", points, points)[:, None]
+               + np.einsum("ij,ij->i", centroids, centroids)[None, :]
+               - 2.0 * (points @ centroids.T))
+    return np.maximum(squared, 0.0, out=squared)
+
+
+def _assign(points, centroids, chunk_size=8192):
+    """Index of the nearest centroid for every point, computed in chunks to bound memory"""
+    labels = np.empty(len(points), dtype=np.int32)
+    for start in range(0, len(points), chunk_size):
+        labels[start:start + chunk_size] = np.argmin(_squared_distances(points[start:start + chunk_size], centroids), axis=1)
+    return labels
+
+
+def _kmeans(points, nlist, iterations, rng):
+    """
+    Lloyd's k-means on float32 points
+
+    Args:
+        points: Training points of shape (M, 128)
+        nlist: Number of clusters
+        iterations: Number of assignment/update rounds
+        rng: numpy Generator used for initialisation and reseeding
+
+    Returns:
+        numpy.ndarray: Centroids of shape (nlist, 128)
+    """
+    centroids = points[rng.choice(len(points), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _assign(points, centroids)
+        counts = np.bincount(labels, minlength=nlist)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, points)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+        # Reseed empty clusters from random points so every list stays useful
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = points[rng.choice(len(points), len(empty), replace=False)]
+    return centroids
+
+#------------------------------------------------------------------------------
+# IVF Index
+#------------------------------------------------------------------------------
+class IVFIndex:
+    """
+    Inverted-file index: a coarse k-means quantizer plus one list of gallery
+    rows per centroid, stored CSR style (list_offsets into list_ids)
+
+    Attributes:
+        centroids: float32 matrix of shape (nlist, 128)
+        list_offsets: int64 array of shape (nlist + 1,), list k spans list_ids[offsets[k]:offsets[k + 1]]
+        list_ids: int64 gallery row numbers grouped by list
+        fingerprint: gallery_fingerprint of the gallery the index was built from
+        nprobe: Number of closest lists scanned per search
+    """
+
+    def __init__(self, centroids, list_offsets, list_ids, fingerprint, nprobe=ANN_NPROBE):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.list_offsets = np.asarray(list_offsets, dtype=np.int64)
+        self.list_ids = np.asarray(list_ids, dtype=np.int64)
+        self.fingerprint = int(fingerprint)
+        self.nprobe = min(nprobe, len(self.centroids))
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @classmethod
+    def build(cls, gallery, nlist=None, iterations=ANN_KMEANS_ITERATIONS, nprobe=ANN_NPROBE, seed=0):
+        """
+        Clusters the gallery and builds the inverted lists
+
+        Args:
+            gallery: FaceGallery to index
+            nlist: Number of lists, defaults to about sqrt(N)
+            iterations: k-means iterations
+            nprobe: Number of closest lists scanned per search
+            seed: Random seed, fixed so rebuilds are reproducible
+
+        Returns:
+            IVFIndex: Index over every row of the gallery
+        """
+        encodings = gallery.float_encodings()  # Centroids are trained on float rows whatever the storage dtype
+        if nlist is None:
+            nlist = ANN_NLIST or max(1, int(np.sqrt(len(encodings))))
+        nlist = max(1, min(nlist, len(encodings)))
+        rng = np.random.default_rng(seed)
+
+        # Train on a bounded sample, large galleries do not need every row to place centroids
+        sample_size = min(len(encodings), nlist * ANN_TRAINING_POINTS_PER_LIST)
+        sample = encodings[rng.choice(len(encodings), sample_size, replace=False)]
+        centroids = _kmeans(sample, nlist, iterations, rng)
+
+        index = cls._from_labels(centroids, _assign(encodings, centroids), gallery_fingerprint(gallery), nprobe)
+        logger.info(f"Built IVF index over {len(encodings)} faces with {nlist} lists")
+        return index
+
+    @classmethod
+    def _from_labels(cls, centroids, labels, fingerprint, nprobe):
+        """Builds the CSR inverted lists from the list number of every gallery row"""
+        list_ids = np.argsort(labels, kind="stable")
+        list_offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        list_offsets[1:] = np.cumsum(np.bincount(labels, minlength=len(centroids)))
+        return cls(centroids, list_offsets, list_ids, fingerprint, nprobe)
+
+    def labels(self):
+        """List number of every gallery row, the inverse of the inverted lists"""
+        labels = np.empty(len(self.list_ids), dtype=np.int32)
+        labels[self.list_ids] = np.repeat(np.arange(self.nlist, dtype=np.int32), np.diff(self.list_offsets))
+        return labels
+
+    def remapped(self, old_gallery, new_gallery):
+        """
+        Carries the index over to a changed gallery without re-clustering
+
+        Rows present in both galleries (same name and encoding) keep their list,
+        new rows are assigned to their nearest existing centroid and removed
+        rows drop out. Centroids drift slowly as people are added, so a full
+        rebuild at the next enrollment is still worthwhile.
+
+        Args:
+            old_gallery: Gallery this index was built for
+            new_gallery: Changed gallery
+
+        Returns:
+            IVFIndex: Index over new_gallery
+        """
+        old_labels = self.labels()
+        old_rows = {(name, row.tobytes()): number
+                    for number, (name, row) in enumerate(zip(old_gallery.names, old_gallery.float_encodings()))}
+
+        new_encodings = new_gallery.float_encodings()
+        labels = np.empty(len(new_gallery), dtype=np.int32)
+        added = []
+        for number, (name, row) in enumerate(zip(new_gallery.names, new_encodings)):
+            old_number = old_rows.get((name, row.tobytes()))
+            if old_number is None:
+                added.append(number)
+            else:
+                labels[number] = old_labels[old_number]
+        if added:
+            labels[added] = _assign(new_encodings[added], self.centroids)
+
+        logger.info(f"Remapped IVF index: {len(added)} rows added, "
+                    f"{len(old_gallery) - (len(new_gallery) - len(added))} removed")
+        return IVFIndex._from_labels(self.centroids, labels, gallery_fingerprint(new_gallery), self.nprobe)
+
+    def candidates(self, face_encoding):
+        """
+        Gallery rows stored in the nprobe lists closest to a probe encoding
+
+        Args:
+            face_encoding: Probe encoding of shape (128,)
+
+        Returns:
+            numpy.ndarray: int64 gallery row numbers to re-rank exactly
+        """
+        probe = np.asarray(face_encoding, dtype=np.float32)[None, :]
+        list_distances = _squared_distances(probe, self.centroids)[0]
+        if self.nprobe < self.nlist:
+            probed = np.argpartition(list_distances, self.nprobe - 1)[:self.nprobe]
+        else:
+            probed = np.arange(self.nlist)
+        return np.concatenate([self.list_ids[self.list_offsets[k]:self.list_offsets[k + 1]] for k in probed])
+
+    def save(self, path):
+        """
+        Writes the index next to the gallery as an uncompressed .npz file
+
+        Args:
+            path: Destination file path
+        """
+        temp_path = f"{path}.tmp.npz"
+        np.savez(temp_path, centroids=self.centroids, list_offsets=self.list_offsets,
+                 list_ids=self.list_ids, fingerprint=np.int64(self.fingerprint))
+        os.replace(temp_path, path)
+        logger.info(f"Saved IVF index with {self.nlist} lists to {path}")
+
+    @classmethod
+    def load(cls, path, nprobe=ANN_NPROBE):
+        """
+        Loads an index written by save
+
+        Args:
+            path: Index file path
+            nprobe: Number of closest lists scanned per search
+
+        Returns:
+            IVFIndex: The loaded index
+        """
+        with np.load(path) as data:
+            return cls(data["centroids"], data["list_offsets"], data["list_ids"], int(data["fingerprint"]), nprobe)
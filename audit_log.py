@@ -0,0 +1,351 @@
+"""
+audit_log.py
+
+This script sets up non-blocking logging for the lock. Log calls only put the
+record on a queue; a background writer thread collapses repeated messages
+into counts, writes in batches and rotates sys.log by size and age, so slow
+SD-card writes never stall the detection loop. Security events (unlocks,
+unauthorized faces) are never dropped, deduplicated or sampled, while
+DEBUG chatter is sampled per call site.
+
+Mark a security event with the SECURITY extra:
+    logger.warning("Unauthorized face detected", extra=SECURITY)
+
+Importing this module (or config.py) configures nothing. Every entry point
+calls configure_logging() once at startup:
+    if __name__ == "__main__":
+        configure_logging()
+
+Worker processes never write the file themselves. Whatever the start method,
+they replace any inherited handlers with one that forwards records to the
+parent, which logs them through its own handlers:
+    records, listener = start_worker_log_listener(context)
+    ... in the worker: configure_worker_logging(records, level)
+    listener.stop()
+"""
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+import atexit   # For flushing queued records at exit
+import logging  # For logging events and errors
+import multiprocessing  # For telling worker processes apart from the main process
+import queue    # For handing records to the writer thread
+import re       # For normalizing messages before deduplication
+import threading  # For the writer thread
+import time     # For timing operations
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler  # Worker forwarding, size-based rotation
+from config import (LOG_FILE, LOG_LEVEL, LOG_FORMAT, LOG_DATEFMT, LOG_MAX_BYTES, LOG_BACKUP_COUNT,  # Logging settings
+                    LOG_ROTATE_INTERVAL, LOG_MAX_PENDING, LOG_DEBUG_SAMPLE_EVERY, LOG_DEDUP_WINDOW,
+                    LOG_FLUSH_INTERVAL)
+
+SECURITY = {"security": True}  # Pass as extra= to mark a record as a security event
+
+#------------------------------------------------------------------------------
+# Queue Handler
+#------------------------------------------------------------------------------
+class AuditQueueHandler(logging.Handler):
+    """
+    Handler attached to the root logger, runs on the caller's thread
+
+    It only samples DEBUG records and queues the rest, which costs a dictionary
+    update and a queue put. Once max_pending records are waiting, ordinary
+    records are dropped and counted, security events are always queued.
+
+    Attributes:
+        records: Queue read by the AuditLogWriter
+        dropped: Ordinary records dropped because the writer fell behind
+        sampled_out: DEBUG records skipped by sampling
+    """
+
+    def __init__(self, records, max_pending, debug_sample_every):
+        """
+        Args:
+            records: Queue shared with the writer
+            max_pending: Queued records above which ordinary records are dropped
+            debug_sample_every: Keep one DEBUG record in this many per call site, 1 keeps all
+        """
+        super().__init__()
+        self.records = records
+        self.max_pending = max_pending
+        self.debug_sample_every = max(1, debug_sample_every)
+        self.debug_seen = {}  # (pathname, lineno) -> DEBUG records seen from that call site
+        self.dropped = 0
+        self.sampled_out = 0
+
+    def emit(self, record):
+        try:
+            if not getattr(record, "security", False):
+                if record.levelno <= logging.DEBUG and self.debug_sample_every > 1:
+                    call_site = (record.pathname, record.lineno)
+                    seen = self.debug_seen.get(call_site, 0)
+                    self.debug_seen[call_site] = seen + 1
+                    if seen % self.debug_sample_every:
+                        self.sampled_out += 1
+                        return
+                if self.records.qsize() >= self.max_pending:
+                    self.dropped += 1
+                    return
+            # Format the message now, the arguments may change before the writer gets to it
+            record.msg = record.getMessage()
+            record.args = None
+            self.records.put_nowait(record)
+        except Exception:
+            self.handleError(record)
+
+#------------------------------------------------------------------------------
+# Rotating File Handler
+#------------------------------------------------------------------------------
+class RotatingLogFileHandler(RotatingFileHandler):
+    """
+    File handler rotating by size and by age, flushed only when the writer asks
+
+    StreamHandler flushes after every record; here the writer calls sync()
+    once per batch instead, which turns many small SD-card writes into few.
+    """
+
+    def __init__(self, filename, max_bytes, backup_count, rotate_interval, encoding="utf-8"):
+        """
+        Args:
+            filename: Log file path
+            max_bytes: Rotate once the file would exceed this size, 0 disables size rotation
+            backup_count: Rotated files kept (sys.log.1 ... sys.log.N)
+            rotate_interval: Rotate after this many seconds, 0 disables time rotation
+            encoding: File encoding
+        """
+        super().__init__(filename, mode="a", maxBytes=max_bytes, backupCount=backup_count, encoding=encoding, delay=True)
+        self.rotate_interval = rotate_interval
+        self.rotate_at = time.time() + rotate_interval if rotate_interval else None
+
+    def shouldRollover(self, record):
+        if self.rotate_at is not None and time.time() >= self.rotate_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        if self.rotate_interval:
+            self.rotate_at = time.time() + self.rotate_interval
+
+    def flush(self):
+        pass  # Deferred to sync()
+
+    def sync(self):
+        """Flushes buffered records to the file"""
+        super().flush()
+
+#------------------------------------------------------------------------------
+# Background Writer
+#------------------------------------------------------------------------------
+class AuditLogWriter:
+    """
+    Thread draining the record queue into the file handler
+
+    Ordinary records with the same call site and the same text (numbers
+    ignored) within dedup_window seconds are collapsed: the first is written,
+    the repeats are counted and summarised when the window closes.
+    """
+
+    def __init__(self, records, handler, queue_handler, dedup_window, flush_interval):
+        """
+        Args:
+            records: Queue filled by the AuditQueueHandler
+            handler: RotatingLogFileHandler records are written to
+            queue_handler: AuditQueueHandler, for reporting dropped records
+            dedup_window: Seconds repeats of a message are collapsed for, 0 disables deduplication
+            flush_interval: Maximum seconds between file flushes
+        """
+        self.records = records
+        self.handler = handler
+        self.queue_handler = queue_handler
+        self.dedup_window = dedup_window
+        self.flush_interval = flush_interval
+        self.repeats = {}  # dedup key -> [window start, repeat count, last repeated record]
+        self.reported_drops = 0
+        self.thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+
+    def start(self):
+        """Starts the writer thread"""
+        self.thread.start()
+
+    def stop(self):
+        """Writes everything queued, flushes and stops the writer thread"""
+        self.records.put(None)  # Sentinel, queued behind every pending record
+        self.thread.join(timeout=5)
+        self.handler.close()
+
+    def _run(self):
+        last_flush = time.monotonic()
+        stopping = False
+        while not stopping:
+            try:
+                batch = [self.records.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                batch = []
+            while batch and len(batch) < 512:  # Drain whatever else is waiting into the same batch
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+
+            security = False
+            for record in batch:
+                if record is None:
+                    stopping = True
+                    continue
+                security = security or getattr(record, "security", False)
+                self._write(record)
+
+            now = time.monotonic()
+            self._close_repeat_windows(now, force=stopping)
+            self._report_drops()
+            # Security events reach the card right away, everything else once per interval
+            if security or stopping or now - last_flush >= self.flush_interval:
+                self._sync()
+                last_flush = now
+
+    def _write(self, record):
+        """Writes a record unless it repeats a recent ordinary record"""
+        if self.dedup_window and not getattr(record, "security", False):
+            key = (record.pathname, record.lineno, _normalize(record.msg))
+            repeat = self.repeats.get(key)
+            if repeat is not None:
+                repeat[1] += 1
+                repeat[2] = record
+                return
+            self.repeats[key] = [time.monotonic(), 0, None]
+        self._emit(record)
+
+    def _close_repeat_windows(self, now, force=False):
+        """Writes a summary for every expired window that saw repeats"""
+        for key, (started, count, last_record) in list(self.repeats.items()):
+            if force or now - started >= self.dedup_window:
+                del self.repeats[key]
+                if count:
+                    last_record.msg = f"{last_record.msg} (repeated {count} times in {now - started:.0f}s)"
+                    self._emit(last_record)
+
+    def _report_drops(self):
+        dropped = self.queue_handler.dropped
+        if dropped > self.reported_drops:
+            record = logging.LogRecord(__name__, logging.WARNING, __file__, 0,
+                                       f"Log queue full, dropped {dropped - self.reported_drops} records", None, None)
+            self.reported_drops = dropped
+            self._emit(record)
+
+    def _emit(self, record):
+        try:
+            self.handler.handle(record)
+        except Exception:
+            self.handler.handleError(record)
+
+    def _sync(self):
+        try:
+            self.handler.sync()
+        except Exception:
+            pass  # A failing card must not kill the writer, the next flush retries
+
+
+def _normalize(message):
+    """Message text with numbers masked, so "distance 0.41" and "distance 0.43" collapse"""
+    return re.sub(r"\d+(\.\d+)?", "#", message)
+
+#------------------------------------------------------------------------------
+# Setup
+#------------------------------------------------------------------------------
+_writer = None
+
+
+def configure_logging(filename=LOG_FILE, level=LOG_LEVEL, format=LOG_FORMAT, datefmt=LOG_DATEFMT,
+                      max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT, rotate_interval=LOG_ROTATE_INTERVAL,
+                      max_pending=LOG_MAX_PENDING, debug_sample_every=LOG_DEBUG_SAMPLE_EVERY,
+                      dedup_window=LOG_DEDUP_WINDOW, flush_interval=LOG_FLUSH_INTERVAL):
+    """
+    Installs the queue handler on the root logger and starts the writer
+
+    Called by entry points only, defaults come from config.py. Like
+    logging.basicConfig this does nothing if the root logger already has
+    handlers, so tools that set up their own logging keep it. Child
+    processes never start a writer of their own, only the main process
+    writes the log file.
+
+    Args:
+        filename: Log file path
+        level: Root logger level
+        format: "{"-style record format
+        datefmt: Timestamp format
+        max_bytes: Size rotation threshold in bytes
+        backup_count: Rotated files kept
+        rotate_interval: Time rotation interval in seconds
+        max_pending: Queued records above which ordinary records are dropped
+        debug_sample_every: Keep one DEBUG record in this many per call site
+        dedup_window: Seconds repeats of a message are collapsed for
+        flush_interval: Maximum seconds between file flushes
+    """
+    global _writer
+    root = logging.getLogger()
+    if root.handlers or multiprocessing.parent_process() is not None:
+        return
+
+    file_handler = RotatingLogFileHandler(filename, max_bytes, backup_count, rotate_interval)
+    file_handler.setFormatter(logging.Formatter(format, datefmt, style="{"))
+    records = queue.Queue()  # Unbounded so security events always fit, ordinary records are capped by the handler
+    queue_handler = AuditQueueHandler(records, max_pending, debug_sample_every)
+
+    _writer = AuditLogWriter(records, file_handler, queue_handler, dedup_window, flush_interval)
+    _writer.start()
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """Writes every queued record and stops the writer, registered to run at exit"""
+    global _writer
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
+
+#------------------------------------------------------------------------------
+# Worker Processes
+#------------------------------------------------------------------------------
+class _ParentLoggerHandler(logging.Handler):
+    """Hands a record from a worker to the parent's logger of the same name"""
+
+    def emit(self, record):
+        logging.getLogger(record.name).handle(record)
+
+
+def start_worker_log_listener(context):
+    """
+    Starts a thread logging the records worker processes send to the parent
+
+    Args:
+        context: multiprocessing context the workers are started with
+
+    Returns:
+        tuple: (queue to pass to configure_worker_logging, QueueListener to stop once the workers exit)
+    """
+    records = context.Queue()
+    listener = QueueListener(records, _ParentLoggerHandler())
+    listener.start()
+    return records, listener
+
+
+def configure_worker_logging(records, level=logging.INFO):
+    """
+    Sends a worker process's log records to its parent, call first thing in the worker
+
+    A forked worker inherits the parent's queue handler, but not the writer
+    thread behind it, so its records would be lost; a forkserver or spawned
+    worker has no handlers at all. Both are replaced by one queue handler.
+
+    Args:
+        records: Queue from start_worker_log_listener
+        level: Root logger level of the worker, usually the parent's
+    """
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(QueueHandler(records))
+    root.setLevel(level)
@@ -0,0 +1,809 @@
+"""
+benchmark.py
+
+Benchmarks for the Face ID Lock detection, encoding and matching paths.
+
+Every run can write its results as JSON (--output), tagged with the git
+commit, host and settings, so runs before and after a tuning change can be
+compared directly.
+
+Usage:
+    python benchmark.py match [--sizes 1,100,1000,10000,100000] [--queries 500]
+    python benchmark.py detect --frames VIDEO_OR_IMAGE_DIR [--variant scaleFactor=1.1 ...]
+    python benchmark.py verify --frames VIDEO_OR_IMAGE_DIR [--gallery-size 1000]
+    python benchmark.py all --frames VIDEO_OR_IMAGE_DIR [--output results.json]
+    python benchmark.py ann [--size 50000] [--queries 500] [--nlist N] [--nprobe 8]
+    python benchmark.py detectors --frames VIDEO_OR_IMAGE_DIR [--backend haar --backend hog --backend dnn]
+    python benchmark.py adaptive --frames VIDEO_OR_IMAGE_DIR [--slowdown 3] [--slow-after 100] [--hot-after N]
+    python benchmark.py encode --frames VIDEO_OR_IMAGE_DIR [--processes 0,1,2,3,4] [--candidates 200]
+    python benchmark.py quantize [--gallery authorized_faces.fidg --probes LABELLED_DIR] [--size 10000]
+"""
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+import argparse  # For command line arguments
+import json     # For machine-readable results
+import os       # For frame paths
+import platform  # For tagging results with the host
+import subprocess  # For tagging results with the git commit
+import time     # For timing operations
+import numpy as np  # For numerical operations
+from audit_log import configure_logging  # For the benchmark's log writer
+from config import *  # Import all configuration variables from config.py
+from gallery import FaceGallery, load_gallery  # Import vectorized gallery of authorized faces
+from ann_index import IVFIndex  # Import IVF approximate nearest neighbour index
+
+#------------------------------------------------------------------------------
+# Synthetic Data
+#------------------------------------------------------------------------------
+def synthetic_gallery(size, seed=0, groups=64):
+    """
+    Generates a gallery of face-like encodings
+
+    Real encodings are not uniform on the sphere, they cluster by appearance.
+    Identities are drawn around a set of group centres so IVF sees realistic
+    structure, scaled so the spread per dimension matches dlib encodings (~0.12).
+
+    Args:
+        size: Number of identities
+        seed: Random seed
+        groups: Number of appearance groups the identities cluster around
+
+    Returns:
+        FaceGallery: Gallery with one encoding per identity named person<i>
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(0.0, 0.09, (groups, ENCODING_SIZE))
+    encodings = centres[rng.integers(0, groups, size)] + rng.normal(0.0, 0.08, (size, ENCODING_SIZE))
+    return FaceGallery(encodings.astype(np.float32), [f"person{i}" for i in range(size)])
+
+
+def synthetic_probes(gallery, count, seed=1, noise=0.025, impostor_ratio=0.2, labels=False):
+    """
+    Generates probe encodings: noisy copies of enrolled faces plus impostors
+
+    Args:
+        gallery: FaceGallery the genuine probes are drawn from
+        count: Number of probes
+        seed: Random seed
+        noise: Per-dimension noise of a genuine probe (0.025 is ~0.28 distance)
+        impostor_ratio: Fraction of probes that are not enrolled
+        labels: Also return the enrolled name of every probe
+
+    Returns:
+        numpy.ndarray: float32 probes of shape (count, 128), and with labels=True
+        a list of their names (None for impostors)
+    """
+    rng = np.random.default_rng(seed)
+    genuine = int(count * (1.0 - impostor_ratio))
+    rows = rng.integers(0, len(gallery), genuine)
+    probes = gallery.float_encodings(rows) + rng.normal(0.0, noise, (genuine, ENCODING_SIZE))
+    impostors = synthetic_gallery(count - genuine, seed=seed + 1000).encodings
+    probes = np.vstack([probes, impostors]).astype(np.float32)
+    if labels:
+        return probes, list(gallery.names[rows]) + [None] * (count - genuine)
+    return probes
+
+#------------------------------------------------------------------------------
+# Reporting Helpers
+#------------------------------------------------------------------------------
+def percentiles(samples_ms):
+    """
+    Summarises latency samples
+
+    Args:
+        samples_ms: Sequence of latencies in milliseconds
+
+    Returns:
+        dict: p50/p95/p99 latency in milliseconds and throughput per second
+    """
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    return {
+        "p50_ms": float(np.percentile(samples, 50)),
+        "p95_ms": float(np.percentile(samples, 95)),
+        "p99_ms": float(np.percentile(samples, 99)),
+        "throughput_per_s": float(1000.0 * len(samples) / samples.sum()) if samples.sum() > 0 else float("inf"),
+    }
+
+
+def timed(function, *args):
+    """Runs function(*args) and returns (result, elapsed milliseconds)"""
+    start = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - start) * 1000.0
+
+
+def time_calls(instance, method, samples_ms):
+    """Wraps instance.method so every call appends its elapsed milliseconds to samples_ms"""
+    function = getattr(instance, method)
+
+    def wrapper(*args):
+        result, elapsed = timed(function, *args)
+        samples_ms.append(elapsed)
+        return result
+
+    setattr(instance, method, wrapper)
+
+
+def encode_or_skip(frame, face_location):
+    """Runs faceID.encode_face, None also for a face the encoder pool skipped"""
+    import faceID  # Imported here, only the frame benchmarks need OpenCV
+    try:
+        return faceID.encode_face(frame, face_location)
+    except faceID.EncodeSkipped:
+        return None
+
+#------------------------------------------------------------------------------
+# ANN Benchmark
+#------------------------------------------------------------------------------
+def benchmark_ann(size, queries, nlist=None, nprobe=ANN_NPROBE, seed=0):
+    """
+    Compares IVF matching against brute-force matching on a synthetic gallery
+
+    Args:
+        size: Gallery size
+        queries: Number of probes
+        nlist: IVF list count, None for the default
+        nprobe: Lists scanned per probe
+        seed: Random seed
+
+    Returns:
+        dict: Build time, recall@1, TOLERANCE decision agreement and latency for both paths
+    """
+    brute = synthetic_gallery(size, seed)
+    probes = synthetic_probes(brute, queries, seed + 1)
+
+    index, build_ms = timed(IVFIndex.build, brute, nlist, ANN_KMEANS_ITERATIONS, nprobe, seed)
+    indexed = FaceGallery(brute.encodings, brute.names, brute.norms, brute.scales)
+    indexed.attach_index(index)
+
+    brute_ms, ann_ms = [], []
+    same_identity = same_decision = 0
+    for probe in probes:
+        (brute_name, brute_distance, _), elapsed = timed(brute.match, probe)
+        brute_ms.append(elapsed)
+        (ann_name, ann_distance, _), elapsed = timed(indexed.match, probe)
+        ann_ms.append(elapsed)
+        same_identity += ann_name == brute_name
+        same_decision += (ann_distance <= TOLERANCE) == (brute_distance <= TOLERANCE)
+
+    return {
+        "gallery_size": size,
+        "queries": queries,
+        "nlist": index.nlist,
+        "nprobe": index.nprobe,
+        "build_ms": build_ms,
+        "recall_at_1": same_identity / len(probes),
+        "decision_agreement": same_decision / len(probes),
+        "brute_force": percentiles(brute_ms),
+        "ann": percentiles(ann_ms),
+    }
+
+
+def print_ann_report(result):
+    """Prints the result of benchmark_ann as a short table"""
+    print(f"Gallery {result['gallery_size']}, {result['queries']} probes, "
+          f"nlist {result['nlist']}, nprobe {result['nprobe']}, build {result['build_ms']:.0f} ms")
+    print(f"recall@1 {result['recall_at_1']:.4f}, TOLERANCE decision agreement {result['decision_agreement']:.4f}")
+    for path in ("brute_force", "ann"):
+        stats = result[path]
+        print(f"{path:>12}: p50 {stats['p50_ms']:.3f} ms, p95 {stats['p95_ms']:.3f} ms, "
+              f"p99 {stats['p99_ms']:.3f} ms, {stats['throughput_per_s']:.0f} matches/s")
+
+#------------------------------------------------------------------------------
+# Quantization Report
+#------------------------------------------------------------------------------
+def load_labelled_probes(probes_dir):
+    """
+    Encodes a labelled probe set laid out like known_faces (<name>/<any>.jpg)
+
+    Args:
+        probes_dir: Directory of probe images, folders of people not in the gallery are impostors
+
+    Returns:
+        tuple: (float32 probes of shape (N, 128), list of N folder names)
+    """
+    from encode_faces import find_images, encode_image  # Imported here, only this report encodes images
+    probes, labels = [], []
+    for path, name in find_images(probes_dir).items():
+        encoding = encode_image(os.path.join(probes_dir, path))
+        if encoding is None:
+            print(f"No face detected in {path}. Skipping.")
+            continue
+        probes.append(encoding)
+        labels.append(name)
+    if not probes:
+        raise ValueError(f"No probe faces could be encoded from {probes_dir}")
+    return np.asarray(probes, dtype=np.float32), labels
+
+
+def benchmark_quantization(gallery, probes, labels, dtypes=("float16", "int8")):
+    """
+    Compares quantized galleries against the float32 TOLERANCE decisions
+
+    Every probe is matched against the float32 gallery and against each
+    quantized copy. A decision is the identity accepted at TOLERANCE, or a
+    reject. Changes are counted both against float32 and against the labels.
+
+    Args:
+        gallery: FaceGallery holding the full-precision rows
+        probes: float32 probes of shape (N, 128)
+        labels: Name of every probe, None (or a name not in the gallery) for impostors
+        dtypes: Quantized storage dtypes to evaluate
+
+    Returns:
+        dict: {dtype: decision changes, labelled accept/reject rates, distance error, size and match latency}
+    """
+    reference = gallery.quantized("float32")
+    enrolled = set(reference.names)
+
+    def decide(candidate_gallery):
+        decisions, distances, samples = [], [], []
+        for probe in probes:
+            (name, distance, _), elapsed = timed(candidate_gallery.match, probe)
+            decisions.append(name if distance <= TOLERANCE else None)
+            distances.append(distance)
+            samples.append(elapsed)
+        return decisions, np.asarray(distances), samples
+
+    def labelled_rates(decisions):
+        genuine = [(label, decision) for label, decision in zip(labels, decisions) if label in enrolled]
+        impostor = [decision for label, decision in zip(labels, decisions) if label not in enrolled]
+        return {
+            "true_accept_rate": sum(decision == label for label, decision in genuine) / len(genuine) if genuine else None,
+            "false_accept_rate": sum(decision is not None for decision in impostor) / len(impostor) if impostor else None,
+        }
+
+    reference_decisions, reference_distances, reference_ms = decide(reference)
+    results = {"float32": dict(labelled_rates(reference_decisions), bytes=reference.nbytes(), match=percentiles(reference_ms))}
+    for dtype in dtypes:
+        decisions, distances, samples = decide(reference.quantized(dtype))
+        pairs = list(zip(reference_decisions, decisions))
+        results[dtype] = dict(
+            labelled_rates(decisions),
+            accept_to_reject=sum(before is not None and after is None for before, after in pairs),
+            reject_to_accept=sum(before is None and after is not None for before, after in pairs),
+            identity_changed=sum(None not in (before, after) and before != after for before, after in pairs),
+            decision_agreement=sum(before == after for before, after in pairs) / len(pairs),
+            max_distance_error=float(np.max(np.abs(distances - reference_distances))),
+            bytes=reference.quantized(dtype).nbytes(),
+            match=percentiles(samples),
+        )
+    return results
+
+
+def print_quantization_report(results, probe_count):
+    """Prints the result of benchmark_quantization as a short table"""
+    print(f"Quantized galleries against float32 at TOLERANCE {TOLERANCE} ({probe_count} probes):")
+    for dtype, result in results.items():
+        rates = ", ".join(f"{key.replace('_', ' ')} {value:.4f}" for key, value in result.items()
+                          if key.endswith("_rate") and value is not None)
+        changes = ""
+        if "decision_agreement" in result:
+            changes = (f", agreement {result['decision_agreement']:.4f} ({result['accept_to_reject']} accept->reject, "
+                       f"{result['reject_to_accept']} reject->accept, {result['identity_changed']} identity changed), "
+                       f"max distance error {result['max_distance_error']:.5f}")
+        print(f"{dtype:>8}: {result['bytes'] / 1024:.0f} KiB, match p50 {result['match']['p50_ms']:.3f} ms, {rates}{changes}")
+
+#------------------------------------------------------------------------------
+# Replay Frames
+#------------------------------------------------------------------------------
+def load_frames(path, max_frames):
+    """
+    Loads a fixed set of frames into memory so every run sees identical input
+
+    Args:
+        path: Video file or image directory
+        max_frames: Upper bound on frames loaded
+
+    Returns:
+        list: BGR frames
+    """
+    from frame_source import open_frame_source  # Imported here, only the frame benchmarks need OpenCV replay
+    source = open_frame_source({"type": "images" if os.path.isdir(path) else "video", "path": path, "realtime": False})
+    frames = []
+    try:
+        while len(frames) < max_frames:
+            frame = source.read()
+            if frame is None:
+                break
+            frames.append(frame)
+    finally:
+        source.close()
+    if not frames:
+        raise ValueError(f"No frames could be read from {path}")
+    return frames
+
+
+def parse_variant(text):
+    """
+    Parses a --variant argument such as "scaleFactor=1.1,minSize=80x80,scale=0.5"
+
+    Returns:
+        tuple: (cascade_classifier_config overrides, detection scale or None)
+    """
+    overrides, scale = {}, None
+    for item in filter(None, text.split(",")):
+        key, value = item.split("=", 1)
+        if key == "scale":
+            scale = float(value)
+        elif "x" in value:
+            overrides[key] = tuple(int(size) for size in value.split("x"))
+        else:
+            overrides[key] = float(value) if "." in value else int(value)
+    return overrides, scale
+
+#------------------------------------------------------------------------------
+# Match Benchmark
+#------------------------------------------------------------------------------
+def benchmark_match(sizes, queries, seed=0):
+    """
+    Times the gallery match step alone on synthetic galleries
+
+    Args:
+        sizes: Gallery sizes to measure
+        queries: Probes per size
+        seed: Random seed
+
+    Returns:
+        dict: {gallery size: latency/throughput summary}
+    """
+    results = {}
+    for size in sizes:
+        gallery = synthetic_gallery(size, seed)
+        probes = synthetic_probes(gallery, queries, seed + 1)
+        gallery.match(probes[0])  # Warm up caches before timing
+        samples = [timed(gallery.match, probe)[1] for probe in probes]
+        results[str(size)] = percentiles(samples)
+    return results
+
+#------------------------------------------------------------------------------
+# Detection Benchmark
+#------------------------------------------------------------------------------
+def benchmark_detect(frames, variants, repeat=1, min_iou=0.4):
+    """
+    Times the detection step over the replay frames for several cascade settings
+
+    The step is faceID.detect_faces as the lock runs it: downscaling, gray
+    conversion and detectMultiScale. detectMultiScale alone is reported under
+    "detector", so the cost of the conversions shows as the difference.
+
+    Recall is measured against the faces the default cascade settings find on
+    the full-resolution frames: a reference face counts as found when a
+    variant returns a box overlapping it by at least min_iou, so a detection
+    scale or setting that loses small faces shows up as recall below 1.0.
+
+    Args:
+        frames: Replay frames
+        variants: {label: (cascade_classifier_config overrides, detection scale or None)}
+        repeat: Passes over the frames per variant
+        min_iou: Overlap a box needs with a reference face to count it as found
+
+    Returns:
+        dict: {label: detection step latency/throughput summary, the detectMultiScale
+        summary, faces-per-frame counts and recall}
+    """
+    import faceID  # Imported here, only the frame benchmarks need OpenCV
+    from detectors import HaarDetector, detection_scale  # The variants are cascade settings
+    from tracking import box_iou  # For matching variant boxes to the reference faces
+
+    reference_detector = HaarDetector(settings=dict(cascade_classifier_config))
+    reference = [faceID.detect_faces(reference_detector, frame, 1.0) for frame in frames]
+
+    results = {}
+    for label, (overrides, scale) in variants.items():
+        settings = dict(cascade_classifier_config, **overrides)  # A copy, the shared config stays untouched
+        face_detector = HaarDetector(settings=settings)
+        scale = detection_scale(face_detector, DETECTION_SCALE if scale is None else scale)
+        samples, detector_samples, single_face_frames, found = [], [], 0, 0
+        time_calls(face_detector, "detect", detector_samples)
+        for _ in range(repeat):
+            for frame, reference_faces in zip(frames, reference):
+                faces, elapsed = timed(faceID.detect_faces, face_detector, frame, scale)
+                samples.append(elapsed)
+                single_face_frames += len(faces) == 1
+                found += sum(any(box_iou(tuple(face), tuple(box)) >= min_iou for box in faces)
+                             for face in reference_faces)
+        reference_faces = repeat * sum(len(faces) for faces in reference)
+        results[label] = dict(percentiles(samples), single_face_rate=single_face_frames / len(samples),
+                              recall=found / reference_faces if reference_faces else None,
+                              reference_faces=reference_faces,
+                              detector=percentiles(detector_samples) if detector_samples else {},
+                              config=dict(settings, scale=scale))
+    return results
+
+#------------------------------------------------------------------------------
+# Verification Benchmark
+#------------------------------------------------------------------------------
+def benchmark_verify(frames, gallery_size, seed=0):
+    """
+    Times verify_face end-to-end (crop, encode, match) on every replay frame
+    with exactly one detected face, against a synthetic gallery
+
+    Args:
+        frames: Replay frames
+        gallery_size: Synthetic gallery size
+        seed: Random seed
+
+    Returns:
+        dict: Latency/throughput summary, the number of frames verified and the encode stats
+    """
+    import faceID  # Imported here, only the frame benchmarks need OpenCV
+    from detectors import create_face_detector  # The configured detector backend
+    face_detector = create_face_detector()
+    gallery = synthetic_gallery(gallery_size, seed)
+
+    candidates = []
+    for frame in frames:
+        faces = faceID.detect_faces(face_detector, frame)
+        if len(faces) == 1:
+            candidates.append((frame, faces[0]))
+    if not candidates:
+        return {"frames_verified": 0}
+
+    before = dict(faceID.encoding_stats)
+    samples = [timed(faceID.verify_face, frame, face_location, gallery)[1] for frame, face_location in candidates]
+    stats = {key: faceID.encoding_stats[key] - before[key] for key in before}
+    return dict(percentiles(samples), frames_verified=len(candidates), gallery_size=gallery_size, encoding_stats=stats)
+
+#------------------------------------------------------------------------------
+# Detector Backend Benchmark
+#------------------------------------------------------------------------------
+def benchmark_detectors(frames, backends):
+    """
+    Compares detector backends on the same replay frames
+
+    Every backend is timed through detect_faces at DETECTION_SCALE, then the
+    frames where it found exactly one face are encoded, so a backend that is
+    fast but boxes faces badly shows up as a low encode success rate.
+
+    Args:
+        frames: Replay frames
+        backends: Backend names, see detectors.DETECTOR_BACKENDS
+
+    Returns:
+        dict: {backend: latency/throughput summary, single-face rate and encode
+        success rate, or {"error": ...} if the backend could not be loaded}
+    """
+    import faceID  # Imported here, only the frame benchmarks need OpenCV
+    from detectors import create_face_detector  # Import Haar / HOG / DNN face detector backends
+
+    results = {}
+    for backend in backends:
+        try:
+            face_detector = create_face_detector(backend)
+        except Exception as e:
+            results[backend] = {"error": str(e)}
+            continue
+        faceID.detect_faces(face_detector, frames[0])  # Warm up before timing
+
+        samples, candidates = [], []
+        for frame in frames:
+            faces, elapsed = timed(faceID.detect_faces, face_detector, frame)
+            samples.append(elapsed)
+            if len(faces) == 1:
+                candidates.append((frame, faces[0]))
+
+        encoded = sum(encode_or_skip(frame, face_location) is not None for frame, face_location in candidates)
+        results[backend] = dict(percentiles(samples), single_face_rate=len(candidates) / len(frames),
+                                encode_success_rate=encoded / len(candidates) if candidates else 0.0,
+                                faces_encoded=encoded)
+    return results
+
+#------------------------------------------------------------------------------
+# Latency Controller Benchmark
+#------------------------------------------------------------------------------
+def benchmark_adaptive(frames, passes, target, slowdown, slow_after, hot_after=None):
+    """
+    Replays frames through detection under the latency controller with a
+    simulated slow stage, e.g. a board that starts throttling mid-run
+
+    From frame slow_after on, every detection is stretched to slowdown times
+    its measured duration, so cheaper settings still pay off the way they do
+    on a throttled CPU. From frame hot_after on the controller reads a CPU
+    temperature above CPU_TEMP_LIMIT. The frame interval is reported, not slept.
+
+    Args:
+        frames: Replay frames
+        passes: Passes over the frames
+        target: Latency target in seconds
+        slowdown: Detection time multiplier of the simulated slow stage
+        slow_after: Frame number the slow stage starts at
+        hot_after: Frame number the simulated CPU turns hot at, None never
+
+    Returns:
+        dict: Latency summaries before the slowdown, right after it and once settled,
+        the final settings and every adjustment made
+    """
+    import faceID  # Imported here, only the frame benchmarks need OpenCV
+    from detectors import create_face_detector, detection_scale  # The configured detector backend
+    from latency_controller import LatencyController, adjustable_settings  # Import adaptive detection settings
+    face_detector = create_face_detector()
+    frame_number = 0
+    controller = LatencyController(target=target, enabled=True,
+                                   cpu_state=lambda: (CPU_TEMP_LIMIT + 5.0 if hot_after is not None
+                                                      and frame_number >= hot_after else 50.0, None),
+                                   adjustable=adjustable_settings(face_detector),
+                                   detection_scale=detection_scale(face_detector),
+                                   min_scale=detection_scale(face_detector, None))
+
+    latencies, trace = [], []
+    total = passes * len(frames)
+    for frame_number in range(total):
+        frame = frames[frame_number % len(frames)]
+        started = time.perf_counter()
+        faceID.detect_faces(face_detector, frame, controller.detection_scale, controller.scale_factor)
+        if frame_number >= slow_after:
+            busy_until = started + (time.perf_counter() - started) * slowdown
+            while time.perf_counter() < busy_until:  # Simulated slow stage keeps the CPU busy like throttling
+                pass
+        latency = time.perf_counter() - started
+        latencies.append(latency * 1000.0)
+        if controller.observe(latency):
+            trace.append(dict(frame=frame_number, **controller.settings()))
+
+    settle_window = max(controller.window, total // 5)
+    return {
+        "target_ms": target * 1000.0,
+        "before_slowdown": percentiles(latencies[:slow_after]) if slow_after else {},
+        "after_slowdown": percentiles(latencies[slow_after:slow_after + settle_window]) if slow_after < total else {},
+        "settled": percentiles(latencies[-settle_window:]),
+        "final_settings": controller.settings(),
+        "adjustments": [{"setting": setting, "old": old, "new": new, "reason": reason}
+                        for _, setting, old, new, reason in controller.history],
+        "trace": trace,
+    }
+
+
+def print_adaptive_report(results):
+    """Prints the benchmark_adaptive phases and adjustments"""
+    phases = {phase: results[phase] for phase in ("before_slowdown", "after_slowdown", "settled") if results[phase]}
+    print_latency_table(f"Latency controller, target {results['target_ms']:.1f} ms:", phases)
+    for adjustment in results["adjustments"]:
+        print(f"  {adjustment['setting']:>16}: {adjustment['old']:.3g} -> {adjustment['new']:.3g}, "
+              f"{adjustment['reason']}")
+    settings = results["final_settings"].items()
+    print("  final settings: " + ", ".join(f"{setting} {value:.3g}" for setting, value in settings))
+
+#------------------------------------------------------------------------------
+# Encoder Pool Benchmark
+#------------------------------------------------------------------------------
+def encode_candidates(frames, count):
+    """
+    Picks the faces the encode benchmark encodes
+
+    Frames where the detector finds no face use a centred box instead, so the
+    timing still exercises the landmark and encoding models.
+
+    Returns:
+        list: count (frame, (x, y, w, h)) pairs, cycling through the frames
+    """
+    import faceID  # Imported here, only the frame benchmarks need OpenCV
+    from detectors import create_face_detector  # The configured detector backend
+    face_detector = create_face_detector()
+    faces = []
+    for frame in frames:
+        detected = faceID.detect_faces(face_detector, frame)
+        if len(detected):
+            faces.append((frame, tuple(detected[0])))
+        else:
+            height, width = frame.shape[:2]
+            size = min(height, width) // 2
+            faces.append((frame, ((width - size) // 2, (height - size) // 2, size, size)))
+    return [faces[number % len(faces)] for number in range(count)]
+
+
+def benchmark_encode(frames, process_counts, count):
+    """
+    Times encode_face throughput in this process and with encoder pools of several sizes
+
+    Each run submits the same faces from as many threads as the pool has
+    slots, like the pipeline's encode workers do.
+
+    Args:
+        frames: Replay frames
+        process_counts: Pool sizes to measure, 0 encodes on one thread in this process
+        count: Faces encoded per run
+
+    Returns:
+        dict: {"<n> processes": latency/throughput summary with the speedup over one process}
+    """
+    from concurrent.futures import ThreadPoolExecutor  # For submitting like the encode workers
+    import faceID  # Imported here, only the frame benchmarks need OpenCV
+    from encoder_pool import EncoderPool  # Import multi-process face encoding
+    candidates = encode_candidates(frames, count)
+
+    results = {}
+    for processes in process_counts:
+        pool = None
+        if processes:
+            pool = EncoderPool(processes)
+            if not pool.start():
+                pool.stop()
+                raise RuntimeError(f"Encoder pool with {processes} processes did not start")
+        else:
+            faceID.warm_up_encoder()
+        faceID.set_encoder_pool(pool)
+        before = dict(faceID.encoding_stats)
+        try:
+            with ThreadPoolExecutor(max_workers=faceID.encode_worker_count() if pool else 1) as executor:
+                started = time.perf_counter()
+                samples = list(executor.map(lambda face: timed(encode_or_skip, *face)[1], candidates))
+                elapsed = time.perf_counter() - started
+        finally:
+            faceID.set_encoder_pool(None)
+            if pool is not None:
+                pool.stop()
+        stats = dict(percentiles(samples), throughput_per_s=len(samples) / elapsed, processes=processes,
+                     encodings=faceID.encoding_stats["encodings"] - before["encodings"],
+                     skipped_busy=pool.busy if pool else 0)
+        results[f"{processes} processes" if processes else "in-process"] = stats
+
+    one_process = results.get("1 processes")
+    if one_process:
+        for stats in results.values():
+            stats["speedup"] = stats["throughput_per_s"] / one_process["throughput_per_s"]
+    return results
+
+#------------------------------------------------------------------------------
+# Reporting
+#------------------------------------------------------------------------------
+def run_metadata():
+    """Identifies the code and machine a benchmark ran on"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "host": platform.node(),
+        "machine": platform.machine(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+    }
+
+
+def print_latency_table(title, results):
+    """Prints {label: percentiles()} results as a short table"""
+    print(title)
+    for label, stats in results.items():
+        if "p50_ms" not in stats:
+            print(f"{label:>24}: {stats.get('error', 'no samples')}")
+            continue
+        extra = f", single-face rate {stats['single_face_rate']:.2f}" if "single_face_rate" in stats else ""
+        extra += f", encode success {stats['encode_success_rate']:.2f}" if "encode_success_rate" in stats else ""
+        extra += f", speedup {stats['speedup']:.2f}x" if "speedup" in stats else ""
+        extra += f", recall {stats['recall']:.2f}" if stats.get("recall") is not None else ""
+        extra += f", detectMultiScale p50 {stats['detector']['p50_ms']:.3f} ms" if stats.get("detector") else ""
+        print(f"{label:>24}: p50 {stats['p50_ms']:.3f} ms, p95 {stats['p95_ms']:.3f} ms, "
+              f"p99 {stats['p99_ms']:.3f} ms, {stats['throughput_per_s']:.1f}/s{extra}")
+
+#------------------------------------------------------------------------------
+# Command Line
+#------------------------------------------------------------------------------
+DEFAULT_DETECT_VARIANTS = ["", "scale=1.0", "scaleFactor=1.1", "scaleFactor=1.3", "minNeighbors=4", "scale=0.5"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Face ID Lock benchmarks")
+    parser.add_argument("--output", help="Write machine-readable results to this JSON file")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    match = commands.add_parser("match", help="Gallery match step alone on synthetic galleries")
+    match.add_argument("--sizes", default="1,100,1000,10000,100000", help="Comma-separated gallery sizes")
+    match.add_argument("--queries", type=int, default=500, help="Probes per gallery size")
+
+    for name, help_text in (("detect", "Detection step under cascade_classifier_config variants"),
+                            ("verify", "verify_face end-to-end on replayed frames"),
+                            ("all", "match, detect and verify")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument("--frames", required=True, help="Video file or image directory to replay")
+        command.add_argument("--max-frames", type=int, default=200, help="Frames loaded from the replay")
+        command.add_argument("--variant", action="append", help="Detection variant, e.g. scaleFactor=1.1,scale=0.5 "
+                                                                "(repeatable, default: a built-in sweep)")
+        command.add_argument("--repeat", type=int, default=1, help="Passes over the frames per detection variant")
+        command.add_argument("--gallery-size", type=int, default=1000, help="Synthetic gallery size for verify")
+        command.add_argument("--sizes", default="1,100,1000,10000,100000", help="Gallery sizes for match (all only)")
+        command.add_argument("--queries", type=int, default=500, help="Probes per gallery size (all only)")
+
+    ann = commands.add_parser("ann", help="IVF index recall/latency against brute-force matching")
+    ann.add_argument("--size", type=int, default=50000, help="Synthetic gallery size")
+    ann.add_argument("--queries", type=int, default=500, help="Number of probes")
+    ann.add_argument("--nlist", type=int, default=None, help="IVF list count (default about sqrt(size))")
+    ann.add_argument("--nprobe", type=int, default=ANN_NPROBE, help="Lists scanned per probe")
+
+    detectors = commands.add_parser("detectors", help="Detector backend latency and downstream encode success")
+    detectors.add_argument("--frames", required=True, help="Video file or image directory to replay")
+    detectors.add_argument("--max-frames", type=int, default=200, help="Frames loaded from the replay")
+    detectors.add_argument("--backend", action="append", choices=("haar", "hog", "dnn"),
+                           help="Backend to compare (repeatable, default: all)")
+
+    adaptive = commands.add_parser("adaptive", help="Latency controller on replayed frames with a simulated slow stage")
+    adaptive.add_argument("--frames", required=True, help="Video file or image directory to replay")
+    adaptive.add_argument("--max-frames", type=int, default=200, help="Frames loaded from the replay")
+    adaptive.add_argument("--passes", type=int, default=3, help="Passes over the frames")
+    adaptive.add_argument("--target", type=float, default=LATENCY_TARGET, help="Latency target in seconds")
+    adaptive.add_argument("--slowdown", type=float, default=3.0, help="Detection time multiplier of the slow stage")
+    adaptive.add_argument("--slow-after", type=int, default=100, help="Frame the slow stage starts at")
+    adaptive.add_argument("--hot-after", type=int, default=None, help="Frame the simulated CPU turns hot at")
+
+    encode = commands.add_parser("encode", help="encode_face throughput in this process and in encoder pools")
+    encode.add_argument("--frames", required=True, help="Video file or image directory to replay")
+    encode.add_argument("--max-frames", type=int, default=200, help="Frames loaded from the replay")
+    encode.add_argument("--processes", default="0,1,2,3,4", help="Comma-separated pool sizes, 0 encodes in this process")
+    encode.add_argument("--candidates", type=int, default=200, help="Faces encoded per pool size")
+
+    quantize = commands.add_parser("quantize", help="float16/int8 gallery decisions against float32 at TOLERANCE")
+    quantize.add_argument("--gallery", help="Binary or JSON gallery to quantize (default: a synthetic gallery)")
+    quantize.add_argument("--probes", help="Labelled probe images, <name>/<any>.jpg (default: synthetic probes)")
+    quantize.add_argument("--size", type=int, default=10000, help="Synthetic gallery size")
+    quantize.add_argument("--queries", type=int, default=2000, help="Synthetic probe count")
+
+    args = parser.parse_args()
+    results = {}
+
+    if args.command == "ann":
+        results["ann"] = benchmark_ann(args.size, args.queries, args.nlist, args.nprobe, args.seed)
+        print_ann_report(results["ann"])
+
+    if args.command == "quantize":
+        if args.gallery and args.gallery.endswith(".json"):
+            with open(args.gallery, "r") as json_file:
+                gallery = FaceGallery.from_dict(json.load(json_file))
+        elif args.gallery:
+            gallery = load_gallery(args.gallery)
+        else:
+            gallery = synthetic_gallery(args.size, args.seed)
+        if args.probes:
+            probes, labels = load_labelled_probes(args.probes)
+        else:
+            probes, labels = synthetic_probes(gallery, args.queries, args.seed + 1, labels=True)
+        results["quantize"] = benchmark_quantization(gallery, probes, labels)
+        print_quantization_report(results["quantize"], len(probes))
+
+    if args.command in ("match", "all"):
+        sizes = [int(size) for size in args.sizes.split(",")]
+        results["match"] = benchmark_match(sizes, args.queries, args.seed)
+        print_latency_table("Match step by gallery size:", results["match"])
+
+    if args.command in ("detect", "verify", "all", "encode", "detectors", "adaptive"):
+        frames = load_frames(args.frames, args.max_frames)
+        print(f"Loaded {len(frames)} frames of {frames[0].shape[1]}x{frames[0].shape[0]} from {args.frames}")
+
+        if args.command in ("detect", "all"):
+            variants = {text or "baseline": parse_variant(text) for text in (args.variant or DEFAULT_DETECT_VARIANTS)}
+            results["detect"] = benchmark_detect(frames, variants, args.repeat)
+            print_latency_table("Detection step (downscale, gray conversion, detectMultiScale) by variant:",
+                                results["detect"])
+
+        if args.command in ("verify", "all"):
+            results["verify"] = benchmark_verify(frames, args.gallery_size, args.seed)
+            print_latency_table("verify_face end-to-end:", {"verify_face": results["verify"]})
+
+        if args.command == "detectors":
+            results["detectors"] = benchmark_detectors(frames, args.backend or ["haar", "hog", "dnn"])
+            print_latency_table("Detector backends:", results["detectors"])
+
+        if args.command == "adaptive":
+            results["adaptive"] = benchmark_adaptive(frames, args.passes, args.target, args.slowdown,
+                                                     args.slow_after, args.hot_after)
+            print_adaptive_report(results["adaptive"])
+
+        if args.command == "encode":
+            process_counts = [int(count) for count in args.processes.split(",")]
+            results["encode"] = benchmark_encode(frames, process_counts, args.candidates)
+            print_latency_table("encode_face by encoder pool size:", results["encode"])
+
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump({"meta": run_metadata(), "command": vars(args), "results": results}, output_file, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    configure_logging()
+    main()
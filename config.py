@@ -26,7 +26,29 @@ camera_config = {
     "controls": {
         "AfMode": 2,  # Auto focus mode
         "NoiseReductionMode": 2,  # Noise reduction mode to aid in face detection
-    }
+    },
+    # Low-resolution YUV420 stream detection reads its Y plane from, the full-resolution
+    # frame above is copied only for faces that need encoding. None captures full frames only.
+    "lores": {"size": (576, 324)},
+    "held_requests": 3,  # Captures held until detection releases them or fetches the full-resolution frame
+    "hold_timeout": 1.0,  # Seconds capture waits for a held capture to be released before reclaiming the oldest
+    "buffer_count": 6,  # Camera buffers, must exceed held_requests so the sensor never stalls
+}
+
+#------------------------------------------------------------------------------
+# Frame Source - where frames come from (see frame_source.py)
+# - "picamera": the Pi camera, configured with camera_config
+# - "video": a recorded video file at "path"
+# - "images": a directory of still images at "path"
+# Replay sources pace frames in real time unless "realtime" is False, and
+# restart at the end when "loop" is True.
+#------------------------------------------------------------------------------
+frame_source_config = {
+    "type": "picamera",
+    "path": None,
+    "realtime": True,
+    "loop": False,
+    "fps": None,  # Replay frame rate override, None uses the file or camera frame rate
 }
 
 #------------------------------------------------------------------------------
@@ -39,12 +61,138 @@ cascade_classifier_config = {
     "maxSize": (300,300)
 }
 
+#------------------------------------------------------------------------------
+# Face Detector Settings - which backend finds faces (see detectors.py)
+# - "haar": OpenCV Haar cascade with cascade_classifier_config (fastest, most false positives)
+# - "hog": dlib HOG through face_recognition.face_locations (fewer false positives, slower)
+# - "dnn": OpenCV DNN SSD face detector from a local model file
+# minSize/maxSize above bound the face size for every backend.
+# Compare them on recorded frames with: python benchmark.py detectors --frames DIR
+#------------------------------------------------------------------------------
+face_detector_config = {
+    "backend": "haar",
+    "hog": {"upsample": 0},  # Times the image is upsampled, finds smaller faces at a large cost
+    "dnn": {
+        "model": "models/res10_300x300_ssd_iter_140000.caffemodel",  # Local model file, never downloaded
+        "config": "models/deploy.prototxt",  # Network description of the model
+        "confidence": 0.6,  # Minimum detection confidence
+        "input_size": (300, 300),  # Network input width, height
+        "mean": (104.0, 177.0, 123.0),  # BGR mean the model was trained with
+    },
+}
+HAAR_CASCADE_FILE = "haarcascade_frontalface_default.xml"  # In OpenCV's haarcascades directory
+
+# Detection runs on a copy downscaled by this factor, 1.0 detects on the full frame.
+# minSize/maxSize stay in full-resolution pixels (they are scaled with the copy), so a
+# minSize face shrinks to minSize * scale pixels against the detector's smallest face
+# (the 24 px Haar window, 80 px for dlib HOG). Faces right at the window are found
+# unreliably: with minSize 100, scale 0.3 (1.25x the window) missed every pasted face
+# below 109 px and 0.36 (1.5x) still missed one, 0.38 and up missed none of 152.
+# None picks the scale that keeps minSize faces DETECTION_SCALE_MARGIN times above the
+# smallest face: 0.39 for Haar (0.4 measured 211 ms against 310 ms on a noisy 2304x1296
+# frame on one core), 1.0 for HOG. Compare recall with python benchmark.py detect --frames DIR.
+# Dual-stream camera frames are detected on the "lores" stream instead.
+DETECTION_SCALE = None
+DETECTION_SCALE_MARGIN = 1.6  # minSize faces are downscaled to no less than this many times the smallest face
+
+#------------------------------------------------------------------------------
+# Latency Controller Settings - adapt detection to the board at runtime (see latency_controller.py)
+# Over budget the controller raises scaleFactor, then lowers the detection scale,
+# then lengthens the frame interval; a hot or overloaded CPU lengthens the interval.
+# Try it on replayed frames with: python benchmark.py adaptive --frames DIR --slowdown 3
+#------------------------------------------------------------------------------
+LATENCY_CONTROL_ENABLED = True  # False keeps the settings above fixed
+LATENCY_TARGET = 0.15  # p95 seconds from frame capture to detection result
+LATENCY_CONTROL_WINDOW = 10  # Frames observed per decision, one setting moves one step per decision
+LATENCY_HEADROOM = 0.6  # Settings are relaxed only while p95 is below this fraction of the target
+LATENCY_RELAX_WINDOWS = 3  # Consecutive windows under the headroom before a setting is relaxed, avoids flapping
+LATENCY_HISTORY = 256  # Recent adjustments kept for inspection
+FRAME_INTERVAL = 0.1  # Starting seconds between frames of the sequential loop
+FRAME_INTERVAL_BOUNDS = (0.02, 0.5)  # Fastest, slowest frame interval
+FRAME_INTERVAL_STEP = 0.05
+DETECTION_SCALE_BOUNDS = (0.15, 1.0)  # Smallest, largest detection scale; the controller also stays above detectors.detection_scale()
+DETECTION_SCALE_STEP = 0.1
+SCALE_FACTOR_BOUNDS = (1.2, 1.4)  # Finest, coarsest cascade pyramid step
+SCALE_FACTOR_STEP = 0.05
+CPU_TEMP_FILE = "/sys/class/thermal/thermal_zone0/temp"  # Millidegrees Celsius
+CPU_TEMP_LIMIT = 75.0  # Celsius, the Pi starts throttling at 80
+CPU_LOAD_LIMIT = 0.9  # 1-minute load average per core
+
 #------------------------------------------------------------------------------
 # System Parameters
 #------------------------------------------------------------------------------
 MAX_ATTEMPTS = 3
 DOOR_OPEN_TIME = 5
 
+#------------------------------------------------------------------------------
+# Motion Gate Settings - skip detection and idle the camera while nothing moves
+#------------------------------------------------------------------------------
+MOTION_GATE_ENABLED = True  # False runs detection on every frame
+MOTION_THUMBNAIL_SIZE = (64, 36)  # Width, height of the grayscale thumbnail compared between frames
+MOTION_PIXEL_THRESHOLD = 12  # Gray-level change for a thumbnail pixel to count as moving
+MOTION_AREA_THRESHOLD = 0.01  # Fraction of moving thumbnail pixels that counts as motion
+MOTION_BACKGROUND_RATE = 0.05  # Running-average weight of each new frame in the background
+MOTION_IDLE_AFTER = 5.0  # Seconds without motion before going idle
+MOTION_IDLE_FPS = 2  # Camera frame rate while idle
+MOTION_IDLE_INTERVAL = 0.25  # Seconds between motion checks while idle (bounds the wake latency)
+
+#------------------------------------------------------------------------------
+# Pipeline Settings - capture, detect, encode and match on separate threads
+#------------------------------------------------------------------------------
+PIPELINE_ENABLED = True  # False runs the original sequential detection loop
+PIPELINE_DETECT_WORKERS = 1  # Detection threads, each with its own cascade classifier
+PIPELINE_ENCODE_WORKERS = 2  # Encoding threads (dlib releases the GIL while encoding)
+PIPELINE_QUEUE_SIZE = 1  # Items buffered between stages, the oldest is dropped when full
+PIPELINE_MAX_FRAME_AGE = 0.5  # Seconds, older frames are dropped instead of verified
+PIPELINE_POLL_INTERVAL = 0.05  # Seconds a stage waits on its queue before checking for shutdown
+
+#------------------------------------------------------------------------------
+# Encoder Pool Settings - face encoding in worker processes (see encoder_pool.py)
+#------------------------------------------------------------------------------
+ENCODER_PROCESSES = 3  # Encoding processes, 0 encodes on the pipeline threads in this process
+ENCODER_SLOTS_PER_PROCESS = 2  # Shared-memory crop slots per process, one encoding while the next is copied in
+ENCODER_MAX_CROP = (720, 720)  # Width, height of the largest crop a slot holds, larger crops are downscaled
+ENCODER_START_METHOD = "forkserver"  # Workers start from a clean interpreter, not a fork of the camera threads
+ENCODER_SUBMIT_TIMEOUT = 0.05  # Seconds to wait for a free slot before the face is skipped
+ENCODER_RESULT_TIMEOUT = 2.0  # Seconds to wait for a worker's result
+ENCODER_START_TIMEOUT = 60.0  # Seconds startup waits for every worker to load its models
+
+#------------------------------------------------------------------------------
+# Face Tracking Settings - reuse a verified identity while the same face stays in view
+#------------------------------------------------------------------------------
+TRACK_MIN_IOU = 0.3  # Minimum box overlap for a detection to continue a track
+TRACK_MAX_CENTROID_SHIFT = 0.5  # Fallback match: max centre movement, in box sizes, between frames
+TRACK_MAX_AGE = 1.0  # Seconds a track survives without a detection before it is evicted
+TRACK_MAX_TRACKS = 16  # Upper bound on tracks held at once, the least recently seen is evicted
+TRACK_IDENTITY_TTL = 2.0  # Seconds a verified identity is reused before the track is re-verified
+TRACK_REJECT_TTL = 0.5  # Seconds a rejected face waits before it is re-verified
+TRACK_REVERIFY_IOU = 0.5  # Re-verify early when the box overlaps the verified box less than this
+TRACK_PENDING_TIMEOUT = 0.5  # Seconds to wait for an in-flight verification of a track before starting another
+
+#------------------------------------------------------------------------------
+# Metrics Settings - per-stage latency and event counters (see metrics.py)
+#------------------------------------------------------------------------------
+METRICS_ENABLED = True  # False turns every timer and counter into a no-op
+METRICS_LABELS = {"door": "front"}  # Labels added to every exported series, set per door
+METRICS_COUNTERS = ("frames", "detections", "rejects", "unlocks", "unlock_failures")  # Always exported, even at zero
+METRICS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)  # Histogram bounds in seconds
+METRICS_WINDOW = 512  # Recent samples per stage kept for the rolling p50/p95/p99
+METRICS_HOST = "127.0.0.1"  # Endpoint address, localhost only
+METRICS_PORT = 9108  # Prometheus-text endpoint at http://127.0.0.1:9108/metrics, None disables it
+METRICS_STATS_FILE = None  # JSON stats file flushed periodically, e.g. "stats.json", None disables it
+METRICS_FLUSH_INTERVAL = 10.0  # Seconds between stats file flushes
+
+#------------------------------------------------------------------------------
+# Access Event Settings - indexed store of verification outcomes (see access_events.py)
+# Query it with: python access_events.py --identity NAME --door DOOR --since 7d
+#------------------------------------------------------------------------------
+ACCESS_EVENTS_ENABLED = True  # Record every verification outcome
+ACCESS_EVENT_DB = "access_events.db"  # SQLite database file
+ACCESS_EVENT_BATCH_SIZE = 200  # Events inserted per transaction at most
+ACCESS_EVENT_FLUSH_INTERVAL = 2.0  # Seconds events are gathered before they are written
+ACCESS_EVENT_RETENTION_DAYS = 365  # Events older than this are deleted, 0 keeps everything
+ACCESS_EVENT_RETENTION_INTERVAL = 6 * 60 * 60  # Seconds between retention passes
+
 #------------------------------------------------------------------------------
 # Logging Settings
 # Configure logging for:
@@ -53,21 +201,59 @@ DOOR_OPEN_TIME = 5
 # - Troubleshooting/debugging/exceptions
 # - System status
 #------------------------------------------------------------------------------
-logging.basicConfig(
-    filename="sys.log",    # Log file module
-    encoding="utf-8",
-    filemode="a",          # Append mode
-    format="{asctime} - {levelname} - {message}",
-    style="{",
-    datefmt="%Y-%m-%d %H:%M",
-    level=logging.DEBUG    # Capture all levels (DEBUG, INFO, WARNING, ERROR, CRITICAL)
-)
+LOG_FILE = "sys.log"
+LOG_LEVEL = logging.DEBUG  # Capture all levels (DEBUG, INFO, WARNING, ERROR, CRITICAL)
+LOG_FORMAT = "{asctime} - {levelname} - {message}"
+LOG_DATEFMT = "%Y-%m-%d %H:%M"
+LOG_MAX_BYTES = 5 * 1024 * 1024  # Rotate sys.log at this size
+LOG_BACKUP_COUNT = 5  # Rotated files kept (sys.log.1 ... sys.log.5)
+LOG_ROTATE_INTERVAL = 24 * 60 * 60  # Also rotate after this many seconds, 0 rotates by size only
+LOG_MAX_PENDING = 10000  # Queued records above which non-security records are dropped
+LOG_DEBUG_SAMPLE_EVERY = 20  # Keep one DEBUG record in this many from each call site
+LOG_DEDUP_WINDOW = 10.0  # Seconds repeats of a message are collapsed into one count
+LOG_FLUSH_INTERVAL = 5.0  # Seconds between log file flushes (security events flush immediately)
+# Records are queued and written by a background thread, see audit_log.py. Entry points
+# (main.py and the command line tools) call audit_log.configure_logging(), importing
+# this module does not, so library imports and worker processes start no log writer.
 
 
 #------------------------------------------------------------------------------
 # Face Recognition Settings
 #------------------------------------------------------------------------------
 TOLERANCE = 0.5
+ENCODING_SIZE = 128  # Length of a face_recognition face encoding vector
+AUTHORIZED_FACES_JSON = "authorized_faces.json"  # Legacy JSON gallery, the binary gallery is rebuilt from it when it is newer
+GALLERY_FILE = "authorized_faces.fidg"  # Binary, memory-mapped gallery written by encode_faces.py (not committed, it is built)
+# Row storage written by encode_faces.py/gallery.py: "float32", "float16" or "int8" (scale per row).
+# int8 is a quarter of the size and the fastest to match; float16 halves the size but is only
+# faster where NumPy converts half floats in hardware (ARM). Check with: python benchmark.py quantize
+GALLERY_DTYPE = "float32"
+GALLERY_BLOCK_ROWS = 1024  # Quantized rows converted per block when matching, sized to stay in L2 cache
+GALLERY_RELOAD_ENABLED = True  # Watch the gallery file and hot-swap changes without a restart
+GALLERY_RELOAD_INTERVAL = 2.0  # Seconds between checks of the gallery file
+SINGLE_DETECTION_ENCODING = True  # Encode from the cascade box instead of re-detecting the face with dlib HOG
+ENCODE_BOX_PADDING = 0.0  # Fraction of the cascade box added on every side before encoding (negative shrinks)
+ENCODE_CROP_CONTEXT = 0.25  # Extra margin cropped around the box so dlib's aligned face chip stays in frame
+
+#------------------------------------------------------------------------------
+# Enrollment Settings (encode_faces.py)
+#------------------------------------------------------------------------------
+KNOWN_FACES_DIR = "known_faces"  # known_faces/<name>.jpg or known_faces/<name>/<any>.jpg
+ENROLLMENT_MANIFEST = "enrollment_manifest.json"  # Image hashes and gallery rows from the last enrollment
+ENROLL_WORKERS = None  # Encoding processes, None uses every core
+ENROLL_PROGRESS_EVERY = 50  # Print progress and throughput every this many images
+ENROLL_WRITE_JSON = True  # Also rewrite AUTHORIZED_FACES_JSON for tools that read it (one image per person only)
+
+#------------------------------------------------------------------------------
+# Approximate Nearest Neighbour Index Settings (large enrollments)
+#------------------------------------------------------------------------------
+ANN_ENABLED = True  # Use the IVF index when one exists next to the gallery
+ANN_INDEX_FILE = "authorized_faces.ivf.npz"  # IVF index built by encode_faces.py
+ANN_MIN_GALLERY_SIZE = 5000  # Galleries smaller than this are brute-forced, no index is built
+ANN_NLIST = None  # Number of inverted lists, None picks about sqrt(gallery size)
+ANN_NPROBE = 8  # Number of closest lists scanned per match
+ANN_KMEANS_ITERATIONS = 20  # k-means iterations when building the index
+ANN_TRAINING_POINTS_PER_LIST = 256  # k-means training sample size per list
 
 
 #------------------------------------------------------------------------------
@@ -75,4 +261,23 @@ TOLERANCE = 0.5
 #------------------------------------------------------------------------------
 SERIAL_PORT = "/dev/ttyUSB0"  # Default USB serial port for communication with Arduino/microcontroller
 BAUD_RATE = 9600  # Communication speed for serial connection with Arduino/microcontroller
+SERIAL_READ_TIMEOUT = 0.05  # Seconds a single read waits, bounds how quickly the worker notices shutdown
+SERIAL_ACK_TIMEOUT = 1.0  # Seconds the device has to acknowledge a command or heartbeat
+SERIAL_COMMAND_TIMEOUT = 3.0  # Seconds unlock_door waits in total, including reconnect attempts
+SERIAL_HEARTBEAT_INTERVAL = 5.0  # Seconds of idle link between PING heartbeats
+SERIAL_RECONNECT_MIN_DELAY = 0.5  # First reconnect delay in seconds, doubled after every failure
+SERIAL_RECONNECT_MAX_DELAY = 30.0  # Upper bound on the reconnect delay
+SERIAL_STARTUP_WAIT = 3.0  # Seconds startup waits for the door controller before carrying on without it
+
+#------------------------------------------------------------------------------
+# Doors - camera/lock pairs served by this process (see multi_door.py)
+# With one entry main.py runs the single-door loop. With several, every door
+# gets its own detection loop and serial worker while the gallery and the
+# PIPELINE_ENCODE_WORKERS encoding threads are shared.
+# "camera" picks the Pi camera for "picamera" sources on multi-camera boards.
+#------------------------------------------------------------------------------
+doors = [
+    {"name": "front", "source": frame_source_config, "serial_port": SERIAL_PORT},
+    # {"name": "back", "source": dict(frame_source_config, camera=1), "serial_port": "/dev/ttyUSB1"},
+]
 
@@ -0,0 +1,238 @@
+"""
+detectors.py
+
+This script provides the face detector backends. Every backend finds faces in
+an image prepared by faceID.detect_faces (grayscale, or BGR for backends that
+need color) and returns (x, y, w, h) boxes in that image's coordinates, so
+downscaled and dual-stream detection map back to full resolution the same way
+for all of them:
+- "haar": OpenCV Haar cascade, configured by cascade_classifier_config
+- "hog": dlib HOG detector through face_recognition.face_locations
+- "dnn": OpenCV DNN face detector (res10 SSD) loaded from a local model file
+
+Each backend lists the detect() arguments it honours in `adjustable`, so the
+latency controller only steps settings that change its cost, and its
+`smallest_face` in detection-image pixels, which bounds how far a frame can be
+downscaled before faces of minSize are missed (see detection_scale).
+"""
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+import logging  # For logging events and errors
+import math     # For rounding the detection scale up
+import os       # For checking the model files exist
+import cv2      # OpenCV for the cascade classifier and DNN module
+import numpy as np  # For numerical operations
+from config import *  # Import all configuration variables from config.py
+
+#------------------------------------------------------------------------------
+# Logging
+#------------------------------------------------------------------------------
+logger = logging.getLogger(__name__)  # Get a logger instance for this module
+
+#------------------------------------------------------------------------------
+# Size Limits
+#------------------------------------------------------------------------------
+def scale_cascade_config(scale, settings=None):
+    """
+    Scales the size limits of cascade_classifier_config to a downscaled frame
+
+    Args:
+        scale: Downscale factor applied to the frame
+        settings: detectMultiScale keyword arguments, None uses cascade_classifier_config
+
+    Returns:
+        dict: detectMultiScale keyword arguments for the downscaled frame
+    """
+    scaled = dict(cascade_classifier_config if settings is None else settings)
+    for key in ("minSize", "maxSize"):
+        if key in scaled:
+            scaled[key] = tuple(max(1, int(round(size * scale))) for size in scaled[key])
+    return scaled
+
+
+def detection_scale(face_detector, scale=DETECTION_SCALE):
+    """
+    Scale a detector runs at when DETECTION_SCALE is None: the smallest at
+    which a minSize face (in full-resolution pixels) still covers
+    DETECTION_SCALE_MARGIN times the detector's smallest face, so
+    downscaling finds the same faces
+
+    Args:
+        face_detector: Detector from create_face_detector
+        scale: Configured scale, returned as is unless None
+
+    Returns:
+        float: Downscale factor for faceID.detect_faces
+    """
+    if scale is not None:
+        return scale
+    smallest_face = getattr(face_detector, "smallest_face", None)
+    settings = getattr(face_detector, "settings", cascade_classifier_config)
+    if not smallest_face or "minSize" not in settings:
+        return 1.0
+    return min(1.0, math.ceil(round(100 * DETECTION_SCALE_MARGIN * smallest_face / min(settings["minSize"]), 6)) / 100)
+
+
+def _within_size_limits(boxes, scale):
+    """
+    Drops boxes outside the minSize/maxSize of cascade_classifier_config, so
+    every backend only reports faces at the distances the Haar cascade would
+
+    Args:
+        boxes: Integer array of (x, y, w, h) rows
+        scale: Downscale factor of the image the boxes are in
+
+    Returns:
+        numpy.ndarray: The boxes within the limits
+    """
+    limits = scale_cascade_config(scale)
+    keep = np.ones(len(boxes), dtype=bool)
+    if "minSize" in limits:
+        keep &= (boxes[:, 2] >= limits["minSize"][0]) & (boxes[:, 3] >= limits["minSize"][1])
+    if "maxSize" in limits:
+        keep &= (boxes[:, 2] <= limits["maxSize"][0]) & (boxes[:, 3] <= limits["maxSize"][1])
+    return boxes[keep]
+
+#------------------------------------------------------------------------------
+# Haar Cascade Backend
+#------------------------------------------------------------------------------
+class HaarDetector:
+    """OpenCV Haar cascade, the original detector"""
+    name = "haar"
+    needs_color = False
+    adjustable = ("scale_factor",)  # Pyramid step, see latency_controller.py
+
+    def __init__(self, cascade_file=HAAR_CASCADE_FILE, settings=None):
+        """
+        Args:
+            cascade_file: Cascade file name in OpenCV's haarcascades directory
+            settings: detectMultiScale keyword arguments, None uses cascade_classifier_config
+        """
+        self.settings = cascade_classifier_config if settings is None else settings
+        self.classifier = cv2.CascadeClassifier(cv2.data.haarcascades + cascade_file)  # cv2 + cascade classifier file path
+        if self.classifier.empty():
+            raise OSError(f"Cannot load cascade {cascade_file}")
+        self.smallest_face = max(self.classifier.getOriginalWindowSize())  # Cascade window, 24 px for the default cascade
+
+    def detect(self, image, scale=1.0, scale_factor=None):
+        """
+        Args:
+            image: Grayscale image
+            scale: Downscale factor of the image, the size limits are scaled with it
+            scale_factor: Pyramid step override, None uses the detector's settings
+
+        Returns:
+            numpy.ndarray: Faces as rows of (x, y, w, h)
+        """
+        settings = self.settings if scale >= 1.0 else scale_cascade_config(scale, self.settings)
+        if scale_factor is not None:
+            settings = dict(settings, scaleFactor=scale_factor)
+        return self.classifier.detectMultiScale(image, **settings)
+
+#------------------------------------------------------------------------------
+# dlib HOG Backend
+#------------------------------------------------------------------------------
+class HogDetector:
+    """dlib's HOG + linear SVM detector, fewer false positives than Haar but slower"""
+    name = "hog"
+    needs_color = False
+    adjustable = ()  # dlib's pyramid step is fixed
+
+    def __init__(self, upsample=0):
+        """
+        Args:
+            upsample: Times the image is upsampled first, finds smaller faces at a large cost
+        """
+        from faceID import load_face_recognition  # Imported here, faceID imports this module
+        self.face_recognition = load_face_recognition()
+        self.upsample = upsample
+        self.smallest_face = 80 // 2 ** upsample  # dlib's 80 px detection window, halved by every upsample
+
+    def detect(self, image, scale=1.0, scale_factor=None):
+        """
+        Args:
+            image: Grayscale image (dlib accepts it as is)
+            scale: Downscale factor of the image, the size limits are scaled with it
+            scale_factor: Unused, dlib's pyramid step is fixed
+
+        Returns:
+            numpy.ndarray: Faces as rows of (x, y, w, h)
+        """
+        locations = self.face_recognition.face_locations(image, number_of_times_to_upsample=self.upsample, model="hog")
+        boxes = np.array([(left, top, right - left, bottom - top) for top, right, bottom, left in locations],
+                         dtype=int).reshape(-1, 4)
+        return _within_size_limits(boxes, scale)
+
+#------------------------------------------------------------------------------
+# OpenCV DNN Backend
+#------------------------------------------------------------------------------
+class DnnDetector:
+    """SSD face detector run by OpenCV's DNN module, e.g. res10_300x300_ssd_iter_140000"""
+    name = "dnn"
+    needs_color = True
+    adjustable = ()  # The network always sees input_size
+    smallest_face = None  # The image is resized to input_size, so there is no fixed smallest face
+
+    def __init__(self, model, config=None, confidence=0.6, input_size=(300, 300), mean=(104.0, 177.0, 123.0)):
+        """
+        Args:
+            model: Local model file (.caffemodel, .pb, .onnx, ...)
+            config: Network description for the model (.prototxt, .pbtxt), None if the model has none
+            confidence: Minimum detection confidence
+            input_size: (width, height) the image is resized to for the network
+            mean: Per-channel BGR mean subtracted from the input
+        """
+        for path in filter(None, (model, config)):
+            if not os.path.exists(path):
+                raise OSError(f"DNN face detector file {path} not found")
+        self.net = cv2.dnn.readNet(model, config or "")
+        self.confidence = confidence
+        self.input_size = tuple(input_size)
+        self.mean = tuple(mean)
+
+    def detect(self, image, scale=1.0, scale_factor=None):
+        """
+        Args:
+            image: BGR image, or a grayscale one (dual-stream luma) which is expanded to three channels
+            scale: Downscale factor of the image, the size limits are scaled with it
+            scale_factor: Unused, the network sees one fixed input size
+
+        Returns:
+            numpy.ndarray: Faces as rows of (x, y, w, h)
+        """
+        if image.ndim == 2:
+            image = cv2.cvtColor(image, cv2.COLOR_GRAY2BGR)
+        height, width = image.shape[:2]
+        self.net.setInput(cv2.dnn.blobFromImage(image, 1.0, self.input_size, self.mean))
+        detections = self.net.forward().reshape(-1, 7)  # image id, class, confidence, x1, y1, x2, y2 (relative)
+        detections = detections[detections[:, 2] >= self.confidence]
+        corners = np.clip(detections[:, 3:7], 0.0, 1.0) * np.array([width, height, width, height])
+        boxes = np.column_stack([corners[:, :2], corners[:, 2:] - corners[:, :2]]).round().astype(int).reshape(-1, 4)
+        return _within_size_limits(boxes[(boxes[:, 2] > 0) & (boxes[:, 3] > 0)], scale)
+
+#------------------------------------------------------------------------------
+# Factory
+#------------------------------------------------------------------------------
+DETECTOR_BACKENDS = ("haar", "hog", "dnn")
+
+
+def create_face_detector(backend=None):
+    """
+    Builds a face detector from face_detector_config
+
+    Args:
+        backend: "haar", "hog" or "dnn", None uses face_detector_config["backend"]
+
+    Returns:
+        HaarDetector, HogDetector or DnnDetector: The detector, raises if it cannot be loaded
+    """
+    backend = backend or face_detector_config["backend"]
+    if backend == "haar":
+        return HaarDetector()
+    if backend == "hog":
+        return HogDetector(**face_detector_config.get("hog", {}))
+    if backend == "dnn":
+        return DnnDetector(**face_detector_config["dnn"])
+    raise ValueError(f"Unknown face detector backend {backend}, expected one of {', '.join(DETECTOR_BACKENDS)}")
@@ -1,22 +1,257 @@
-import face_recognition
-import os
-import json
-import numpy as np
+"""
+encode_faces.py
 
-encodings_dict = {}
+This script enrolls the faces in known_faces/ into the binary gallery.
 
-for filename in os.listdir("known_faces"):
-    if filename.endswith(('.jpg', '.jpeg', '.png')):
-        image_path = os.path.join("known_faces", filename)
-        image = face_recognition.load_image_file(image_path)
-        encodings = face_recognition.face_encodings(image)
+Images are laid out either as known_faces/<name>.jpg (one image per person)
+or known_faces/<name>/<any>.jpg (several images per person). Every image is
+hashed and recorded in a manifest, so a re-run only encodes new or changed
+images, reuses the rows of unchanged ones and prunes deleted ones. Encoding
+runs on a process pool and results are streamed into the gallery file, which
+is moved into place atomically when enrollment finishes. The legacy
+authorized_faces.json is rewritten alongside it (ENROLL_WRITE_JSON), just
+before the binary gallery is moved into place so the binary file stays the
+newer of the two.
 
-        if encodings: 
-            encodings_dict[os.path.splitext(filename)[0]] = encodings[0].tolist()
+Usage:
+    python encode_faces.py [--workers N] [--full]
+"""
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+import argparse  # For command line arguments
+import hashlib  # For content hashes of enrolled images
+import json     # For the enrollment manifest
+import logging  # For the worker processes' log level
+import multiprocessing  # For the worker processes' context
+import os       # For walking known_faces and atomic file replacement
+import time     # For progress and throughput reporting
+from concurrent.futures import ProcessPoolExecutor, as_completed  # For parallel encoding
+from audit_log import configure_logging, configure_worker_logging, start_worker_log_listener  # Log writer, worker forwarding
+from config import *  # Import all configuration variables from config.py
+from gallery import GalleryWriter, load_gallery  # Import binary gallery reading/writing
+from ann_index import IVFIndex  # Import IVF approximate nearest neighbour index
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+#------------------------------------------------------------------------------
+# Image Discovery
+#------------------------------------------------------------------------------
+def find_images(faces_dir):
+    """
+    Lists the enrollment images and the person each one belongs to
+
+    Args:
+        faces_dir: Directory of known faces
+
+    Returns:
+        dict: {relative image path: person name}
+    """
+    images = {}
+    for entry in sorted(os.listdir(faces_dir)):
+        entry_path = os.path.join(faces_dir, entry)
+        if os.path.isdir(entry_path):
+            for filename in sorted(os.listdir(entry_path)):
+                if filename.lower().endswith(IMAGE_EXTENSIONS):
+                    images[os.path.join(entry, filename)] = entry  # Folder name is the person
+        elif entry.lower().endswith(IMAGE_EXTENSIONS):
+            images[entry] = os.path.splitext(entry)[0]  # File name is the person
+    return images
+
+
+def file_hash(path):
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as image_file:
+        for block in iter(lambda: image_file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+#------------------------------------------------------------------------------
+# Manifest
+#------------------------------------------------------------------------------
+def load_manifest(manifest_path, gallery_path):
+    """
+    Loads the manifest of the previous run together with its gallery
+
+    Args:
+        manifest_path: Manifest file path
+        gallery_path: Gallery file the manifest rows refer to
+
+    Returns:
+        tuple: (manifest dict, FaceGallery or None); an empty manifest if either is missing or unreadable
+    """
+    try:
+        with open(manifest_path, "r") as manifest_file:
+            manifest = json.load(manifest_file)
+        gallery = load_gallery(gallery_path)
+        if manifest.get("gallery_count") != len(gallery):
+            print(f"{manifest_path} does not match {gallery_path}, re-encoding everything")
+            return {"images": {}}, None
+        return manifest, gallery
+    except (OSError, ValueError):
+        return {"images": {}}, None
+
+
+def save_manifest(manifest, manifest_path):
+    """Writes the manifest atomically"""
+    temp_path = f"{manifest_path}.tmp"
+    with open(temp_path, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=1)
+    os.replace(temp_path, manifest_path)
+
+
+def save_json_gallery(faces, json_path):
+    """
+    Writes the legacy {name: encoding list} gallery atomically
+
+    The JSON layout holds one encoding per name, so it is only written when
+    every person was enrolled from a single image.
+
+    Args:
+        faces: Dictionary of name to list of encodings
+        json_path: Legacy JSON gallery file
+
+    Returns:
+        bool: True if the file was written
+    """
+    several = sorted(name for name, encodings in faces.items() if len(encodings) > 1)
+    if several:
+        print(f"{json_path} not updated: {', '.join(several[:5])} enrolled from several images, "
+              f"only {os.path.basename(GALLERY_FILE)} holds them")
+        return False
+    temp_path = f"{json_path}.tmp"
+    with open(temp_path, "w") as json_file:
+        json.dump({name: [float(value) for value in encodings[0]] for name, encodings in faces.items()}, json_file)
+    os.replace(temp_path, json_path)
+    return True
+
+#------------------------------------------------------------------------------
+# Encoding Worker
+#------------------------------------------------------------------------------
+def encode_image(image_path):
+    """
+    Encodes the largest face in an image, runs in a worker process
+
+    Args:
+        image_path: Image file path
+
+    Returns:
+        list: Face encoding as a list of floats, or None if no face was found
+    """
+    import face_recognition  # Imported in the worker, each process loads its own dlib models
+    image = face_recognition.load_image_file(image_path)
+    locations = face_recognition.face_locations(image)
+    if not locations:
+        return None
+    largest = max(locations, key=lambda box: (box[2] - box[0]) * (box[1] - box[3]))  # Enroll the main subject
+    encodings = face_recognition.face_encodings(image, known_face_locations=[largest])
+    return encodings[0].tolist() if encodings else None
+
+#------------------------------------------------------------------------------
+# Enrollment
+#------------------------------------------------------------------------------
+def enroll(faces_dir=KNOWN_FACES_DIR, gallery_path=GALLERY_FILE, manifest_path=ENROLLMENT_MANIFEST,
+           workers=ENROLL_WORKERS, full=False, json_path=AUTHORIZED_FACES_JSON if ENROLL_WRITE_JSON else None,
+           index_path=None):
+    """
+    Brings the gallery up to date with the images in faces_dir
+
+    Args:
+        faces_dir: Directory of known faces
+        gallery_path: Binary gallery file to write
+        manifest_path: Manifest of image hashes and gallery rows
+        workers: Encoding processes, None uses every core
+        full: Ignore the manifest and re-encode every image
+        json_path: Legacy JSON gallery to rewrite as well, None writes only the binary gallery
+        index_path: ANN index file, None puts it next to the gallery (authorized_faces.fidg ->
+            authorized_faces.ivf.npz, ANN_INDEX_FILE for the default gallery)
+
+    Returns:
+        int: Number of rows in the new gallery
+    """
+    images = find_images(faces_dir)
+    old_manifest, old_gallery = ({"images": {}}, None) if full else load_manifest(manifest_path, gallery_path)
+    old_images = old_manifest["images"]
+
+    # Split images into unchanged (reuse the old row) and new or changed (re-encode)
+    hashes = {path: file_hash(os.path.join(faces_dir, path)) for path in images}
+    reused, pending = [], []
+    for path, name in images.items():
+        previous = old_images.get(path)
+        if previous is not None and previous["sha256"] == hashes[path] and previous["name"] == name:
+            reused.append(path)
         else:
-            print(f"No face detected in {filename}. Skipping.")
+            pending.append(path)
+    pruned = [path for path in old_images if path not in images]
+    print(f"{len(images)} images: {len(reused)} unchanged, {len(pending)} to encode, {len(pruned)} removed")
+
+    new_images = {}
+    faces = {}  # Name to encodings, for the legacy JSON gallery
+    with GalleryWriter(gallery_path, {"source": faces_dir}) as writer:
+        # Copy unchanged rows straight from the old gallery
+        for path in reused:
+            row = old_images[path]["row"]
+            if row is not None:
+                encodings = old_gallery.float_encodings(slice(row, row + 1))
+                writer.add_rows([images[path]], encodings, old_gallery.norms[row:row + 1])
+                faces.setdefault(images[path], []).append(encodings[0])
+                row = len(writer) - 1
+            new_images[path] = {"sha256": hashes[path], "name": images[path], "row": row}
+
+        # Encode new and changed images in parallel, streaming rows as they complete
+        start = time.monotonic()
+        context = multiprocessing.get_context()
+        log_records, log_listener = start_worker_log_listener(context)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=configure_worker_logging,
+                                 initargs=(log_records, logging.getLogger().getEffectiveLevel())) as executor:
+            futures = {executor.submit(encode_image, os.path.join(faces_dir, path)): path for path in pending}
+            for done, future in enumerate(as_completed(futures), 1):
+                path = futures[future]
+                try:
+                    encoding = future.result()
+                except Exception as e:
+                    print(f"Error encoding {path}: {e}. Skipping.")
+                    continue  # Left out of the manifest so the next run retries it
+                row = None
+                if encoding is not None:
+                    writer.add(images[path], encoding)
+                    faces.setdefault(images[path], []).append(encoding)
+                    row = len(writer) - 1
+                else:
+                    print(f"No face detected in {path}. Skipping.")
+                new_images[path] = {"sha256": hashes[path], "name": images[path], "row": row}
+
+                if done % ENROLL_PROGRESS_EVERY == 0 or done == len(pending):
+                    elapsed = time.monotonic() - start
+                    print(f"[{done}/{len(pending)}] {done / elapsed:.1f} images/s")
+        log_listener.stop()
+        count = len(writer)
+        if json_path is not None and save_json_gallery(faces, json_path):
+            print(f"Face encodings also saved to {json_path}")  # Before the binary gallery is moved into place
+
+    save_manifest({"gallery_count": count, "images": new_images}, manifest_path)
+    print(f"Face encodings of {len(set(images.values()))} people saved to {gallery_path} ({count} rows)")
 
-with open("authorized_faces.json", "w") as json_file:
-    json.dump(encodings_dict, json_file)
+    # Large enrollments get an ANN index next to the gallery, small ones are brute-forced
+    if index_path is None:
+        index_path = os.path.splitext(gallery_path)[0] + ".ivf.npz"
+    if count >= ANN_MIN_GALLERY_SIZE:
+        IVFIndex.build(load_gallery(gallery_path)).save(index_path)
+        print(f"ANN index saved to {index_path}")
+    elif os.path.exists(index_path):
+        os.remove(index_path)  # A stale index would no longer match the gallery
+    return count
 
-print("Face encodings saved to encodings.json")
\ No newline at end of file
+#------------------------------------------------------------------------------
+# Command Line
+#------------------------------------------------------------------------------
+if __name__ == "__main__":
+    configure_logging()
+    parser = argparse.ArgumentParser(description="Enroll known_faces into the authorized face gallery")
+    parser.add_argument("--faces-dir", default=KNOWN_FACES_DIR, help="Directory of known faces")
+    parser.add_argument("--workers", type=int, default=ENROLL_WORKERS, help="Encoding processes (default: all cores)")
+    parser.add_argument("--full", action="store_true", help="Ignore the manifest and re-encode every image")
+    args = parser.parse_args()
+    enroll(args.faces_dir, workers=args.workers, full=args.full)
@@ -0,0 +1,279 @@
+"""
+encoder_pool.py
+
+This script runs face encoding in a pool of worker processes so dlib can use
+every core instead of the one the detection loop runs on. Face crops are
+written straight into shared-memory slots (the BGR to RGB conversion writes
+into the slot), so no image is pickled; only the slot number, crop shape and
+box travel over the task queue. Workers load the dlib models once at start
+and keep them warm. When every slot is in use, callers wait briefly and then
+give up on the face, which is the backpressure the latest-wins pipeline
+queues expect.
+"""
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+import logging  # For logging events and errors
+import multiprocessing  # For the worker processes and their queues
+import queue    # For the free-slot queue
+import signal   # For leaving Ctrl-C handling to the parent
+import threading  # For the result collector thread
+import time     # For timing operations
+from multiprocessing import shared_memory  # For the crop slots
+import cv2      # OpenCV for the color conversion into the slot
+import numpy as np  # For numerical operations
+from audit_log import configure_worker_logging, start_worker_log_listener  # Worker logs reach sys.log through the parent
+from metrics import metrics  # Import per-stage latency metrics
+from config import *  # Import all configuration variables from config.py
+
+#------------------------------------------------------------------------------
+# Logging
+#------------------------------------------------------------------------------
+logger = logging.getLogger(__name__)  # Get a logger instance for this module
+
+#------------------------------------------------------------------------------
+# Worker Process
+#------------------------------------------------------------------------------
+def _worker_main(slot_names, tasks, results, log_records, log_level):
+    """
+    Encoding loop of a worker process
+
+    Args:
+        slot_names: Shared memory names of every slot, attached once
+        tasks: Queue of (slot, generation, shape, box) tasks, None stops the worker
+        results: Queue the encodings are returned on
+        log_records: Queue log records are forwarded to the parent on
+        log_level: Root logger level of the parent
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # The parent shuts the pool down
+    configure_worker_logging(log_records, log_level)
+    import face_recognition  # Loaded once per worker, the models then stay warm
+    slots = [shared_memory.SharedMemory(name=name) for name in slot_names]  # The parent alone unlinks them
+    try:
+        blank = np.zeros((150, 150, 3), dtype=np.uint8)
+        face_recognition.face_encodings(blank, known_face_locations=[(25, 125, 125, 25)])  # Warm up
+        logger.info(f"Encoder worker {multiprocessing.current_process().pid} loaded its models")
+        results.put(("ready", multiprocessing.current_process().pid, None))
+
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            slot, generation, shape, box = task
+            try:
+                crop = np.ndarray(shape, dtype=np.uint8, buffer=slots[slot].buf)
+                known_face_locations = [box] if box is not None else None
+                encodings = face_recognition.face_encodings(crop, known_face_locations=known_face_locations)
+                del crop  # Release the view before the slot can be reused or closed
+                results.put((slot, generation, [np.asarray(encoding, dtype=np.float64) for encoding in encodings]))
+            except Exception as e:
+                logger.debug(f"Encoding failed in worker: {e}")
+                results.put((slot, generation, e))
+    finally:
+        for slot in slots:
+            slot.close()
+
+#------------------------------------------------------------------------------
+# Encoder Pool
+#------------------------------------------------------------------------------
+class _Request:
+    """Result of one encode, filled in by the collector thread"""
+    __slots__ = ("done", "result")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class EncoderPool:
+    """
+    Face encoding in worker processes fed through shared-memory slots
+
+    There are ENCODER_SLOTS_PER_PROCESS slots per process so the next crop can
+    be copied in while the previous one is being encoded. A caller holds a
+    slot from the copy until its result arrives.
+
+    Attributes:
+        processes: Number of worker processes
+        busy: Encodes given up because no slot became free in time
+    """
+
+    def __init__(self, processes=ENCODER_PROCESSES, max_crop=ENCODER_MAX_CROP):
+        """
+        Args:
+            processes: Number of worker processes
+            max_crop: (width, height) of the largest crop a slot holds, larger crops are downscaled
+        """
+        self.processes = processes
+        self.max_crop = max_crop
+        self.context = multiprocessing.get_context(ENCODER_START_METHOD)
+        slot_count = processes * ENCODER_SLOTS_PER_PROCESS
+        self.slots = [shared_memory.SharedMemory(create=True, size=max_crop[0] * max_crop[1] * 3)
+                      for _ in range(slot_count)]
+        self.free_slots = queue.Queue()
+        for slot in range(slot_count):
+            self.free_slots.put(slot)
+        self.generations = [0] * slot_count  # Bumped when a slot is reclaimed, late results are ignored
+        self.requests = [None] * slot_count
+        self.issued_at = [None] * slot_count
+        self.lock = threading.Lock()
+        self.tasks = self.context.Queue()
+        self.results = self.context.Queue()
+        self.workers = []
+        self.ready = 0
+        self.busy = 0
+        self.stop_event = threading.Event()
+        self.collector = None
+        self.log_records, self.log_listener = None, None
+
+    #--------------------------------------------------------------------------
+    # Lifecycle
+    #--------------------------------------------------------------------------
+    def start(self, timeout=ENCODER_START_TIMEOUT):
+        """
+        Starts the workers and waits until their models are loaded
+
+        Args:
+            timeout: Seconds to wait for every worker to report ready
+
+        Returns:
+            bool: True if every worker is ready
+        """
+        self.log_records, self.log_listener = start_worker_log_listener(self.context)
+        for _ in range(self.processes):
+            self._spawn_worker()
+        deadline = time.monotonic() + timeout
+        while self.ready < self.processes and time.monotonic() < deadline:
+            self._collect(timeout=max(0.0, deadline - time.monotonic()))
+        self.collector = threading.Thread(target=self._run_collector, name="encoder-pool-collector", daemon=True)
+        self.collector.start()
+        logger.info(f"Encoder pool ready: {self.ready}/{self.processes} worker processes, {len(self.slots)} slots")
+        return self.ready == self.processes
+
+    def stop(self):
+        """Stops the workers and releases the shared memory"""
+        self.stop_event.set()
+        for _ in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            worker.join(timeout=2)
+            if worker.is_alive():
+                worker.terminate()
+        if self.collector is not None:
+            self.collector.join(timeout=1)
+        if self.log_listener is not None:
+            self.log_listener.stop()  # After the workers exit, so their last records are logged
+        for slot in self.slots:
+            slot.close()
+            slot.unlink()
+        logger.info(f"Encoder pool stopped ({self.busy} faces skipped while every worker was busy)")
+
+    def _spawn_worker(self):
+        args = ([slot.name for slot in self.slots], self.tasks, self.results,
+                self.log_records, logging.getLogger().getEffectiveLevel())
+        worker = self.context.Process(target=_worker_main, args=args, name=f"encoder-{len(self.workers)}", daemon=True)
+        worker.start()
+        self.workers.append(worker)
+
+    #--------------------------------------------------------------------------
+    # Encoding
+    #--------------------------------------------------------------------------
+    def encode(self, bgr_crop, box=None):
+        """
+        Encodes the faces in a BGR crop on a worker process
+
+        Args:
+            bgr_crop: BGR image containing the face (a view into the frame is fine)
+            box: (top, right, bottom, left) of the face in the crop, None lets dlib detect it
+
+        Returns:
+            list: Encodings like face_recognition.face_encodings, or None if no
+            worker was free within ENCODER_SUBMIT_TIMEOUT or the worker failed
+        """
+        try:
+            slot = self.free_slots.get(timeout=ENCODER_SUBMIT_TIMEOUT)
+        except queue.Empty:
+            self.busy += 1
+            metrics.increment("encoder_busy")
+            return None
+
+        bgr_crop, box = self._fit(bgr_crop, box)
+        shape = bgr_crop.shape
+        view = np.ndarray(shape, dtype=np.uint8, buffer=self.slots[slot].buf)
+        cv2.cvtColor(bgr_crop, cv2.COLOR_BGR2RGB, dst=view)  # Converted straight into shared memory
+        del view
+
+        request = _Request()
+        with self.lock:
+            self.requests[slot] = request
+            self.issued_at[slot] = time.monotonic()
+            generation = self.generations[slot]
+        self.tasks.put((slot, generation, shape, box))
+
+        if not request.done.wait(ENCODER_RESULT_TIMEOUT):
+            logger.warning("Encoder worker did not answer in time")
+            return None  # The collector reclaims the slot if the worker never answers
+        if isinstance(request.result, Exception):
+            logger.warning(f"Error in encoder worker: {request.result}")
+            return None
+        return request.result
+
+    def _fit(self, bgr_crop, box):
+        """Downscales a crop larger than a slot, scaling the box with it"""
+        height, width = bgr_crop.shape[:2]
+        scale = min(1.0, self.max_crop[0] / width, self.max_crop[1] / height)
+        if scale >= 1.0:
+            return bgr_crop, box
+        bgr_crop = cv2.resize(bgr_crop, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        height, width = bgr_crop.shape[:2]
+        if box is not None:
+            top, right, bottom, left = (int(value * scale) for value in box)
+            box = (top, min(right, width), min(bottom, height), left)
+        return bgr_crop, box
+
+    #--------------------------------------------------------------------------
+    # Result Collector
+    #--------------------------------------------------------------------------
+    def _run_collector(self):
+        while not self.stop_event.is_set():
+            self._collect(timeout=0.5)
+            self._supervise()
+
+    def _collect(self, timeout):
+        """Hands one result (or ready message) to its waiting caller"""
+        try:
+            slot, generation, result = self.results.get(timeout=timeout)
+        except (queue.Empty, OSError, EOFError):
+            return
+        if slot == "ready":
+            self.ready += 1
+            return
+        with self.lock:
+            if generation != self.generations[slot]:
+                return  # Slot was reclaimed after a timeout, nobody is waiting for this result
+            request = self.requests[slot]
+            self.requests[slot] = None
+            self.issued_at[slot] = None
+        self.free_slots.put(slot)
+        if request is not None:
+            request.result = result
+            request.done.set()
+
+    def _supervise(self):
+        """Replaces dead workers and reclaims slots whose result never came back"""
+        for number, worker in enumerate(self.workers):
+            if not worker.is_alive() and not self.stop_event.is_set():
+                logger.error(f"Encoder worker {worker.pid} exited with code {worker.exitcode}, restarting it")
+                self.ready -= 1
+                self.workers.pop(number)
+                self._spawn_worker()
+                break
+        now = time.monotonic()
+        with self.lock:
+            for slot, issued_at in enumerate(self.issued_at):
+                if issued_at is not None and now - issued_at > ENCODER_RESULT_TIMEOUT * 2:
+                    self.generations[slot] += 1
+                    self.requests[slot] = None
+                    self.issued_at[slot] = None
+                    self.free_slots.put(slot)
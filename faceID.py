@@ -2,17 +2,24 @@
 faceID.py
 
 This script is used to detect faces in a video stream and compare them to a 
-list of authorized faces.
+list of authorized faces. face_recognition is imported on first use (or by
+warm_up_encoder at startup), so importing this module is cheap. With an
+encoder pool set, encodings run in its worker processes instead.
 """
 
 #------------------------------------------------------------------------------
 # Imports
 #------------------------------------------------------------------------------
 import logging  # For logging events and errors
-import json     # For handling JSON data
+import threading  # For guarding the encoding counters
+import time     # For verification latency
 import numpy as np  # For numerical operations
-import face_recognition  # For face detection and recognition
 import cv2      # OpenCV for image processing
+from metrics import metrics  # Import per-stage latency metrics
+from frame_source import DualStreamFrame, full_resolution  # Import dual-stream camera frames
+from audit_log import SECURITY  # Marks security events so they are never dropped
+from access_events import record_access  # Import indexed store of verification outcomes
+from detectors import detection_scale  # Import the per-backend default detection scale
 from config import *  # Import all configuration variables from config.py
 
 #------------------------------------------------------------------------------
@@ -21,64 +28,377 @@ from config import *  # Import all configuration variables from config.py
 logger = logging.getLogger(__name__)  # Get a logger instance for this module
 
 #------------------------------------------------------------------------------
-# Verify Face
+# Lazy face_recognition Import
 #------------------------------------------------------------------------------
-def verify_face(frame, face_location, encodings_dict):
+face_recognition = None  # Imported on first use, loading dlib and its models takes seconds
+_face_recognition_lock = threading.Lock()
+
+
+def load_face_recognition():
     """
-    Compares a detected face against authorized face encodings to verify identity
+    Imports face_recognition (and with it dlib and its models) once
+
+    Returns:
+        module: The face_recognition module
+    """
+    global face_recognition
+    if face_recognition is None:
+        with _face_recognition_lock:
+            if face_recognition is None:
+                import face_recognition as module  # For face detection and recognition
+                face_recognition = module
+    return face_recognition
+
+
+def warm_up_encoder():
+    """
+    Loads the dlib models and runs one throwaway encoding, so the first
+    visitor does not pay for model loading and first-call allocations
+    """
+    blank = np.zeros((150, 150, 3), dtype=np.uint8)
+    load_face_recognition().face_encodings(blank, known_face_locations=[(25, 125, 125, 25)])
+
+#------------------------------------------------------------------------------
+# Encoder Pool
+#------------------------------------------------------------------------------
+encoder_pool = None  # EncoderPool running the encodings in worker processes, None encodes in this process
+
+
+def set_encoder_pool(pool):
+    """
+    Routes face encodings to a started EncoderPool, or back to this process
+
+    Args:
+        pool: Started EncoderPool, or None to encode in this process
+    """
+    global encoder_pool
+    encoder_pool = pool
+
+
+def encode_worker_count():
+    """
+    Number of encode threads that keep the encoder busy
+
+    Returns:
+        int: PIPELINE_ENCODE_WORKERS, or one thread per pool slot if that is more
+    """
+    if encoder_pool is None:
+        return PIPELINE_ENCODE_WORKERS
+    return max(PIPELINE_ENCODE_WORKERS, len(encoder_pool.slots))  # Each thread waits on one slot's result
+
+
+class EncodeSkipped(Exception):
+    """
+    A detected face was not encoded because no resources were free (the
+    encoder pool was busy or the camera released the frame). This is not a
+    verification outcome: nothing is recorded and a later frame retries.
+    """
+
+
+def _face_encodings(bgr_crop, box=None):
+    """
+    Runs face_encodings on a BGR crop, in the encoder pool when one is set
+
+    Args:
+        bgr_crop: BGR image containing the face
+        box: (top, right, bottom, left) of the face in the crop, None lets dlib detect it
+
+    Returns:
+        list: Face encodings, empty if no face could be encoded
+
+    Raises:
+        EncodeSkipped: The encoder pool had no worker free or its worker did not answer
+    """
+    if encoder_pool is not None:
+        encodings = encoder_pool.encode(bgr_crop, box)  # Converted to RGB straight into shared memory
+        if encodings is None:
+            _count("encodes_skipped")
+            raise EncodeSkipped("encoder pool busy")
+        return encodings
+    face_frame = cv2.cvtColor(bgr_crop, cv2.COLOR_BGR2RGB)
+    known_face_locations = [box] if box is not None else None
+    return load_face_recognition().face_encodings(face_frame, known_face_locations=known_face_locations)
+
+#------------------------------------------------------------------------------
+# Detect Faces
+#------------------------------------------------------------------------------
+def detect_faces(face_detector, frame, scale=DETECTION_SCALE, scale_factor=None):
+    """
+    Runs the face detector on a downscaled copy of a captured frame
+    
+    Detection cost grows with pixel count, so the detector runs on a copy scaled
+    by `scale` and the boxes are mapped back to full-resolution coordinates.
+    Encoding still crops from the full-resolution frame. A DualStreamFrame is
+    detected on its low-resolution Y plane as is, without any conversion.
+    
+    Args:
+        face_detector: Detector from detectors.create_face_detector
+        frame: The video frame to search
+        scale: Downscale factor for detection, 1.0 runs on the full-resolution frame,
+            None the smallest the detector still finds minSize faces at
+        scale_factor: Haar cascade scaleFactor override, None uses cascade_classifier_config
+        
+    Returns:
+        numpy.ndarray: Detected faces as rows of (x, y, w, h) in full-resolution coordinates
+    """
+    if isinstance(frame, DualStreamFrame):
+        image, scale = frame.gray, frame.scale  # Already grayscale and small
+    else:
+        scale = min(detection_scale(face_detector, scale), 1.0)
+        # Shrink before the color conversion so both steps touch fewer pixels
+        with metrics.timer("color_conversion"):
+            if scale < 1.0:
+                frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+            image = frame if face_detector.needs_color else cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY)
+    with metrics.timer("detect"):
+        faces = face_detector.detect(image, scale, scale_factor)
+    metrics.increment("detections", len(faces))
+    if len(faces) == 0 or scale >= 1.0:
+        return faces
+    return np.round(np.asarray(faces) / scale).astype(int)  # Map boxes back to full-resolution coordinates
+
+#------------------------------------------------------------------------------
+# Encoding Counters
+#------------------------------------------------------------------------------
+encoding_stats = {
+    "encodings": 0,  # Face encodings generated
+    "redundant_detections_skipped": 0,  # Encodings made from the cascade box without a second dlib detection
+    "encode_failures": 0,  # Detected faces that produced no encoding
+    "encodes_skipped": 0,  # Detected faces left for a later frame, the encoder was busy or the frame released
+}
+_encoding_stats_lock = threading.Lock()  # Encode workers update the counters concurrently
+
+
+def _count(key):
+    """Increments an encoding_stats counter"""
+    with _encoding_stats_lock:
+        encoding_stats[key] += 1
+
+#------------------------------------------------------------------------------
+# Face Location Conversion
+#------------------------------------------------------------------------------
+def cascade_box_to_css(face_location, padding=ENCODE_BOX_PADDING, frame_shape=None):
+    """
+    Converts a cascade (x, y, w, h) box to the (top, right, bottom, left)
+    format face_recognition expects for known_face_locations
     
     Args:
-        frame: The video frame containing the face
         face_location: Coordinates of the face in the frame (x, y, w, h)
-        encodings_dict: Dictionary of authorized face encodings
+        padding: Fraction of the box size added on every side (negative shrinks the box)
+        frame_shape: Shape of the frame, the padded box is clamped to it; None leaves it unclamped
         
     Returns:
-        bool: True if face is authorized, False otherwise
+        tuple: (top, right, bottom, left) of the padded box
     """
-    try:
-        # Convert loaded encodings back to NumPy arrays
-        face_encodings = [np.array(enc) for enc in encodings_dict.values()]
+    x, y, w, h = (int(value) for value in face_location)
+    pad_x = int(round(w * padding))
+    pad_y = int(round(h * padding))
+    top, right, bottom, left = (y - pad_y, x + w + pad_x, y + h + pad_y, x - pad_x)
+    if frame_shape is not None:
+        # Same bounds face_recognition trims its own face_locations to
+        height, width = frame_shape[:2]
+        top, right, bottom, left = max(top, 0), min(right, width), min(bottom, height), max(left, 0)
+    return (top, right, bottom, left)
 
-        # Extract face from frame using coordinates (y1:y2, x1:x2)
-        x, y, w, h = face_location
+#------------------------------------------------------------------------------
+# Encode Face
+#------------------------------------------------------------------------------
+def encode_face(frame, face_location):
+    """
+    Generates the face encoding of a detected face
+    
+    Args:
+        frame: The video frame containing the face (a DualStreamFrame fetches its full-resolution frame)
+        face_location: Coordinates of the face in the frame (x, y, w, h)
         
-        # Get frame dimensions
-        height, width = frame.shape[:2]
+    Returns:
+        numpy.ndarray: 128-dimension face encoding, or None if no encoding could be generated
+
+    Raises:
+        EncodeSkipped: The face was not encoded for lack of resources, a later frame retries
+    """
+    frame = full_resolution(frame)
+    if frame is None:
+        logger.warning("Full-resolution frame was released by the camera before encoding")
+        _count("encodes_skipped")
+        raise EncodeSkipped("full-resolution frame released")
+    with metrics.timer("encode"):
+        if SINGLE_DETECTION_ENCODING:
+            return encode_face_from_box(frame, face_location)
+        return _encode_face_crop(frame, face_location)
+
+
+def _encode_face_crop(frame, face_location):
+    """Legacy encoding: crops the cascade box and lets dlib find the face in it again"""
+
+    # Extract face from frame using coordinates (y1:y2, x1:x2)
+    x, y, w, h = face_location
+    
+    # Get frame dimensions
+    height, width = frame.shape[:2]
+    
+    # Ensure coordinates are within frame boundaries
+    x = max(0, x)
+    y = max(0, y)
+    w = min(w, width - x)
+    h = min(h, height - y)
+    
+    # Check if we have a valid face region
+    if w <= 0 or h <= 0:
+        logger.warning("Face detection coordinates invalid")
+        return None
+        
+    face_frame = frame[y:y+h, x:x+w]
+
+    # Get face encoding for the extracted face (converted to RGB on the way)
+    current_face_encoding = _face_encodings(face_frame)
+
+    # Check if face encoding was found
+    if not current_face_encoding:
+        logger.warning("No face encoding could be generated from the detected face")
+        _count("encode_failures")
+        return None  # Return failure if no encoding could be generated
+    _count("encodings")
+    return current_face_encoding[0]
+
+
+def encode_face_from_box(frame, face_location):
+    """
+    Generates the face encoding directly from the cascade box
+    
+    The box is handed to face_encodings as known_face_locations, so dlib only
+    runs the landmark and encoding models instead of a second HOG detection.
+    The crop keeps some context around the box because dlib's aligned face
+    chip reaches slightly outside it.
+    
+    Args:
+        frame: The video frame containing the face
+        face_location: Coordinates of the face in the frame (x, y, w, h)
         
-        # Ensure coordinates are within frame boundaries
-        x = max(0, x)
-        y = max(0, y)
-        w = min(w, width - x)
-        h = min(h, height - y)
+    Returns:
+        numpy.ndarray: 128-dimension face encoding, or None if no encoding could be generated
+    """
+    height, width = frame.shape[:2]
+    top, right, bottom, left = cascade_box_to_css(face_location, frame_shape=frame.shape)
+
+    # Crop the padded box plus chip context, clipped to the frame
+    context_x = int((right - left) * ENCODE_CROP_CONTEXT)
+    context_y = int((bottom - top) * ENCODE_CROP_CONTEXT)
+    crop_top, crop_left = max(0, top - context_y), max(0, left - context_x)
+    crop_bottom, crop_right = min(height, bottom + context_y), min(width, right + context_x)
+
+    # Check if we have a valid face region
+    if crop_bottom <= crop_top or crop_right <= crop_left:
+        logger.warning("Face detection coordinates invalid")
+        _count("encode_failures")
+        return None
+
+    box = (top - crop_top, right - crop_left, bottom - crop_top, left - crop_left)  # Box in crop coordinates
+
+    current_face_encoding = _face_encodings(frame[crop_top:crop_bottom, crop_left:crop_right], box)
+    if not current_face_encoding:
+        logger.warning("No face encoding could be generated from the detected face")
+        _count("encode_failures")
+        return None
+    _count("encodings")
+    _count("redundant_detections_skipped")
+    return current_face_encoding[0]
+
+#------------------------------------------------------------------------------
+# Match Face
+#------------------------------------------------------------------------------
+def match_face(face_encoding, gallery, door=None, captured_at=None):
+    """
+    Compares a face encoding against the authorized faces and records the
+    outcome in the access event store
+    
+    Args:
+        face_encoding: 128-dimension face encoding
+        gallery: FaceGallery of authorized face encodings
+        door: Door name for the access event, None for the single-door setup
+        captured_at: time.monotonic() the frame was captured, for the event latency
         
-        # Check if we have a valid face region
-        if w <= 0 or h <= 0:
-            logger.warning("Face detection coordinates invalid")
-            return False
-            
-        face_frame = frame[y:y+h, x:x+w]
-
-        # Convert face_frame to RGB
-        face_frame = cv2.cvtColor(face_frame, cv2.COLOR_BGR2RGB)
-
-        # Get face encoding for the extracted face
-        current_face_encoding = face_recognition.face_encodings(face_frame)
-
-        # Check if face encoding was found
-        if not current_face_encoding:
-            logger.warning("No face encoding could be generated from the detected face")
-            return False  # Return failure if no encoding could be generated
-
-        # Compare face encoding to authorized face encodings
-        matches = face_recognition.compare_faces(face_encodings, current_face_encoding[0], TOLERANCE)
-
-        if True in matches:
-            name = list(encodings_dict.keys())[matches.index(True)]
-            logger.info(f"Authorized user '{name}' verified")
-            return True  # Return success if match found
-        else:
-            logger.warning("Unauthorized face detected")
-            return False  # Return failure if no match found
+    Returns:
+        str: Name of the authorized user, or None if the face is not authorized
+    """
+    # Compare face encoding to authorized face encodings, closest identity wins
+    with metrics.timer("match"):
+        name, distance, margin = gallery.match(face_encoding)
+    latency = time.monotonic() - captured_at if captured_at is not None else None
+
+    if name is not None and distance <= TOLERANCE:
+        logger.info(f"Authorized user '{name}' verified (distance {distance:.3f}, margin {margin:.3f})", extra=SECURITY)
+        record_access(door, name, name, distance, latency)
+        return name  # Return the identity if match found
+    else:
+        logger.warning(f"Unauthorized face detected (closest distance {distance:.3f})", extra=SECURITY)
+        metrics.increment("rejects")
+        record_access(door, None, name, distance, latency)
+        return None  # Return failure if no match found
+
+def record_encode_failure(door=None, captured_at=None):
+    """
+    Records a detected face that produced no encoding in the access event
+    store, as a rejection without a closest match
+
+    Args:
+        door: Door name for the access event, None for the single-door setup
+        captured_at: time.monotonic() the frame was captured, for the event latency
+    """
+    latency = time.monotonic() - captured_at if captured_at is not None else None
+    record_access(door, None, None, None, latency)
+
+#------------------------------------------------------------------------------
+# Identify Face
+#------------------------------------------------------------------------------
+def identify_face(frame, face_location, gallery, door=None, captured_at=None):
+    """
+    Encodes a detected face and looks it up among the authorized faces
+    
+    Args:
+        frame: The video frame containing the face
+        face_location: Coordinates of the face in the frame (x, y, w, h)
+        gallery: FaceGallery of authorized face encodings
+        door: Door name for the access event, None for the single-door setup
+        captured_at: time.monotonic() the frame was captured, for the event latency
+        
+    Returns:
+        str: Name of the authorized user, or None if the face is not authorized
+
+    Raises:
+        EncodeSkipped: The face was not encoded for lack of resources, nothing was decided
+    """
+    try:
+        face_encoding = encode_face(frame, face_location)
+        if face_encoding is None:
+            record_encode_failure(door, captured_at)
+            return None  # Return failure if no encoding could be generated
+        return match_face(face_encoding, gallery, door, captured_at)
+    except EncodeSkipped:
+        raise  # Not a rejection, the caller retries on a later frame
     except Exception as e:
         logger.error(f"Error during face verification: {e}")
-        return False  # Return failure if any exception occurs
+        record_encode_failure(door, captured_at)
+        return None  # Return failure if any exception occurs
+
+#------------------------------------------------------------------------------
+# Verify Face
+#------------------------------------------------------------------------------
+def verify_face(frame, face_location, gallery, door=None, captured_at=None):
+    """
+    Compares a detected face against authorized face encodings to verify identity
+    
+    Args:
+        frame: The video frame containing the face
+        face_location: Coordinates of the face in the frame (x, y, w, h)
+        gallery: FaceGallery of authorized face encodings
+        door: Door name for the access event, None for the single-door setup
+        captured_at: time.monotonic() the frame was captured, for the event latency
+        
+    Returns:
+        bool: True if face is authorized, False otherwise
+
+    Raises:
+        EncodeSkipped: The face was not encoded for lack of resources, nothing was decided
+    """
+    return identify_face(frame, face_location, gallery, door, captured_at) is not None
@@ -0,0 +1,110 @@
+"""
+fake_mcu.py
+
+This script emulates the door microcontroller on a pseudo-terminal so the
+serial worker can be exercised without hardware. It answers the serial_comm
+line protocol (UNLOCK -> ACK UNLOCK, PING -> PONG) and can be told to answer
+slowly or to go silent to simulate a dead link.
+
+Usage:
+    python fake_mcu.py [--ack-delay 0.02]
+    (then set SERIAL_PORT in config.py to the printed device path)
+"""
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+import argparse  # For command line arguments
+import os       # For the pseudo-terminal
+import select   # For polling the pseudo-terminal
+import threading  # For the responder thread
+import time     # For timing operations
+import tty      # For raw mode on the pseudo-terminal
+
+#------------------------------------------------------------------------------
+# Fake Microcontroller
+#------------------------------------------------------------------------------
+class FakeMCU:
+    """
+    Pseudo-terminal pair whose far end answers like the door microcontroller
+
+    Attributes:
+        port: Device path to open with pyserial, e.g. /dev/pts/3
+        ack_delay: Seconds to wait before every reply
+        silent: While True, commands are read but never answered
+        received: Every command line received, in order
+    """
+
+    REPLIES = {"UNLOCK": "ACK UNLOCK", "PING": "PONG"}
+
+    def __init__(self, ack_delay=0.0):
+        """
+        Args:
+            ack_delay: Seconds to wait before every reply
+        """
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)  # No echo or line editing, like a real UART
+        self.port = os.ttyname(self.slave)
+        self.ack_delay = ack_delay
+        self.silent = False
+        self.received = []
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Starts answering commands"""
+        self.thread = threading.Thread(target=self._run, name="fake-mcu", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stops answering and closes the pseudo-terminal"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=1)
+        os.close(self.master)
+        os.close(self.slave)
+
+    def unlocks(self):
+        """Number of UNLOCK commands received"""
+        return self.received.count("UNLOCK")
+
+    def _run(self):
+        buffer = b""
+        while not self.stop_event.is_set():
+            readable, _, _ = select.select([self.master], [], [], 0.05)
+            if not readable:
+                continue
+            try:
+                buffer += os.read(self.master, 1024)
+            except OSError:
+                return  # Closed
+            while b"\n" in buffer:
+                line, buffer = buffer.split(b"\n", 1)
+                command = line.decode("ascii", "replace").strip()
+                if not command:
+                    continue
+                self.received.append(command)
+                reply = self.REPLIES.get(command)
+                if reply is None or self.silent:
+                    continue
+                if self.ack_delay:
+                    time.sleep(self.ack_delay)
+                os.write(self.master, f"{reply}\n".encode("ascii"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake door microcontroller on a pseudo-terminal")
+    parser.add_argument("--ack-delay", type=float, default=0.0, help="Seconds to wait before every reply")
+    args = parser.parse_args()
+
+    mcu = FakeMCU(args.ack_delay).start()
+    print(f"Fake microcontroller listening on {mcu.port} (Ctrl-C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mcu.stop()
+        print(f"Received {len(mcu.received)} commands, {mcu.unlocks()} unlocks")
@@ -0,0 +1,448 @@
+"""
+frame_source.py
+
+This script provides the frames the detection loop works on. Every backend
+has the same small interface (read, set_frame_rate, close), so the pipeline
+runs the same way on the Pi camera, on a recorded video or on a directory of
+still images, and door-side latency can be reproduced off the Pi.
+
+With a "lores" stream in camera_config the Pi camera runs dual-stream:
+detection reads the Y plane of a small YUV420 stream, and the full-resolution
+frame is only copied out of the camera when a face needs encoding.
+"""
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+import collections  # For the held camera requests
+import logging  # For logging events and errors
+import os       # For listing image directories
+import queue    # For frames released by the garbage collector
+import threading  # For guarding the held camera requests
+import time     # For timing operations and replay pacing
+import cv2      # OpenCV for reading video files and images
+import numpy as np  # For the reused luma buffers
+from metrics import metrics  # Import per-stage latency metrics
+from config import *  # Import all configuration variables from config.py
+
+#------------------------------------------------------------------------------
+# Logging
+#------------------------------------------------------------------------------
+logger = logging.getLogger(__name__)  # Get a logger instance for this module
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+#------------------------------------------------------------------------------
+# Frame Source Interface
+#------------------------------------------------------------------------------
+class FrameSource:
+    """
+    Base class of every frame source
+
+    Subclasses implement _read_frame() (and optionally a cheaper _skip_frame()).
+    read() adds replay pacing on top: in real-time mode a replay behaves like
+    a live camera, frames that went by while the caller was busy are skipped
+    rather than queued, so recorded footage reproduces door-side timing.
+    Frames are BGR numpy arrays, matching the BGR888 camera format, or
+    DualStreamFrames from a dual-stream Pi camera.
+
+    Attributes:
+        fps: Delivery frame rate, lowered by the motion gate while idle
+        source_fps: Frame rate the frames were recorded at
+        realtime: True paces replay in real time, False delivers every frame as fast as possible
+        frames_read: Number of frames delivered so far
+        frames_skipped: Number of frames skipped to keep up with real time
+        downscalable: False if frames are detected at a fixed size (dual-stream
+            frames), so the detection scale has no effect on them
+    """
+    downscalable = True
+
+    def __init__(self, fps, realtime=True):
+        self.fps = fps
+        self.source_fps = fps
+        self.realtime = realtime
+        self.frames_read = 0
+        self.frames_skipped = 0
+        self.position = 0  # Index of the next frame in the recording
+        self._started_at = None  # time.monotonic() of the first read when pacing
+        self._next_due = None  # time.monotonic() the next frame may be delivered when pacing
+
+    def read(self):
+        """
+        Returns the next frame
+
+        Returns:
+            numpy.ndarray: The next BGR frame (a DualStreamFrame from a dual-stream
+            camera), or None once the source is exhausted
+        """
+        if self.realtime and self.fps:
+            now = time.monotonic()
+            if self._next_due is not None and now < self._next_due:
+                time.sleep(self._next_due - now)
+            now = time.monotonic()
+            if self._started_at is None:
+                self._started_at = now
+            # Skip frames that went by in real time while nobody was reading
+            due_position = int((now - self._started_at) * self.source_fps)
+            while self.position < due_position:
+                if not self._skip_frame():
+                    return None
+                self.position += 1
+                self.frames_skipped += 1
+            self._next_due = now + 1.0 / self.fps
+
+        with metrics.timer("capture"):  # Excludes the replay pacing sleep above
+            frame = self._read_frame()
+        if frame is not None:
+            self.position += 1
+            self.frames_read += 1
+            metrics.increment("frames")
+        return frame
+
+    def set_frame_rate(self, fps):
+        """
+        Changes the delivery frame rate, used by the motion gate to idle the source
+
+        Args:
+            fps: New frame rate
+        """
+        self.fps = fps
+
+    def close(self):
+        """Releases the source"""
+
+    def _read_frame(self):
+        raise NotImplementedError
+
+    def _skip_frame(self):
+        """Advances past one frame without returning it, False once exhausted"""
+        return self._read_frame() is not None
+
+#------------------------------------------------------------------------------
+# Dual-Stream Frames
+#------------------------------------------------------------------------------
+class DualStreamFrame:
+    """
+    A frame of the dual-stream Pi camera
+
+    The frame holds its camera request and luma buffer until full() has
+    copied the full-resolution frame or release() is called, so detection
+    may take as long as it needs. Capture waits for a held frame to be
+    released before it reuses a buffer. A frame that is simply dropped
+    (superseded in a queue, skipped by the motion gate) is released when it
+    is garbage collected.
+
+    Attributes:
+        gray: Y plane of the low-resolution stream, valid until the frame is released
+        scale: Low-resolution width over full-resolution width
+        sequence: Capture number, identifies the camera request holding the full frame
+    """
+    __slots__ = ("gray", "scale", "sequence", "source", "_full", "_held")
+
+    def __init__(self, gray, scale, sequence, source):
+        self.gray = gray
+        self.scale = scale
+        self.sequence = sequence
+        self.source = source
+        self._full = None
+        self._held = True
+
+    def full(self):
+        """
+        Copies the full-resolution frame out of the camera, once, and releases the capture
+
+        Returns:
+            numpy.ndarray: Full-resolution BGR frame, or None if the frame was already released
+        """
+        if self._full is None and self._held:
+            self._full = self.source.full_frame(self.sequence)
+            self.release()
+        return self._full
+
+    def release(self):
+        """Hands the camera request and luma buffer back to the camera, gray must not be read afterwards"""
+        if self._held:
+            self._held = False
+            self.source.release_frame(self.sequence)
+
+    def __del__(self):
+        if self._held:  # Never locks here, the collector may run inside any lock of any thread
+            self._held = False
+            self.source.dropped_frames.put(self.sequence)
+
+
+def full_resolution(frame):
+    """
+    Returns the image faces are encoded from
+
+    Args:
+        frame: BGR frame or DualStreamFrame
+
+    Returns:
+        numpy.ndarray: Full-resolution BGR frame, or None if a dual-stream frame's buffer is gone
+    """
+    return frame.full() if isinstance(frame, DualStreamFrame) else frame
+
+
+def release_frame(frame):
+    """
+    Releases a dual-stream frame's camera buffers once nothing more is needed from it
+
+    Args:
+        frame: BGR frame or DualStreamFrame, plain frames need no release
+    """
+    if isinstance(frame, DualStreamFrame):
+        frame.release()
+
+#------------------------------------------------------------------------------
+# Picamera2 Backend
+#------------------------------------------------------------------------------
+class PicameraSource(FrameSource):
+    """
+    Raspberry Pi camera through Picamera2, paced by the camera itself
+
+    In dual-stream mode every read copies only the low-resolution Y plane into
+    one of "held_requests" preallocated buffers and keeps the camera request,
+    so the full-resolution frame of the same capture can still be fetched
+    once detection has found a face in it. A buffer is reused only after its
+    frame is released; when every buffer is held, capture waits up to
+    "hold_timeout" seconds and then reclaims the oldest, counted as a
+    missed full frame.
+    """
+
+    SOURCE_KEYS = ("lores", "held_requests", "hold_timeout", "buffer_count")  # Read here, not Picamera2 settings
+
+    def __init__(self, config=camera_config, warm_up=2, camera_num=0):
+        """
+        Args:
+            config: Camera configuration (camera_config in config.py)
+            warm_up: Seconds to let exposure and focus settle after starting
+            camera_num: Camera index on boards with several camera ports
+        """
+        super().__init__(config["fps"], realtime=False)  # The sensor paces frames, no sleeping needed
+        from picamera2 import Picamera2, MappedArray  # Imported here so the other backends run off the Pi
+        self.mapped_array = MappedArray
+        self.dual_stream = bool(config.get("lores"))
+        self.downscalable = not self.dual_stream  # Dual-stream frames are detected on the lores stream as is
+        self.held = collections.OrderedDict()  # Sequence to (request, luma buffer) of unreleased dual-stream captures
+        self.held_lock = threading.Condition()  # Encode threads fetch and release frames while capture waits for a buffer
+        self.dropped_frames = queue.SimpleQueue()  # Sequences of frames garbage collected unreleased, freed by capture
+        self.hold_timeout = config.get("hold_timeout", 1.0)
+        self.sequence = 0
+        self.camera = Picamera2(camera_num)  # Initialize the camera hardware, resource allocation, and drivers through Picamera2
+        try:
+            if self.dual_stream:
+                lores_width, lores_height = config["lores"]["size"]
+                self.scale = lores_width / config["size"][0]
+                self.gray_buffers = [np.empty((lores_height, lores_width), dtype=np.uint8)
+                                     for _ in range(config.get("held_requests", 3))]  # Free luma buffers
+                self.camera.configure(self.camera.create_video_configuration(
+                    main={"size": config["size"], "format": config["format"]},
+                    lores={"size": config["lores"]["size"], "format": "YUV420"},  # Y plane first, read as grayscale
+                    controls=dict(config.get("controls", {}), FrameRate=config["fps"]),
+                    buffer_count=config.get("buffer_count", 6)))
+            else:
+                # Configure the camera specs, without the dual-stream settings Picamera2 does not know
+                self.camera.configure({key: value for key, value in config.items() if key not in self.SOURCE_KEYS})
+            self.camera.start()  # Start the camera
+            time.sleep(warm_up)  # Allow camera to warm up
+        except Exception:
+            self.close()
+            raise
+
+    def _read_frame(self):
+        if not self.dual_stream:
+            return self.camera.capture_array()  # Capture a frame from the camera
+
+        request = self.camera.capture_request()
+        reclaimed = None
+        with self.held_lock:
+            deadline = time.monotonic() + self.hold_timeout
+            self._free_dropped()
+            while not self.gray_buffers:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    reclaimed = next(iter(self.held))  # Every frame still held, take the oldest back
+                    self._release(reclaimed)
+                    break
+                self.held_lock.wait(min(remaining, 0.01))  # Woken by release(), polls for dropped frames
+                self._free_dropped()
+            gray = self.gray_buffers.pop()
+            with self.mapped_array(request, "lores") as mapped:
+                np.copyto(gray, mapped.array[:gray.shape[0], :gray.shape[1]])  # Y plane, no color conversion
+            self.held[self.sequence] = (request, gray)
+        if reclaimed is not None:
+            logger.warning(f"Every camera buffer still held after {self.hold_timeout}s, reclaimed capture {reclaimed}")
+            metrics.increment("full_frames_missed")
+        frame = DualStreamFrame(gray, self.scale, self.sequence, self)
+        self.sequence += 1
+        return frame
+
+    def full_frame(self, sequence):
+        """
+        Copies the full-resolution frame of a held capture
+
+        Args:
+            sequence: DualStreamFrame.sequence of the capture
+
+        Returns:
+            numpy.ndarray: Full-resolution BGR frame, or None if the request was already released
+        """
+        started = time.monotonic()
+        with self.held_lock:
+            frame = self.held[sequence][0].make_array("main") if sequence in self.held else None
+        if frame is None:
+            metrics.increment("full_frames_missed")
+        else:
+            metrics.observe("full_frame", time.monotonic() - started)
+        return frame
+
+    def release_frame(self, sequence):
+        """
+        Releases a capture's camera request and frees its luma buffer, see DualStreamFrame.release
+
+        Args:
+            sequence: DualStreamFrame.sequence of the capture
+        """
+        with self.held_lock:
+            self._release(sequence)
+            self.held_lock.notify()
+
+    def _release(self, sequence):
+        """Releases one held capture, the caller holds held_lock"""
+        held = self.held.pop(sequence, None)
+        if held is not None:  # Otherwise already released, or reclaimed by capture
+            request, gray = held
+            request.release()
+            self.gray_buffers.append(gray)
+
+    def _free_dropped(self):
+        """Releases the captures of garbage collected frames, the caller holds held_lock"""
+        while True:
+            try:
+                self._release(self.dropped_frames.get_nowait())
+            except queue.Empty:
+                return
+
+    def set_frame_rate(self, fps):
+        super().set_frame_rate(fps)
+        frame_duration = int(1000000 / fps)  # Microseconds per frame
+        self.camera.set_controls({"FrameDurationLimits": (frame_duration, frame_duration)})
+
+    def close(self):
+        with self.held_lock:
+            while self.held:
+                self._release(next(iter(self.held)))
+        try:
+            self.camera.stop()
+        finally:
+            self.camera.close()
+
+#------------------------------------------------------------------------------
+# Video File Backend
+#------------------------------------------------------------------------------
+class VideoFileSource(FrameSource):
+    """Recorded video (or any OpenCV VideoCapture URL), replayed at its own frame rate or as fast as possible"""
+
+    def __init__(self, path, realtime=True, loop=False, fps=None):
+        """
+        Args:
+            path: Video file path
+            realtime: Pace frames at the video frame rate
+            loop: Restart from the beginning at the end of the file
+            fps: Override for the frame rate stored in the file
+        """
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise OSError(f"Cannot open video {path}")
+        super().__init__(fps or self.capture.get(cv2.CAP_PROP_FPS) or camera_config["fps"], realtime)
+        self.path = path
+        self.loop = loop
+
+    def _read_frame(self):
+        ok, frame = self.capture.read()
+        if not ok and self.loop:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.capture.read()
+        return frame if ok else None
+
+    def _skip_frame(self):
+        ok = self.capture.grab()  # Advances without decoding the frame
+        if not ok and self.loop:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok = self.capture.grab()
+        return ok
+
+    def close(self):
+        self.capture.release()
+
+#------------------------------------------------------------------------------
+# Image Directory Backend
+#------------------------------------------------------------------------------
+class ImageDirectorySource(FrameSource):
+    """Directory of still images, replayed in file name order"""
+
+    def __init__(self, path, realtime=True, loop=False, fps=None):
+        """
+        Args:
+            path: Directory of images
+            realtime: Pace frames at fps
+            loop: Restart from the first image after the last one
+            fps: Replay frame rate, defaults to the camera frame rate
+        """
+        super().__init__(fps or camera_config["fps"], realtime)
+        self.paths = [os.path.join(path, name) for name in sorted(os.listdir(path))
+                      if name.lower().endswith(IMAGE_EXTENSIONS)]
+        if not self.paths:
+            raise OSError(f"No images found in {path}")
+        self.loop = loop
+        self.next_path = 0  # Index into paths of the next image
+
+    def _read_frame(self):
+        for _ in range(len(self.paths)):
+            if not self._advance():
+                return None
+            path = self.paths[self.next_path - 1]
+            frame = cv2.imread(path)  # BGR, like the camera
+            if frame is not None:
+                return frame
+            logger.warning(f"Skipping unreadable image {path}")
+        return None
+
+    def _skip_frame(self):
+        return self._advance()  # No need to decode an image that is skipped
+
+    def _advance(self):
+        """Moves to the next image path, wrapping around when looping, False once exhausted"""
+        if self.next_path >= len(self.paths):
+            if not self.loop:
+                return False
+            self.next_path = 0
+        self.next_path += 1
+        return True
+
+#------------------------------------------------------------------------------
+# Factory
+#------------------------------------------------------------------------------
+def open_frame_source(source_config=frame_source_config):
+    """
+    Opens the frame source described by a frame_source_config dictionary
+
+    Args:
+        source_config: {"type": "picamera" | "video" | "images", "path": ..., "realtime": ..., "loop": ..., "fps": ...,
+            "camera": Pi camera index}
+
+    Returns:
+        FrameSource: The opened source
+    """
+    source_type = source_config.get("type", "picamera")
+    realtime = source_config.get("realtime", True)
+    loop = source_config.get("loop", False)
+    fps = source_config.get("fps")
+    if source_type == "picamera":
+        return PicameraSource(camera_num=source_config.get("camera", 0))
+    if source_type == "video":
+        return VideoFileSource(source_config["path"], realtime, loop, fps)
+    if source_type == "images":
+        return ImageDirectorySource(source_config["path"], realtime, loop, fps)
+    raise ValueError(f"Unknown frame source type {source_type}")
@@ -0,0 +1,582 @@
+"""
+gallery.py
+
+This script holds the in-memory gallery of authorized face encodings and
+matches a probe encoding against all of them in one vectorized pass.
+
+Galleries can be stored as float32, float16 or int8 with a scale per row
+(GALLERY_DTYPE). Quantized rows stay quantized in memory and distances are
+computed from them directly, a cache-sized block at a time, so a large
+gallery needs a half or a quarter of the RAM and memory bandwidth.
+"""
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+import logging  # For logging events and errors
+import os       # For atomic file replacement
+import sys      # For command line arguments
+import json     # For handling JSON data
+import struct   # For packing the binary gallery header
+import numpy as np  # For numerical operations
+from config import *  # Import all configuration variables from config.py
+
+#------------------------------------------------------------------------------
+# Logging
+#------------------------------------------------------------------------------
+logger = logging.getLogger(__name__)  # Get a logger instance for this module
+
+#------------------------------------------------------------------------------
+# Quantization
+#------------------------------------------------------------------------------
+GALLERY_DTYPES = {"float32": "<f4", "float16": "<f2", "int8": "i1"}  # Name -> stored row dtype
+INT8_LEVELS = 127  # Symmetric int8 range, -127..127, so a row's scale is its peak magnitude / 127
+
+
+def quantize(encodings, dtype):
+    """
+    Converts float encodings to a gallery storage dtype
+
+    Args:
+        encodings: Array-like of shape (N, 128)
+        dtype: "float32", "float16" or "int8"
+
+    Returns:
+        tuple: (stored rows, float32 per-row scales for int8, otherwise None)
+    """
+    encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+    if dtype not in GALLERY_DTYPES:
+        raise ValueError(f"Unknown gallery dtype {dtype}, expected one of {', '.join(GALLERY_DTYPES)}")
+    if dtype != "int8":
+        return np.ascontiguousarray(encodings, dtype=GALLERY_DTYPES[dtype]), None
+    peaks = np.abs(encodings).max(axis=1)
+    scales = np.where(peaks > 0, peaks / INT8_LEVELS, 1.0).astype(np.float32)
+    rows = np.clip(np.rint(encodings / scales[:, None]), -INT8_LEVELS, INT8_LEVELS).astype(np.int8)
+    return rows, scales
+
+
+def dequantize(rows, scales=None):
+    """
+    Converts stored gallery rows back to float32
+
+    Args:
+        rows: Stored rows of shape (N, 128)
+        scales: Per-row scales of int8 rows, None for float rows
+
+    Returns:
+        numpy.ndarray: float32 encodings of shape (N, 128)
+    """
+    encodings = np.asarray(rows, dtype=np.float32)
+    if scales is not None:
+        encodings = encodings * np.asarray(scales, dtype=np.float32)[:, None]
+    return encodings
+
+#------------------------------------------------------------------------------
+# Face Gallery
+#------------------------------------------------------------------------------
+class FaceGallery:
+    """
+    Authorized face encodings packed for fast matching
+
+    Attributes:
+        encodings: Contiguous matrix of shape (N, 128), float32, float16 or int8
+        names: Array of N identity names, parallel to the rows of encodings
+        norms: Precomputed squared L2 norm of every (dequantized) row of encodings
+        scales: float32 scale of every int8 row, None for float rows
+        dtype: "float32", "float16" or "int8"
+    """
+
+    def __init__(self, encodings, names, norms=None, scales=None):
+        """
+        Args:
+            encodings: Array-like of shape (N, 128) holding the face encodings, float16
+                and int8 arrays are kept as they are
+            names: Sequence of N identity names, one per encoding row
+            norms: Optional precomputed squared norms, computed here when omitted
+            scales: Per-row scales, required for int8 encodings
+        """
+        encodings = np.asarray(encodings)
+        if encodings.dtype == np.int8:
+            if scales is None:
+                raise ValueError("int8 gallery encodings need per-row scales")
+            self.dtype = "int8"
+            self.scales = np.asarray(scales, dtype=np.float32)
+        else:
+            self.dtype = "float16" if encodings.dtype == np.float16 else "float32"
+            self.scales = None
+            encodings = encodings.astype(np.float32, copy=False) if self.dtype == "float32" else encodings
+        self.encodings = np.ascontiguousarray(encodings).reshape(-1, ENCODING_SIZE)
+        self.names = np.asarray(names, dtype=object)
+        if len(self.names) != len(self.encodings):
+            raise ValueError("Gallery names and encodings must have the same length")
+        if norms is None:
+            rows = self.float_encodings()
+            norms = np.einsum("ij,ij->i", rows, rows)  # Squared norm per row, computed once
+        self.norms = np.asarray(norms, dtype=np.float32)
+        self.index = None  # Optional approximate nearest neighbour index, see attach_index
+
+    @classmethod
+    def from_dict(cls, encodings_dict):
+        """
+        Builds a gallery from the {name: encoding list} layout of authorized_faces.json
+
+        Args:
+            encodings_dict: Dictionary of authorized face encodings
+
+        Returns:
+            FaceGallery: Gallery holding every entry of encodings_dict
+        """
+        names = list(encodings_dict.keys())
+        encodings = np.array([encodings_dict[name] for name in names], dtype=np.float32)
+        return cls(encodings.reshape(-1, ENCODING_SIZE), names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def float_encodings(self, rows=None):
+        """
+        Returns gallery rows as float32, e.g. to build an index or re-save them
+
+        Args:
+            rows: Optional row numbers or slice, all rows when omitted
+
+        Returns:
+            numpy.ndarray: float32 encodings
+        """
+        if rows is None:
+            rows = slice(None)
+        return dequantize(self.encodings[rows], None if self.scales is None else self.scales[rows])
+
+    def quantized(self, dtype):
+        """
+        Returns a copy of the gallery stored as another dtype
+
+        Args:
+            dtype: "float32", "float16" or "int8"
+
+        Returns:
+            FaceGallery: Gallery with the same names and requantized rows
+        """
+        rows, scales = quantize(self.float_encodings(), dtype)
+        return FaceGallery(rows, self.names, scales=scales)
+
+    def nbytes(self):
+        """Bytes held by the rows, norms and scales, the part that grows with the gallery"""
+        return self.encodings.nbytes + self.norms.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def attach_index(self, index):
+        """
+        Routes matching through an approximate nearest neighbour index
+
+        Args:
+            index: IVFIndex built from this gallery
+
+        Returns:
+            bool: True if the index was attached, False if it was built from a different gallery
+        """
+        from ann_index import gallery_fingerprint  # Imported here, the index module is optional
+        if index.fingerprint != gallery_fingerprint(self):
+            logger.warning("ANN index does not match the loaded gallery, using brute-force matching")
+            return False
+        self.index = index
+        return True
+
+    def distances(self, face_encoding, rows=None):
+        """
+        Computes the Euclidean distance from a probe encoding to gallery rows
+
+        Uses ||a - b||^2 = ||a||^2 + ||b||^2 - 2ab so the whole gallery is one
+        matrix-vector product against the precomputed norms. Quantized rows
+        are multiplied in blocks of GALLERY_BLOCK_ROWS, each converted to
+        float32 while it is still in cache, and int8 products are rescaled
+        afterwards (s * q . p), so the quantized matrix is never expanded.
+
+        Args:
+            face_encoding: Probe encoding of shape (128,)
+            rows: Optional array of row numbers to restrict the pass to
+
+        Returns:
+            numpy.ndarray: float32 distances of shape (N,), or (len(rows),) when rows is given
+        """
+        probe = np.asarray(face_encoding, dtype=np.float32)
+        encodings, norms, scales = self.encodings, self.norms, self.scales
+        if rows is not None:
+            encodings, norms = encodings[rows], norms[rows]
+            scales = scales[rows] if scales is not None else None
+        products = encodings @ probe if self.dtype == "float32" else _blocked_products(encodings, probe, scales)
+        squared = norms + np.dot(probe, probe) - 2.0 * products
+        np.maximum(squared, 0.0, out=squared)  # Clamp rounding error below zero before the square root
+        return np.sqrt(squared, out=squared)
+
+    def match(self, face_encoding):
+        """
+        Finds the closest identity to a probe encoding
+
+        With an index attached only the candidate rows it returns are scored,
+        but their distances are still exact so the TOLERANCE check is unchanged.
+
+        Args:
+            face_encoding: Probe encoding of shape (128,)
+
+        Returns:
+            tuple: (name, distance, margin) of the closest identity, where margin is the
+                distance gap to the closest different identity (inf if there is none),
+                or (None, inf, inf) if the gallery is empty
+        """
+        if len(self) == 0:
+            return None, float("inf"), float("inf")
+
+        rows = self.index.candidates(face_encoding) if self.index is not None else None
+        if rows is not None and len(rows) == 0:
+            return None, float("inf"), float("inf")
+        distances = self.distances(face_encoding, rows)
+        names = self.names if rows is None else self.names[rows]
+
+        best_index = int(np.argmin(distances))
+        name = names[best_index]
+        best_distance = float(distances[best_index])
+
+        # Margin is measured against the closest row that belongs to someone else
+        others = distances[names != name]
+        margin = float(others.min()) - best_distance if len(others) else float("inf")
+        return name, best_distance, margin
+
+
+def _blocked_products(encodings, probe, scales=None):
+    """
+    Computes encodings @ probe for float16 or int8 rows one block at a time
+
+    Args:
+        encodings: Quantized rows of shape (N, 128)
+        probe: float32 probe of shape (128,)
+        scales: Per-row int8 scales, None for float16
+
+    Returns:
+        numpy.ndarray: float32 products of shape (N,)
+    """
+    products = np.empty(len(encodings), dtype=np.float32)
+    block = np.empty((min(GALLERY_BLOCK_ROWS, len(encodings)), ENCODING_SIZE), dtype=np.float32)
+    for start in range(0, len(encodings), GALLERY_BLOCK_ROWS):
+        rows = encodings[start:start + GALLERY_BLOCK_ROWS]
+        converted = block[:len(rows)]
+        np.copyto(converted, rows, casting="unsafe")  # Small enough to stay in cache for the product
+        np.dot(converted, probe, out=products[start:start + len(rows)])
+    if scales is not None:
+        products *= scales
+    return products
+
+
+#------------------------------------------------------------------------------
+# Binary Gallery Format
+#
+# Layout (little-endian):
+# - 64 byte header: magic, format version, dtype code, count, dimension and the
+#   byte offsets of every block below
+# - Embedding block: count x dimension float32, float16 or int8 (dtype code),
+#   64 byte aligned, memory-mappable
+# - Norm block: count float32 squared norms, so loading needs no computation
+# - Names table: (count + 1) uint32 byte offsets followed by a UTF-8 blob
+# - Metadata: UTF-8 JSON object (creation source, free-form fields)
+# - Scale block (version 2, int8 only): count float32 row scales, 64 byte aligned
+#
+# Version 1 files are float32 and their scale offset is the zero padding.
+#------------------------------------------------------------------------------
+GALLERY_MAGIC = b"FIDG"
+GALLERY_FORMAT_VERSION = 2
+GALLERY_HEADER = struct.Struct("<4sHHIIQQQQQ")  # magic, version, dtype, count, dim, 5 block offsets
+GALLERY_HEADER_SIZE = 64
+GALLERY_ALIGNMENT = 64
+DTYPE_FLOAT32 = 0
+DTYPE_FLOAT16 = 1
+DTYPE_INT8 = 2
+DTYPE_CODES = {"float32": DTYPE_FLOAT32, "float16": DTYPE_FLOAT16, "int8": DTYPE_INT8}
+
+
+def _align(offset):
+    """Rounds a byte offset up to the next GALLERY_ALIGNMENT boundary"""
+    return (offset + GALLERY_ALIGNMENT - 1) // GALLERY_ALIGNMENT * GALLERY_ALIGNMENT
+
+
+class GalleryWriter:
+    """
+    Streams rows into a binary gallery file
+
+    Rows are appended to a temporary file as they arrive, and close() writes
+    the norms, names and header before moving the file into place with
+    os.replace, so a running reader never sees a half written gallery.
+    Rows are quantized to the writer's dtype as they are added.
+
+    Usage:
+        with GalleryWriter(path) as writer:
+            writer.add(name, encoding)
+    """
+
+    def __init__(self, path, metadata=None, dtype=GALLERY_DTYPE):
+        """
+        Args:
+            path: Destination file path
+            metadata: Optional dictionary stored in the metadata block
+            dtype: Storage dtype of the rows, "float32", "float16" or "int8"
+        """
+        if dtype not in GALLERY_DTYPES:
+            raise ValueError(f"Unknown gallery dtype {dtype}, expected one of {', '.join(GALLERY_DTYPES)}")
+        self.path = path
+        self.temp_path = f"{path}.tmp"
+        self.metadata = metadata or {}
+        self.dtype = dtype
+        self.names = []
+        self.norms = []
+        self.scales = []
+        self.encodings_offset = _align(GALLERY_HEADER_SIZE)
+        self.gallery_file = open(self.temp_path, "wb")
+        self.gallery_file.seek(self.encodings_offset)  # Header is written last, once the counts are known
+
+    def __len__(self):
+        return len(self.names)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def add(self, name, encoding):
+        """
+        Appends one row
+
+        Args:
+            name: Identity name of the row
+            encoding: Face encoding of shape (128,)
+        """
+        self.add_rows([name], np.asarray(encoding).reshape(1, ENCODING_SIZE))
+
+    def add_rows(self, names, encodings, norms=None):
+        """
+        Appends a block of rows, e.g. rows reused from an existing gallery
+
+        Args:
+            names: Sequence of identity names
+            encodings: Float array of shape (len(names), 128)
+            norms: Optional precomputed squared norms, only used by float32 writers
+        """
+        block, scales = quantize(encodings, self.dtype)
+        if norms is None or self.dtype != "float32":
+            stored = dequantize(block, scales)  # Norms of the rows as matched, not of the originals
+            norms = np.einsum("ij,ij->i", stored, stored)
+        self.gallery_file.write(block.astype(GALLERY_DTYPES[self.dtype], copy=False).tobytes())
+        self.names.extend(str(name) for name in names)
+        self.norms.extend(float(norm) for norm in norms)
+        if scales is not None:
+            self.scales.extend(float(scale) for scale in scales)
+
+    def close(self):
+        """Writes the remaining blocks and header and moves the file into place"""
+        count = len(self.names)
+        encoded_names = [name.encode("utf-8") for name in self.names]
+        name_offsets = np.zeros(count + 1, dtype="<u4")
+        name_offsets[1:] = np.cumsum([len(name) for name in encoded_names], dtype=np.uint64)
+
+        row_size = ENCODING_SIZE * np.dtype(GALLERY_DTYPES[self.dtype]).itemsize
+        norms_offset = _align(self.encodings_offset + count * row_size)
+        names_offset = _align(norms_offset + count * 4)
+        metadata = json.dumps(self.metadata).encode("utf-8")
+        metadata_offset = names_offset + name_offsets.nbytes + int(name_offsets[-1])
+        scales_offset = _align(metadata_offset + len(metadata)) if self.dtype == "int8" else 0
+
+        gallery_file = self.gallery_file
+        gallery_file.seek(norms_offset)
+        gallery_file.write(np.asarray(self.norms, dtype="<f4").tobytes())
+        gallery_file.seek(names_offset)
+        gallery_file.write(name_offsets.tobytes())
+        gallery_file.write(b"".join(encoded_names))
+        gallery_file.write(metadata)
+        if scales_offset:
+            gallery_file.seek(scales_offset)
+            gallery_file.write(np.asarray(self.scales, dtype="<f4").tobytes())
+        gallery_file.seek(0)
+        header = GALLERY_HEADER.pack(GALLERY_MAGIC, GALLERY_FORMAT_VERSION, DTYPE_CODES[self.dtype], count,
+                                     ENCODING_SIZE, self.encodings_offset, norms_offset, names_offset,
+                                     metadata_offset, scales_offset)
+        gallery_file.write(header.ljust(GALLERY_HEADER_SIZE, b"\0"))
+        gallery_file.flush()
+        os.fsync(gallery_file.fileno())  # Make sure the data is on disk before the rename
+        gallery_file.close()
+        os.replace(self.temp_path, self.path)
+        logger.info(f"Saved {count} faces to {self.path} ({self.dtype})")
+
+    def abort(self):
+        """Discards the partially written file, leaving any existing gallery untouched"""
+        self.gallery_file.close()
+        try:
+            os.remove(self.temp_path)
+        except OSError:
+            pass
+
+
+def save_gallery(gallery, path, metadata=None, dtype=GALLERY_DTYPE):
+    """
+    Writes a gallery to the binary gallery format
+
+    Args:
+        gallery: FaceGallery to write
+        path: Destination file path
+        metadata: Optional dictionary stored in the metadata block
+        dtype: Storage dtype of the rows, "float32", "float16" or "int8"
+    """
+    with GalleryWriter(path, metadata, dtype) as writer:
+        writer.add_rows(gallery.names, gallery.float_encodings(), gallery.norms if gallery.dtype == "float32" else None)
+
+
+def read_gallery_metadata(path):
+    """
+    Reads the metadata block of a binary gallery file
+
+    Args:
+        path: Binary gallery file path
+
+    Returns:
+        dict: Metadata stored with the gallery
+    """
+    with open(path, "rb") as gallery_file:
+        header = _read_header(gallery_file.read(GALLERY_HEADER_SIZE), path)
+        gallery_file.seek(header["metadata_offset"])
+        end = header["scales_offset"] or None  # The scale block follows the metadata in int8 files
+        metadata = gallery_file.read() if end is None else gallery_file.read(end - header["metadata_offset"])
+        return json.loads(metadata.rstrip(b"\0").decode("utf-8") or "{}")
+
+
+def _read_header(raw_header, path):
+    """
+    Unpacks and validates a binary gallery header
+
+    Args:
+        raw_header: First GALLERY_HEADER_SIZE bytes of the file
+        path: File path, used in error messages
+
+    Returns:
+        dict: Header fields
+    """
+    if len(raw_header) < GALLERY_HEADER.size:
+        raise ValueError(f"{path} is too short to be a gallery file")
+    magic, version, dtype_code, count, dim, encodings_offset, norms_offset, names_offset, metadata_offset, \
+        scales_offset = GALLERY_HEADER.unpack_from(raw_header)
+    if magic != GALLERY_MAGIC:
+        raise ValueError(f"{path} is not a gallery file")
+    if version > GALLERY_FORMAT_VERSION:
+        raise ValueError(f"{path} uses gallery format version {version}, newest supported is {GALLERY_FORMAT_VERSION}")
+    dtype = {code: name for name, code in DTYPE_CODES.items()}.get(dtype_code)
+    if dtype is None or dim != ENCODING_SIZE or (dtype == "int8" and not scales_offset):
+        raise ValueError(f"{path} has unsupported encoding layout (dtype {dtype_code}, dimension {dim})")
+    return {
+        "version": version,
+        "dtype": dtype,
+        "count": count,
+        "encodings_offset": encodings_offset,
+        "norms_offset": norms_offset,
+        "names_offset": names_offset,
+        "metadata_offset": metadata_offset,
+        "scales_offset": scales_offset,
+    }
+
+
+def load_gallery(path):
+    """
+    Loads a binary gallery file without parsing the embeddings
+
+    The embedding, norm and scale blocks are memory-mapped read-only, so only
+    the pages touched by matching are ever read from disk. Rows keep the
+    dtype they were stored with.
+
+    Args:
+        path: Binary gallery file path
+
+    Returns:
+        FaceGallery: Gallery backed by the memory-mapped file
+    """
+    with open(path, "rb") as gallery_file:
+        header = _read_header(gallery_file.read(GALLERY_HEADER_SIZE), path)
+        count = header["count"]
+
+        # Names table is small, read it directly
+        gallery_file.seek(header["names_offset"])
+        name_offsets = np.frombuffer(gallery_file.read(4 * (count + 1)), dtype="<u4")
+        blob = gallery_file.read(int(name_offsets[-1]) if count else 0)
+        names = [blob[name_offsets[i]:name_offsets[i + 1]].decode("utf-8") for i in range(count)]
+
+    if count == 0:
+        return FaceGallery(np.empty((0, ENCODING_SIZE), dtype=np.float32), [])
+
+    encodings = np.memmap(path, dtype=GALLERY_DTYPES[header["dtype"]], mode="r", offset=header["encodings_offset"],
+                          shape=(count, ENCODING_SIZE))
+    norms = np.memmap(path, dtype="<f4", mode="r", offset=header["norms_offset"], shape=(count,))
+    scales = None
+    if header["dtype"] == "int8":
+        scales = np.memmap(path, dtype="<f4", mode="r", offset=header["scales_offset"], shape=(count,))
+    return FaceGallery(encodings, names, norms, scales)
+
+
+def convert_json_gallery(json_path, gallery_path, dtype=GALLERY_DTYPE):
+    """
+    Converts an authorized_faces.json file to the binary gallery format
+
+    Args:
+        json_path: Source JSON file of {name: encoding list}
+        gallery_path: Destination binary gallery file
+        dtype: Storage dtype of the rows, "float32", "float16" or "int8"
+
+    Returns:
+        FaceGallery: The converted gallery
+    """
+    with open(json_path, "r") as json_file:
+        gallery = FaceGallery.from_dict(json.load(json_file))
+    save_gallery(gallery, gallery_path, {"source": os.path.basename(json_path)}, dtype)
+    return gallery
+
+
+def resolve_gallery_file(gallery_path=GALLERY_FILE, json_path=AUTHORIZED_FACES_JSON):
+    """
+    Picks the gallery file to load. The binary gallery is used unless the JSON
+    gallery is newer (edited by hand or by an older tool), in which case the
+    binary gallery is rebuilt from it first.
+
+    Args:
+        gallery_path: Binary gallery file
+        json_path: Legacy JSON gallery file
+
+    Returns:
+        str: gallery_path, json_path if the binary gallery could not be rebuilt, or None if neither exists
+    """
+    try:
+        json_mtime = os.stat(json_path).st_mtime_ns
+    except OSError:
+        json_mtime = None
+    try:
+        gallery_mtime = os.stat(gallery_path).st_mtime_ns
+    except OSError:
+        gallery_mtime = None
+    if json_mtime is None or (gallery_mtime is not None and gallery_mtime >= json_mtime):
+        return gallery_path if gallery_mtime is not None else None
+    try:
+        convert_json_gallery(json_path, gallery_path)
+        logger.info(f"Rebuilt {gallery_path} from the newer {json_path}")
+        return gallery_path
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Cannot rebuild {gallery_path} from {json_path}, loading the JSON gallery: {e}")
+        return json_path
+
+
+#------------------------------------------------------------------------------
+# Command Line
+#------------------------------------------------------------------------------
+if __name__ == "__main__":
+    # Usage: python gallery.py [authorized_faces.json] [authorized_faces.fidg] [float32|float16|int8]
+    from audit_log import configure_logging  # For the converter's log writer
+    configure_logging()
+    json_path = sys.argv[1] if len(sys.argv) > 1 else AUTHORIZED_FACES_JSON
+    gallery_path = sys.argv[2] if len(sys.argv) > 2 else GALLERY_FILE
+    dtype = sys.argv[3] if len(sys.argv) > 3 else GALLERY_DTYPE
+    converted = convert_json_gallery(json_path, gallery_path, dtype)
+    print(f"Converted {len(converted)} faces from {json_path} to {gallery_path} ({dtype})")
@@ -0,0 +1,190 @@
+"""
+gallery_watcher.py
+
+This script reloads the authorized gallery while the lock keeps running.
+A background thread watches the gallery (and its ANN index) on disk, loads a
+changed version, carries the index over to it and swaps the new gallery in
+with a single reference assignment, so every verification sees either the
+old gallery or the new one, never a mix.
+"""
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+import json     # For reloading the legacy JSON gallery
+import logging  # For logging events and errors
+import os       # For watching the gallery files
+import threading  # For the background watcher thread
+from gallery import FaceGallery, load_gallery, resolve_gallery_file  # Import vectorized gallery of authorized faces
+from config import *  # Import all configuration variables from config.py
+
+#------------------------------------------------------------------------------
+# Logging
+#------------------------------------------------------------------------------
+logger = logging.getLogger(__name__)  # Get a logger instance for this module
+
+#------------------------------------------------------------------------------
+# Live Gallery
+#------------------------------------------------------------------------------
+class LiveGallery:
+    """
+    Swappable reference to the current FaceGallery
+
+    Galleries are never modified once published. match() reads `current`
+    once and runs entirely on that snapshot, so a swap during a verification
+    cannot mix rows from two versions.
+
+    Attributes:
+        current: The published FaceGallery
+        version: Incremented on every swap
+        on_swap: Callables run after every swap, e.g. to drop cached identities
+    """
+
+    def __init__(self, gallery):
+        self.current = gallery
+        self.version = 0
+        self.on_swap = []
+
+    def __len__(self):
+        return len(self.current)
+
+    def match(self, face_encoding):
+        """Matches against the gallery published when the call started, see FaceGallery.match"""
+        return self.current.match(face_encoding)
+
+    def swap(self, gallery):
+        """
+        Publishes a new gallery
+
+        Args:
+            gallery: Fully built FaceGallery, including its index
+        """
+        self.current = gallery  # Single reference assignment, atomic for readers
+        self.version += 1
+        for callback in self.on_swap:
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Error in gallery swap callback: {e}")
+
+#------------------------------------------------------------------------------
+# Gallery Watcher
+#------------------------------------------------------------------------------
+class GalleryWatcher:
+    """
+    Background thread that polls the gallery files and hot-swaps changes
+
+    Both the binary and the legacy JSON gallery are watched. After a change
+    the file gallery.resolve_gallery_file picks is loaded, the same one a
+    restart would load: a newer JSON is converted to the binary gallery
+    first. The binary gallery is memory-mapped, so a reload only maps the new file.
+    If the loaded gallery had an ANN index, the index is carried over with
+    IVFIndex.remapped (unchanged rows keep their list, new rows join the
+    nearest one) until encode_faces.py writes a freshly built index file.
+    """
+
+    def __init__(self, live_gallery, gallery_path=GALLERY_FILE, json_path=AUTHORIZED_FACES_JSON,
+                 index_path=ANN_INDEX_FILE, interval=GALLERY_RELOAD_INTERVAL):
+        """
+        Args:
+            live_gallery: LiveGallery to publish reloaded galleries to
+            gallery_path: Binary gallery file to watch
+            json_path: Legacy JSON gallery file to watch
+            index_path: ANN index file to watch
+            interval: Seconds between checks
+        """
+        self.live_gallery = live_gallery
+        self.gallery_path = gallery_path
+        self.json_path = json_path
+        self.index_path = index_path
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.gallery_stamp = self._gallery_stamp()
+        self.index_stamp = self._stamp(index_path)
+
+    def start(self):
+        """Starts the watcher thread"""
+        self.thread = threading.Thread(target=self._run, name="gallery-watcher", daemon=True)
+        self.thread.start()
+        logger.info(f"Watching {self.gallery_path} and {self.json_path} for changes every {self.interval}s")
+
+    def stop(self):
+        """Stops the watcher thread"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=self.interval * 2)
+
+    def check(self):
+        """
+        Reloads the gallery or index if either changed on disk
+
+        Returns:
+            bool: True if a new gallery was published
+        """
+        gallery_stamp = self._gallery_stamp()
+        index_stamp = self._stamp(self.index_path)
+        if gallery_stamp == self.gallery_stamp and index_stamp == self.index_stamp:
+            return False
+        if gallery_stamp == (None, None):
+            return False  # Gallery missing, most likely mid-replace, keep serving the current one
+
+        try:
+            old_gallery = self.live_gallery.current
+            if gallery_stamp != self.gallery_stamp:
+                new_gallery = self._load_gallery()
+                gallery_stamp = self._gallery_stamp()  # The binary gallery changes when it is rebuilt from the JSON
+            else:
+                new_gallery = FaceGallery(old_gallery.encodings, old_gallery.names, old_gallery.norms,
+                                          old_gallery.scales)  # Same rows, new index
+            self._attach_index(old_gallery, new_gallery)
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Problem reloading {self.gallery_path}, keeping the current gallery: {e}")
+            return False  # Retried on the next check, the stamps are not advanced
+
+        self.gallery_stamp, self.index_stamp = gallery_stamp, index_stamp
+        self.live_gallery.swap(new_gallery)
+        logger.info(f"Reloaded gallery: {len(old_gallery)} -> {len(new_gallery)} faces "
+                    f"(version {self.live_gallery.version})")
+        return True
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"Error watching gallery: {e}")
+
+    def _load_gallery(self):
+        """Loads whichever gallery file resolve_gallery_file picks"""
+        path = resolve_gallery_file(self.gallery_path, self.json_path)
+        if path is None:
+            raise OSError(f"Neither {self.gallery_path} nor {self.json_path} found")
+        if path == self.json_path:
+            with open(path, "r") as json_file:
+                return FaceGallery.from_dict(json.load(json_file))
+        return load_gallery(path)
+
+    def _gallery_stamp(self):
+        """Stamps of the binary and the JSON gallery"""
+        return self._stamp(self.gallery_path), self._stamp(self.json_path)
+
+    def _attach_index(self, old_gallery, new_gallery):
+        """Gives the new gallery the on-disk index if it matches, else the old index carried over"""
+        if not ANN_ENABLED:
+            return
+        if os.path.exists(self.index_path):
+            from ann_index import IVFIndex  # Imported here, the index is optional
+            if new_gallery.attach_index(IVFIndex.load(self.index_path)):
+                return
+        if old_gallery.index is not None:
+            new_gallery.attach_index(old_gallery.index.remapped(old_gallery, new_gallery))
+
+    @staticmethod
+    def _stamp(path):
+        """Identity of a file version: inode, size and modification time, or None if missing"""
+        try:
+            status = os.stat(path)
+            return (status.st_ino, status.st_size, status.st_mtime_ns)
+        except OSError:
+            return None
@@ -0,0 +1,230 @@
+"""
+latency_controller.py
+
+This script adapts the detection settings to the board at runtime. The
+detection loop reports how long each frame took from capture to detection
+result; every LATENCY_CONTROL_WINDOW frames the controller compares the
+window's p95 with LATENCY_TARGET, reads the CPU temperature and load, and
+moves one setting by one step within its configured bounds:
+- over budget: raise scaleFactor, then lower the detection scale, then
+  lengthen the frame interval
+- CPU hot or overloaded: lengthen the frame interval to shed heat and load
+- well under budget on a cool CPU for LATENCY_RELAX_WINDOWS windows in a
+  row: undo the most recent cheapening, so settings only ever return
+  toward their starting values
+
+Only settings that change the cost for the detector and camera in use are
+stepped (see adjustable_settings); the Haar cascade alone honours
+scaleFactor, and dual-stream frames ignore the detection scale. The
+detection scale never drops below the scale at which the detector still finds
+minSize faces (detectors.detection_scale), so a detector that needs the full
+frame is never downscaled.
+
+Every adjustment is logged and counted, and the current settings are
+exported as gauges.
+"""
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+import collections  # For the adjustment history
+import logging  # For logging events and errors
+import os       # For the load average and CPU count
+import threading  # For guarding the controller state
+import time     # For timing operations
+from detectors import detection_scale as min_detection_scale  # For the smallest scale a detector keeps its faces at
+from metrics import metrics  # Import per-stage latency metrics
+from config import *  # Import all configuration variables from config.py
+
+#------------------------------------------------------------------------------
+# Logging
+#------------------------------------------------------------------------------
+logger = logging.getLogger(__name__)  # Get a logger instance for this module
+
+#------------------------------------------------------------------------------
+# CPU State
+#------------------------------------------------------------------------------
+def read_cpu_state(temp_file=CPU_TEMP_FILE):
+    """
+    Reads the CPU temperature and load
+
+    Args:
+        temp_file: sysfs thermal zone reporting millidegrees Celsius
+
+    Returns:
+        tuple: (temperature in Celsius or None, 1-minute load average per core or None)
+    """
+    try:
+        with open(temp_file, "r") as thermal_zone:
+            temperature = int(thermal_zone.read().strip()) / 1000.0
+    except (OSError, ValueError):
+        temperature = None  # Not a Pi, or no thermal zone exposed
+    try:
+        load = os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (OSError, AttributeError):
+        load = None
+    return temperature, load
+
+#------------------------------------------------------------------------------
+# Latency Controller
+#------------------------------------------------------------------------------
+class LatencyController:
+    """
+    Steps the frame interval, detection scale and scaleFactor toward LATENCY_TARGET
+
+    Read the current settings from frame_interval, detection_scale and
+    scale_factor before each frame and report the frame's latency with
+    observe(). Several detect threads may share one controller.
+
+    Attributes:
+        frame_interval: Seconds to wait between frames
+        detection_scale: Downscale factor passed to detect_faces
+        scale_factor: Haar cascade scaleFactor passed to detect_faces
+        adjustable: Settings the controller steps, the others keep their starting value
+        adjustments: Number of adjustments made so far
+        history: Most recent adjustments as (time.time(), setting, old value, new value, reason)
+    """
+
+    # Cheapest quality loss first
+    SETTINGS = ("scale_factor", "detection_scale", "frame_interval")
+
+    def __init__(self, target=LATENCY_TARGET, window=LATENCY_CONTROL_WINDOW, frame_interval=FRAME_INTERVAL,
+                 enabled=LATENCY_CONTROL_ENABLED, cpu_state=read_cpu_state, adjustable=SETTINGS,
+                 detection_scale=DETECTION_SCALE, min_scale=None):
+        """
+        Args:
+            target: p95 seconds from capture to detection result to stay under
+            window: Frames observed per decision
+            frame_interval: Starting frame interval, clamped to FRAME_INTERVAL_BOUNDS
+            enabled: False keeps the starting settings and only measures
+            cpu_state: Callable returning (temperature, load), replaceable to simulate a hot board
+            adjustable: Settings to step, see adjustable_settings
+            detection_scale: Starting detection scale, see detectors.detection_scale (None starts at 1.0)
+            min_scale: Smallest detection scale to step down to, detectors.detection_scale(face_detector, None)
+                keeps the detector's smallest faces; None allows DETECTION_SCALE_BOUNDS[0]
+        """
+        self.target = target
+        self.window = window
+        self.enabled = enabled
+        self.cpu_state = cpu_state
+        self.adjustable = tuple(setting for setting in self.SETTINGS if setting in adjustable)
+        self.frame_interval = min(max(frame_interval, FRAME_INTERVAL_BOUNDS[0]), FRAME_INTERVAL_BOUNDS[1])
+        self.detection_scale = min(max(1.0 if detection_scale is None else detection_scale,
+                                       DETECTION_SCALE_BOUNDS[0]), DETECTION_SCALE_BOUNDS[1])
+        self.scale_factor = cascade_classifier_config.get("scaleFactor", 1.1)
+        # A configured DETECTION_SCALE under min_scale is the floor instead, it is never raised
+        smallest_scale = max(DETECTION_SCALE_BOUNDS[0], min(self.detection_scale, min_scale or 0.0))
+        self.bounds = {
+            "scale_factor": (SCALE_FACTOR_BOUNDS, SCALE_FACTOR_STEP),  # Larger is cheaper
+            "detection_scale": ((DETECTION_SCALE_BOUNDS[1], smallest_scale), -DETECTION_SCALE_STEP),  # Smaller is cheaper
+            "frame_interval": (FRAME_INTERVAL_BOUNDS, FRAME_INTERVAL_STEP),  # Longer is cheaper
+        }
+        self.samples = []
+        self.adjustments = 0
+        self.history = collections.deque(maxlen=LATENCY_HISTORY)
+        self.cheapened = []  # (setting, value before) of every cheapening step not yet undone, newest last
+        self.calm_windows = 0  # Consecutive windows well under budget
+        self.last_p95 = None
+        self.temperature = None
+        self.load = None
+        self.lock = threading.Lock()
+
+    def register_gauges(self, registry=metrics):
+        """
+        Exports the current settings and CPU state as gauges
+
+        Args:
+            registry: Metrics registry, e.g. a door's
+        """
+        registry.set_gauge("frame_interval_s", lambda: self.frame_interval)
+        registry.set_gauge("detection_scale", lambda: self.detection_scale)
+        registry.set_gauge("scale_factor", lambda: self.scale_factor)
+        registry.set_gauge("frame_latency_p95_s", lambda: self.last_p95 if self.last_p95 is not None else float("nan"))
+        registry.set_gauge("cpu_temperature_c", lambda: self.temperature if self.temperature is not None else float("nan"))
+
+    def settings(self):
+        """Current settings as a dictionary"""
+        return {setting: getattr(self, setting) for setting in self.SETTINGS}
+
+    def observe(self, latency):
+        """
+        Reports the latency of one frame, adjusting a setting once a window is full
+
+        Args:
+            latency: Seconds from frame capture to detection result
+
+        Returns:
+            bool: True if a setting was adjusted
+        """
+        metrics.observe("frame_latency", latency)
+        with self.lock:
+            self.samples.append(latency)
+            if len(self.samples) < self.window:
+                return False
+            samples, self.samples = sorted(self.samples), []
+            self.last_p95 = samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))]
+            self.temperature, self.load = self.cpu_state()
+            if not self.enabled:
+                return False
+            return self._decide()
+
+    def _decide(self):
+        """Moves at most one setting by one step, the caller holds the lock"""
+        hot = self.temperature is not None and self.temperature >= CPU_TEMP_LIMIT
+        busy = self.load is not None and self.load >= CPU_LOAD_LIMIT
+        state = (f"p95 {self.last_p95 * 1000:.0f} ms, target {self.target * 1000:.0f} ms"
+                 + (f", {self.temperature:.1f} C" if self.temperature is not None else "")
+                 + (f", load {self.load:.2f}" if self.load is not None else ""))
+
+        calm = self.last_p95 < self.target * LATENCY_HEADROOM and not (hot or busy)
+        self.calm_windows = self.calm_windows + 1 if calm else 0
+        if self.last_p95 > self.target:
+            return any(self._cheapen(setting, f"over budget ({state})") for setting in self.adjustable)
+        if hot or busy:
+            return "frame_interval" in self.adjustable and self._cheapen(
+                "frame_interval", f"CPU {'hot' if hot else 'overloaded'} ({state})")
+        if self.calm_windows >= LATENCY_RELAX_WINDOWS and self.cheapened:
+            self.calm_windows = 0
+            setting, value = self.cheapened.pop()  # Undo the most recent cheapening first
+            self._set(setting, value, f"under budget ({state})")
+            return True
+        return False
+
+    def _cheapen(self, setting, reason):
+        """Moves one setting a step cheaper within its bounds, False if already at the bound"""
+        (dearest, cheapest), step = self.bounds[setting]
+        old = getattr(self, setting)
+        low, high = min(dearest, cheapest), max(dearest, cheapest)
+        new = round(min(max(old + step, low), high), 4)
+        if new == round(old, 4):
+            return False
+        self.cheapened.append((setting, old))
+        self._set(setting, new, reason)
+        return True
+
+    def _set(self, setting, new, reason):
+        """Applies, logs and counts one adjustment"""
+        old = getattr(self, setting)
+        setattr(self, setting, new)
+        self.adjustments += 1
+        self.history.append((time.time(), setting, old, new, reason))
+        metrics.increment("latency_adjustments")
+        logger.info(f"Latency controller: {setting} {old:.3g} -> {new:.3g}, {reason}")
+
+
+def adjustable_settings(face_detector, camera=None):
+    """
+    Controller settings that change the detection cost for a detector and camera
+
+    Args:
+        face_detector: Detector from detectors.create_face_detector
+        camera: FrameSource frames come from, None for plain BGR frames
+
+    Returns:
+        tuple: Names from LatencyController.SETTINGS, in their order
+    """
+    adjustable = set(getattr(face_detector, "adjustable", ())) | {"frame_interval"}
+    # Downscaling a detector that needs full resolution for its smallest faces would only lose faces
+    if (camera is None or camera.downscalable) and min_detection_scale(face_detector, None) < 1.0:
+        adjustable.add("detection_scale")
+    return tuple(setting for setting in LatencyController.SETTINGS if setting in adjustable)
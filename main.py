@@ -8,9 +8,26 @@ Authors:
 Modules:
 - main.py - Main module for running the face recognition system, handles flow of execution
 - authorized_faces.json - List of authurized faces in kew-value pairs
+- authorized_faces.fidg - Binary, memory-mapped gallery of authorized faces (see gallery.py)
+- gallery.py - Vectorized face gallery and its binary file format
+- ann_index.py - Optional IVF approximate nearest neighbour index for large galleries
+- gallery_watcher.py - Hot reload of the gallery without restarting the lock
+- benchmark.py - Benchmarks for detection, verification and matching latency (JSON results per commit)
 - config.py - Configuration variables and settings
 - faceID.py - Face recognition and verification
-- serial_comm.py - Serial communication with the Arduino
+- detectors.py - Haar cascade, dlib HOG and OpenCV DNN face detector backends
+- access_events.py - Indexed SQLite store of verification outcomes with a query CLI
+- latency_controller.py - Adapts frame interval, detection scale and scaleFactor to a latency target
+- pipeline.py - Staged capture, detection, encoding and matching with stale-frame dropping
+- multi_door.py - Several camera/lock pairs in one process with a fair, shared encoder pool
+- encoder_pool.py - Face encoding in worker processes fed through shared memory
+- tracking.py - Face tracking across frames with a verified-identity cache
+- motion.py - Motion gate that idles detection and the camera on static scenes
+- frame_source.py - Pi camera, video file and image directory frame sources
+- serial_comm.py - Serial worker thread talking to the Arduino (acknowledged commands, heartbeat, reconnect)
+- fake_mcu.py - Pseudo-terminal stand-in for the Arduino, for running without hardware
+- metrics.py - Per-stage latency histograms and counters, served on a localhost Prometheus endpoint
+- audit_log.py - Queued, deduplicated and rotated logging that never drops security events
 - requirements.txt - List of dependencies
 - sys.log - Log file for security auditing, system diagnostics/monitoring, troubleshooting/debugging/exceptions, system status
 
@@ -21,17 +38,34 @@ Secure Facial Recognition Access Control System
 #------------------------------------------------------------------------------
 # Main Module Imports
 #------------------------------------------------------------------------------
+import time                 # For timing operations, first so startup time includes the other imports
+PROCESS_STARTED = time.monotonic()  # Start of the startup-time report
+import argparse             # For command line arguments
+import functools            # For binding a door's serial port to unlock_door
 import cv2                  # For camera vision
-from picamera2 import Picamera2  # For connection to Pi camera module, needs testing in Pi OS
-import time                 # For timing operations  
 import logging              # For logging events and errors
 import json                 # For loading authorized faces
+import os                   # For checking which gallery file exists
 import numpy as np          # For numerical operations
+from concurrent.futures import ThreadPoolExecutor  # For overlapping component initialization
 #------------------------------------------------------------------------------
 # Configuration & Function Imports
 #------------------------------------------------------------------------------
-from faceID import verify_face  # Import face verification function
-from serial_comm import unlock_door  # Import door control function
+from faceID import detect_faces, identify_face, warm_up_encoder, set_encoder_pool, EncodeSkipped  # Import face detection and verification functions
+from pipeline import FacePipeline  # Import staged capture/detect/encode/match pipeline
+from multi_door import DoorSet  # Import multi-door serving with a shared encoder pool
+from encoder_pool import EncoderPool  # Import multi-process face encoding
+from detectors import create_face_detector, detection_scale  # Import Haar / HOG / DNN face detector backends
+from access_events import start_event_store, stop_event_store  # Import indexed access event store
+from latency_controller import LatencyController, adjustable_settings  # Import adaptive frame interval / detection settings
+from tracking import FaceTracker  # Import face tracker with verified-identity cache
+from frame_source import open_frame_source  # Import Pi camera / video / image directory frame sources
+from motion import MotionGate  # Import motion gate for the idle mode
+from gallery import FaceGallery, load_gallery, resolve_gallery_file  # Import vectorized gallery of authorized faces
+from gallery_watcher import LiveGallery, GalleryWatcher  # Import gallery hot reload
+from serial_comm import unlock_door, start_serial_worker, stop_serial_worker  # Import door control and serial worker
+from metrics import metrics, start_exporters, stop_exporters  # Import metrics endpoint and stats file
+from audit_log import SECURITY, configure_logging  # Security event marker and log writer setup
 from config import *  # Import all configuration variables from config.py
 
 #------------------------------------------------------------------------------
@@ -46,46 +80,96 @@ logger.setLevel(logging.DEBUG)  # Set logging level to DEBUG to capture all mess
 #------------------------------------------------------------------------------
 def load_json_file():
     """
-    Loads authorized face encodings from JSON file
+    Loads authorized face encodings from JSON file and packs them into a gallery
     
     Returns:
-        dict: Dictionary of face encodings and their corresponding names, or False if loading fails
+        FaceGallery: Gallery of face encodings and their corresponding names, or False if loading fails
     """
     try:
-        with open("authorized_faces.json", "r") as json_file:
-            encodings_dict = json.load(json_file)
-            return encodings_dict  # encodings_dict is a dictionary of face encodings and their corresponding names
-    except OSError:
-        logger.error("Problem loading authorized_faces.json")
+        with open(AUTHORIZED_FACES_JSON, "r") as json_file:
+            encodings_dict = json.load(json_file)  # encodings_dict is a dictionary of face encodings and their corresponding names
+        gallery = FaceGallery.from_dict(encodings_dict)  # Built once here instead of on every verification
+        logger.info(f"Loaded {len(gallery)} authorized faces from {AUTHORIZED_FACES_JSON}")
+        return gallery
+    except (OSError, ValueError):
+        logger.error(f"Problem loading {AUTHORIZED_FACES_JSON}")
         return False  # Return False if file cannot be loaded
 
+#------------------------------------------------------------------------------
+# Import binary gallery file - memory-mapped, no parsing step
+#------------------------------------------------------------------------------
+def load_gallery_file():
+    """
+    Loads authorized face encodings from the binary gallery file, rebuilding it
+    first when the legacy JSON file is newer (see gallery.resolve_gallery_file)
+    
+    Returns:
+        FaceGallery: Gallery of face encodings and their corresponding names, or False if loading fails
+    """
+    gallery_path = resolve_gallery_file()
+    if gallery_path is None:
+        logger.error(f"Neither {GALLERY_FILE} nor {AUTHORIZED_FACES_JSON} found")
+        return False
+    if gallery_path != GALLERY_FILE:
+        gallery = load_json_file()
+    else:
+        try:
+            gallery = load_gallery(GALLERY_FILE)
+            logger.info(f"Loaded {len(gallery)} authorized faces from {GALLERY_FILE}")
+        except (OSError, ValueError) as e:
+            logger.error(f"Problem loading {GALLERY_FILE}: {e}")
+            return False  # Return False if file cannot be loaded
+    if gallery:
+        load_ann_index(gallery)
+    return gallery
+
+#------------------------------------------------------------------------------
+# Import ANN index - optional, only built for large enrollments
+#------------------------------------------------------------------------------
+def load_ann_index(gallery):
+    """
+    Attaches the IVF index stored next to the gallery, if there is one
+    
+    Args:
+        gallery: Loaded FaceGallery
+        
+    Returns:
+        bool: True if an index was attached, False if matching stays brute-force
+    """
+    if not ANN_ENABLED or not os.path.exists(ANN_INDEX_FILE):
+        return False
+    try:
+        from ann_index import IVFIndex  # Imported here, the index is optional
+        attached = gallery.attach_index(IVFIndex.load(ANN_INDEX_FILE))
+        if attached:
+            logger.info(f"Loaded ANN index {ANN_INDEX_FILE} ({gallery.index.nlist} lists, nprobe {gallery.index.nprobe})")
+        return attached
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Problem loading {ANN_INDEX_FILE}, using brute-force matching: {e}")
+        return False
+
 #------------------------------------------------------------------------------
 # Camera Initialization
 #------------------------------------------------------------------------------
-def initialize_camera():
+def initialize_camera(source_config=frame_source_config):
     """
-    Initializes and configures the Raspberry Pi camera
+    Opens the configured frame source: the Raspberry Pi camera, or a recorded
+    video or image directory for offline runs
     
+    Args:
+        source_config: Frame source settings (frame_source_config is defined in config.py)
+        
     Returns:
-        Picamera2: Configured camera object, or None if initialization fails
+        FrameSource: Opened frame source, or None if initialization fails
     """
     try:
         logger.debug("Initializing camera hardware and configurations...")
-        camera = Picamera2()  # Initialize the camera hardware, resource allocation, and drivers through Picamera2
-        camera.configure(camera_config)  # Configure the camera specs (camera_config is defined in config.py)
-        camera.start()  # Start the camera
-        time.sleep(2)  # Allow camera to warm up
-        logger.info("Camera initialized successfully")
-        return camera  # Return camera object if initialization succeeds
+        camera = open_frame_source(source_config)  # Picamera2 backend configures, starts and warms up the camera
+        logger.info(f"Camera initialized successfully ({type(camera).__name__})")
+        return camera  # Return frame source if initialization succeeds
     except Exception as e:
         logger.warning(f"Error initializing camera: {e}")
         logger.debug("Attempting to restart camera initialization...")
-        # Stop and clean up camera resources if they exist
-        try:
-            camera.stop()
-            camera.close()
-        except:
-            pass  # Camera may not have been initialized, do nothing
         return None  # Return None if camera initialization fails
 
 #------------------------------------------------------------------------------
@@ -93,52 +177,91 @@ def initialize_camera():
 #------------------------------------------------------------------------------
 def initialize_face_detector():
     """
-    Initializes the OpenCV face detector using Haar Cascade Classifier
+    Initializes the face detector backend selected in face_detector_config
     
     Returns:
-        cv2.CascadeClassifier: Configured face detector, or None if initialization fails
+        HaarDetector, HogDetector or DnnDetector: Configured face detector, or None if initialization fails
     """
     try:
         logger.debug("Initializing face detector...")
-        face_detector = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")  # cv2 + cascade classifier file path
-        logger.info("Cascade classifier initialized successfully")
+        face_detector = create_face_detector()
+        logger.info(f"Face detector initialized successfully ({face_detector.name})")
         return face_detector  # Return face detector if initialization succeeds
     except Exception as e:
-        logger.warning(f"Error initializing cascade classifier: {e}")
+        logger.warning(f"Error initializing face detector: {e}")
         logger.debug("Attempting to restart face detector initialization...")
-        return None  # Return None if cascade classifier initialization fails
+        return None  # Return None if face detector initialization fails
 
 #------------------------------------------------------------------------------
 # Face Detection Loop
 #------------------------------------------------------------------------------
-def detect_face(camera, face_detector, encodings_dict):
+def detect_face(camera, face_detector, gallery, door=None, serial_port=SERIAL_PORT):
     """
     Continuously monitors camera feed for faces and verifies them against authorized faces
     
     Args:
-        camera: Initialized camera object
+        camera: Opened FrameSource
         face_detector: Initialized face detector
-        encodings_dict: Dictionary of authorized face encodings
+        gallery: FaceGallery of authorized face encodings
+        door: Door name recorded with every access event, None for the METRICS_LABELS door
+        serial_port: Serial port of the door's lock controller
     """
+    unlock = functools.partial(unlock_door, serial_port)  # The lock of this door, not necessarily SERIAL_PORT
+    tracker = FaceTracker()  # Follows faces across frames and caches their verified identity
+    if isinstance(gallery, LiveGallery):
+        gallery.on_swap.append(tracker.forget_identities)  # A reloaded gallery may have revoked someone
+    motion_gate = MotionGate(camera)  # Skips detection and idles the camera while nothing moves
+
+    if PIPELINE_ENABLED:
+        # Run capture, detection, encoding and matching as overlapping stages
+        FacePipeline(camera, face_detector, gallery, initialize_face_detector, tracker, motion_gate,
+                     unlock=unlock, door=door).run_forever()
+        return
+
+    logger.debug("Initializing face detection...")
+    # Trades detection cost for latency as the board heats up or cools down
+    controller = LatencyController(adjustable=adjustable_settings(face_detector, camera),
+                                   detection_scale=detection_scale(face_detector),
+                                   min_scale=detection_scale(face_detector, None))
+    controller.register_gauges()
     while True:
         try:            
-            logger.debug("Initializing face detection...")
             face_found = np.empty((0, 4))  # Will store detected faces from detectMultiScale with shape (0,4)
             while (len(face_found) != 1):  # Ensure only one face is in frame for safety, ensuring no forced entry
-                frame = camera.capture_array()  # Capture a frame from the camera
-                face_found = face_detector.detectMultiScale(cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY), **cascade_classifier_config)  # Detect faces in the frame
-                time.sleep(0.1)  # Add small delay to prevent CPU overload during continuous frame capture
-
-            logger.debug("Face detected, beginning facial verification...")  # Break in face count logic when face is detected
-            if verify_face(frame, face_found[0], encodings_dict):  # Check if the face in the frame is authorized
-                logger.info("Unlocking door...") 
-                if unlock_door():  # If the face is authorized, unlock the door
-                    logger.info("Door unlocked successfully")
+                frame = camera.read()  # Capture a frame from the frame source
+                captured_at = time.monotonic()
+                if frame is None:
+                    logger.info("Frame source exhausted, stopping face detection")
+                    return
+                if not motion_gate.check(frame):  # Static scene, nobody to detect
+                    time.sleep(motion_gate.idle_delay())
+                    continue
+                face_found = detect_faces(face_detector, frame, controller.detection_scale, controller.scale_factor)  # Detect faces in the frame
+                controller.observe(time.monotonic() - captured_at)
+                time.sleep(controller.frame_interval)  # Delay between frames, lengthened when the board is slow or hot
+
+            track = tracker.update(face_found)[0]
+            if not tracker.needs_verification(track):
+                continue  # Same face as a recent verification, reuse the cached identity
+
+            logger.debug(f"Face detected (track {track.track_id}), beginning facial verification...")  # Break in face count logic when face is detected
+            try:
+                name = identify_face(frame, face_found[0], gallery, door, captured_at)
+            except EncodeSkipped:
+                tracker.cancel(track)  # Nothing was decided, the next frame of the face retries
+                continue
+            if name is not None:  # Check if the face in the frame is authorized
+                logger.info("Unlocking door...", extra=SECURITY)
+                if unlock():  # If the face is authorized, unlock the door
+                    logger.info("Door unlocked successfully", extra=SECURITY)
+                    tracker.record(track, name, face_found[0])
                 else:
-                    logger.error("Failed to unlock door, retry face verification")
+                    logger.error("Failed to unlock door, retry face verification", extra=SECURITY)
+                    tracker.cancel(track)  # Not cached, the next frame verifies again
 
             else:
-                logger.warning("Unauthorized face detected, continuing to monitor...")
+                logger.warning("Unauthorized face detected, continuing to monitor...", extra=SECURITY)
+                tracker.record(track, None, face_found[0])
                 # Continue monitoring
 
         except Exception as e:
@@ -148,63 +271,233 @@ def detect_face(camera, face_detector, encodings_dict):
             # Continue the loop
             
 
+#------------------------------------------------------------------------------
+# Component Initialization With Retries
+#------------------------------------------------------------------------------
+def initialize_camera_with_retries(source_config=frame_source_config):
+    """
+    Opens the frame source, MAX_ATTEMPTS attempts maximum
+    
+    Returns:
+        FrameSource: Opened frame source, or None if every attempt failed
+    """
+    for _ in range(MAX_ATTEMPTS):
+        camera = initialize_camera(source_config)
+        if camera is not None:
+            return camera
+        time.sleep(0.1)  # Add small delay between initialization attempts
+    return None
+
+
+def initialize_face_detector_with_retries():
+    """
+    Loads the face detector, MAX_ATTEMPTS attempts maximum
+    
+    Returns:
+        Face detector from initialize_face_detector, or None if every attempt failed
+    """
+    for _ in range(MAX_ATTEMPTS):
+        face_detector = initialize_face_detector()
+        if face_detector is not None:
+            return face_detector
+        time.sleep(0.1)  # Add small delay between initialization attempts
+    return None
+
+
+def connect_serial(port=SERIAL_PORT, door=None):
+    """
+    Starts the serial worker and waits up to SERIAL_STARTUP_WAIT for the door controller
+    
+    Args:
+        port: Serial port of the door controller
+        door: Door name for multi-door setups
+        
+    Returns:
+        bool: True if the controller answered, otherwise the worker keeps reconnecting in the background
+    """
+    worker = start_serial_worker(port, door=door)
+    return worker.connected_once.wait(SERIAL_STARTUP_WAIT)
+
+
+def start_encoder():
+    """
+    Starts the ENCODER_PROCESSES encoding processes, or warms up dlib in this
+    process when the pool is disabled or fails to start
+    
+    Returns:
+        EncoderPool: The started pool, or True when encoding runs in this process
+    """
+    if ENCODER_PROCESSES:
+        pool = EncoderPool(ENCODER_PROCESSES)
+        if pool.start():
+            set_encoder_pool(pool)
+            return pool
+        logger.error("Encoder pool failed to start, encoding in the main process instead")
+        pool.stop()
+    warm_up_encoder()  # Loads dlib models and warms caches
+    return True
+
+#------------------------------------------------------------------------------
+# Overlapped Startup
+#------------------------------------------------------------------------------
+def start_components(door_configs):
+    """
+    Initializes the independent components concurrently and logs how long each took
+    
+    The camera warm-up, cascade load, gallery load, dlib model load and serial
+    connect do not depend on each other, so time-to-ready is the slowest of
+    them instead of their sum.
+    
+    Args:
+        door_configs: Doors to start, entries of the doors list in config.py
+        
+    Returns:
+        dict: "gallery", "face_detector", "encoder", "camera:<door>" and
+        "serial:<door>" results, None for a component that failed
+    """
+    timings = {"imports": time.monotonic() - PROCESS_STARTED}
+    started = time.monotonic()
+
+    def timed_component(name, function, *args):
+        component_started = time.monotonic()
+        try:
+            return function(*args)
+        except Exception as e:
+            logger.error(f"Error initializing {name}: {e}")
+            return None
+        finally:
+            timings[name] = time.monotonic() - component_started
+            metrics.observe(f"startup_{name.split(':')[0]}", timings[name])
+
+    components = {
+        "gallery": (load_gallery_file,),
+        "face_detector": (initialize_face_detector_with_retries,),
+        "encoder": (start_encoder,),  # Loads dlib models in the encoder processes and warms caches
+    }
+    multi_door = len(door_configs) > 1
+    for door in door_configs:
+        components[f"camera:{door['name']}"] = (initialize_camera_with_retries, door["source"])
+        components[f"serial:{door['name']}"] = (connect_serial, door["serial_port"], door["name"] if multi_door else None)
+    with ThreadPoolExecutor(max_workers=len(components), thread_name_prefix="startup") as pool:
+        futures = {name: pool.submit(timed_component, name, *task) for name, task in components.items()}
+        results = {name: future.result() for name, future in futures.items()}
+
+    timings["ready"] = time.monotonic() - PROCESS_STARTED
+    metrics.observe("startup_ready", timings["ready"])
+    logger.info("Startup report: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items())
+                + f" (components overlapped in {time.monotonic() - started:.2f}s)")
+    for door in door_configs:
+        if not results[f"serial:{door['name']}"]:
+            logger.warning(f"Door controller for {door['name']} not answering yet, reconnecting in the background")
+    return results
+
 #------------------------------------------------------------------------------
 # Main Program Execution
 #------------------------------------------------------------------------------
-def main():
+def main(source_config=frame_source_config, door_configs=None):
     """
     Main function that orchestrates the entire face recognition system
+    
+    Args:
+        source_config: Frame source settings, the Pi camera unless a replay is requested
+        door_configs: Doors to serve (the doors list in config.py), None runs a single
+            door on source_config and SERIAL_PORT
     """
-    camera = None
+    configure_logging()  # Starts the log writer, importing config.py does not
+    if not door_configs:
+        door_configs = [{"name": METRICS_LABELS.get("door", "front"), "source": source_config, "serial_port": SERIAL_PORT}]
+    cameras = {}
+    components = {}
+    gallery_watcher = None
+    metrics_exporters = start_exporters()  # Localhost metrics endpoint and/or stats file
+    start_event_store()  # Indexed store of verification outcomes for audit queries
     try:
-        # Load JSON file, return dictionary of face encodings and their corresponding names
-        encodings_dict = load_json_file()
-        if not encodings_dict:
+        # Gallery, cameras, face detector, encoder models and serial links initialize concurrently
+        components = start_components(door_configs)
+        cameras = {door["name"]: components[f"camera:{door['name']}"] for door in door_configs
+                   if components[f"camera:{door['name']}"] is not None}
+        gallery = components["gallery"]
+        face_detector = components["face_detector"]
+
+        if not gallery:
             logger.critical("Failed to load authorized faces. Exiting program.")
             return
-        
-        # Initialize camera, 3 attempts maximum
-        initialization_attempts = 0
-        while initialization_attempts < MAX_ATTEMPTS:
-            camera = initialize_camera()
-            # Break if camera is initialized successfully
-            if camera is not None:
-                break
-            initialization_attempts += 1
-            time.sleep(0.1)  # Add small delay between initialization attempts
-        # If camera is not initialized after 3 attempts, exit program gracefully
-        if camera is None:
+        # If a camera is not initialized after 3 attempts, exit program gracefully
+        if len(cameras) < len(door_configs):
             logger.critical("Camera initialization failed after 3 attempts. Exiting program.")
             return
-        
-        # Initialize face detector, 3 attempts maximum
-        face_detector_attempts = 0
-        while face_detector_attempts < MAX_ATTEMPTS:
-            face_detector = initialize_face_detector()
-            # Break if face detector is initialized successfully
-            if face_detector is not None:
-                break
-            face_detector_attempts += 1
-            time.sleep(0.1)  # Add small delay between initialization attempts
         # If face detector is not initialized after 3 attempts, exit program gracefully
         if face_detector is None:
             logger.critical("Face detector initialization failed after 3 attempts. Exiting program.")
             return
 
-        # Begin face detection loop with the loaded encodings_dict
-        detect_face(camera, face_detector, encodings_dict)
+        # Publish the gallery through a swappable reference so changes on disk load without a restart
+        gallery = LiveGallery(gallery)
+        if GALLERY_RELOAD_ENABLED:
+            gallery_watcher = GalleryWatcher(gallery)  # Watches both gallery files, loads the one startup would
+            gallery_watcher.start()
+
+        if len(door_configs) == 1:
+            # Begin face detection loop with the loaded gallery
+            door = door_configs[0]
+            detect_face(cameras[door["name"]], face_detector, gallery, door["name"], door["serial_port"])
+        else:
+            # Every door gets its own detection loop, sharing the gallery and the encoder pool
+            doors = {door["name"]: (cameras[door["name"]], door["serial_port"]) for door in door_configs}
+            DoorSet(doors, gallery, initialize_face_detector).run_forever()
     except Exception as e:
         logger.critical(f"Unexpected error in main program: {e}")
     finally:
         # Clean up resources
-        if camera is not None:
+        stop_exporters(metrics_exporters)
+        stop_event_store()
+        stop_serial_worker()
+        if isinstance(components.get("encoder"), EncoderPool):
+            set_encoder_pool(None)
+            components["encoder"].stop()
+        if gallery_watcher is not None:
+            gallery_watcher.stop()
+        for camera in cameras.values():
             logger.info("Cleaning up camera resources...")
             try:
-                camera.stop()
                 camera.close()
                 logger.info("Camera resources released successfully")
             except Exception as e:
                 logger.error(f"Error releasing camera resources: {e}")
 
 if __name__ == "__main__":
-    main()
+    # Usage: python main.py [--replay VIDEO_OR_IMAGE_DIR] [--fast] [--loop]
+    #        python main.py --door front=VIDEO_OR_IMAGE_DIR@/dev/ttyUSB0 --door back=... [--fast] [--loop]
+    parser = argparse.ArgumentParser(description="Secure Facial Recognition Access Control System")
+    parser.add_argument("--replay", help="Run on a recorded video file or image directory instead of the Pi camera")
+    parser.add_argument("--door", action="append", help="Serve a door replayed from a video or image directory, "
+                                                        "NAME=PATH[@SERIAL_PORT] (repeatable)")
+    parser.add_argument("--fast", action="store_true", help="Replay as fast as possible instead of in real time")
+    parser.add_argument("--loop", action="store_true", help="Restart the replay when it ends")
+    args = parser.parse_args()
+
+    source_config = dict(frame_source_config)
+    if args.replay:
+        source_config.update({
+            "type": "images" if os.path.isdir(args.replay) else "video",
+            "path": args.replay,
+            "realtime": not args.fast,
+            "loop": args.loop,
+        })
+
+    door_configs = [dict(door) for door in doors] or None
+    if args.replay and door_configs and len(door_configs) == 1:
+        door_configs[0]["source"] = dict(door_configs[0]["source"], **{key: source_config[key] for key in
+                                                                       ("type", "path", "realtime", "loop")})
+    if args.door:
+        door_configs = []
+        for door in args.door:
+            name, _, target = door.partition("=")
+            path, _, serial_port = target.partition("@")
+            door_configs.append({
+                "name": name,
+                "source": dict(source_config, type="images" if os.path.isdir(path) else "video", path=path,
+                               realtime=not args.fast, loop=args.loop),
+                "serial_port": serial_port or SERIAL_PORT,
+            })
+    main(source_config, door_configs)
@@ -0,0 +1,469 @@
+"""
+metrics.py
+
+This script keeps per-stage latency histograms and event counters for the
+lock (capture, color conversion, detection, encoding, matching and the serial
+write) and exposes them on a localhost Prometheus-text endpoint and/or a
+periodically flushed JSON stats file, so a slow stage on a door can be found
+without attaching a profiler.
+"""
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+import bisect   # For finding histogram buckets
+import collections  # For the rolling sample windows
+import json     # For the stats file
+import logging  # For logging events and errors
+import os       # For atomic stats file replacement
+import threading  # For the exporter threads and guarding the metrics
+import time     # For timing operations
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # For the metrics endpoint
+from config import *  # Import all configuration variables from config.py
+
+#------------------------------------------------------------------------------
+# Logging
+#------------------------------------------------------------------------------
+logger = logging.getLogger(__name__)  # Get a logger instance for this module
+
+#------------------------------------------------------------------------------
+# Latency Histogram
+#------------------------------------------------------------------------------
+class LatencyHistogram:
+    """
+    Latency of one stage: cumulative Prometheus buckets plus a rolling window
+    of the most recent samples for current percentiles
+
+    Attributes:
+        bounds: Upper bucket bounds in seconds
+        bucket_counts: Samples per bucket, the last entry counts samples above every bound
+        count: Total number of samples
+        total: Sum of every sample in seconds
+        window: The most recent METRICS_WINDOW samples in seconds
+    """
+
+    def __init__(self, bounds=METRICS_BUCKETS, window=METRICS_WINDOW):
+        self.bounds = tuple(bounds)
+        self.bucket_counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.window = collections.deque(maxlen=window)
+
+    def observe(self, seconds):
+        """Records one sample, the caller holds the registry lock"""
+        self.bucket_counts[bisect.bisect_left(self.bounds, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.window.append(seconds)
+
+    def percentiles(self, quantiles=(0.5, 0.95, 0.99)):
+        """
+        Percentiles of the rolling window
+
+        Returns:
+            dict: {quantile: seconds}, empty if no samples were recorded
+        """
+        samples = sorted(self.window)
+        if not samples:
+            return {}
+        return {q: samples[min(len(samples) - 1, int(q * len(samples)))] for q in quantiles}
+
+#------------------------------------------------------------------------------
+# Metrics Registry
+#------------------------------------------------------------------------------
+class Metrics:
+    """
+    Stage latency histograms and event counters shared by every module
+
+    Recording is a perf_counter call and a few additions under one lock, cheap
+    enough to leave on in the hot loop. Stages and counters are created on
+    first use, so new instrumentation needs no registration.
+    """
+
+    def __init__(self, labels=None):
+        """
+        Args:
+            labels: Labels added to every exported series, e.g. {"door": "front"}
+        """
+        self.labels = dict(labels or {})
+        self.stages = {}
+        self.counters = collections.OrderedDict((name, 0) for name in METRICS_COUNTERS)
+        self.gauges = {}  # name -> callable returning the current value, read at export time
+        self.started_at = time.time()
+        self.lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        """
+        Records the latency of one run of a stage
+
+        Args:
+            stage: Stage name, e.g. "detect"
+            seconds: Elapsed time in seconds
+        """
+        if not METRICS_ENABLED:
+            return
+        with self.lock:
+            histogram = self.stages.get(stage)
+            if histogram is None:
+                histogram = self.stages[stage] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    def increment(self, counter, amount=1):
+        """
+        Adds to an event counter
+
+        Args:
+            counter: Counter name, e.g. "unlocks"
+            amount: Amount to add
+        """
+        if not METRICS_ENABLED:
+            return
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    def set_gauge(self, gauge, function):
+        """
+        Registers a gauge whose value is read when the metrics are exported
+
+        Args:
+            gauge: Gauge name, e.g. "encode_queue_depth"
+            function: Callable returning the current value
+        """
+        with self.lock:
+            self.gauges[gauge] = function
+
+    def timer(self, stage):
+        """
+        Context manager timing the enclosed block as one run of a stage
+
+        Usage:
+            with metrics.timer("detect"):
+                faces = face_detector.detectMultiScale(gray)
+        """
+        return _StageTimer(self, stage)
+
+    def snapshot(self):
+        """
+        Copies the current metrics into plain data
+
+        Returns:
+            dict: Counters and, per stage, count, mean and rolling p50/p95/p99 in milliseconds
+        """
+        with self.lock:
+            stages = {}
+            for stage, histogram in self.stages.items():
+                percentiles = histogram.percentiles()
+                stages[stage] = {
+                    "count": histogram.count,
+                    "mean_ms": 1000.0 * histogram.total / histogram.count if histogram.count else 0.0,
+                    "p50_ms": 1000.0 * percentiles.get(0.5, 0.0),
+                    "p95_ms": 1000.0 * percentiles.get(0.95, 0.0),
+                    "p99_ms": 1000.0 * percentiles.get(0.99, 0.0),
+                }
+            return {
+                "labels": self.labels,
+                "uptime_s": time.time() - self.started_at,
+                "counters": dict(self.counters),
+                "gauges": {gauge: _read_gauge(function) for gauge, function in self.gauges.items()},
+                "stages": stages,
+            }
+
+    def render_prometheus(self):
+        """Formats this registry alone, see render_prometheus"""
+        return render_prometheus([self])
+
+
+def render_prometheus(registries):
+    """
+    Formats registries in the Prometheus text exposition format
+
+    Every metric family is written once with the series of all registries
+    under it, told apart by their labels (e.g. one registry per door).
+
+    Args:
+        registries: Metrics instances to export
+
+    Returns:
+        str: faceid_<counter>_total counters, faceid_<gauge> gauges, the
+        faceid_stage_latency_seconds histogram and rolling
+        faceid_stage_latency_recent_seconds quantiles
+    """
+    for registry in registries:
+        registry.lock.acquire()
+    try:
+        lines = []
+        counters = list(dict.fromkeys(name for registry in registries for name in registry.counters))
+        for counter in counters:
+            lines.append(f"# TYPE faceid_{counter}_total counter")
+            for registry in registries:
+                lines.append(f"faceid_{counter}_total{_labels(registry.labels)} {registry.counters.get(counter, 0)}")
+
+        gauges = list(dict.fromkeys(name for registry in registries for name in registry.gauges))
+        for gauge in gauges:
+            lines.append(f"# TYPE faceid_{gauge} gauge")
+            for registry in registries:
+                if gauge in registry.gauges:
+                    lines.append(f"faceid_{gauge}{_labels(registry.labels)} {_read_gauge(registry.gauges[gauge])}")
+
+        lines.append("# TYPE faceid_stage_latency_seconds histogram")
+        for registry in registries:
+            for stage, histogram in registry.stages.items():
+                stage_labels = dict(registry.labels, stage=stage)
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.bounds, histogram.bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f"faceid_stage_latency_seconds_bucket{_labels(stage_labels, le=repr(bound))} {cumulative}")
+                lines.append(f"faceid_stage_latency_seconds_bucket{_labels(stage_labels, le='+Inf')} {histogram.count}")
+                lines.append(f"faceid_stage_latency_seconds_sum{_labels(stage_labels)} {histogram.total:.6f}")
+                lines.append(f"faceid_stage_latency_seconds_count{_labels(stage_labels)} {histogram.count}")
+
+        lines.append("# TYPE faceid_stage_latency_recent_seconds gauge")
+        for registry in registries:
+            for stage, histogram in registry.stages.items():
+                for quantile, seconds in histogram.percentiles().items():
+                    lines.append(f"faceid_stage_latency_recent_seconds"
+                                 f"{_labels(dict(registry.labels, stage=stage), quantile=str(quantile))} {seconds:.6f}")
+        return "\n".join(lines) + "\n"
+    finally:
+        for registry in registries:
+            registry.lock.release()
+
+
+class _StageTimer:
+    """Context manager returned by Metrics.timer"""
+    __slots__ = ("metrics", "stage", "started")
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.stage, time.perf_counter() - self.started)
+        return False
+
+
+def _labels(labels, **extra):
+    """Formats a Prometheus label set, e.g. {door="front",stage="detect"}"""
+    merged = dict(labels, **extra)
+    if not merged:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in merged.items()) + "}"
+
+
+def _read_gauge(function):
+    """Current value of a gauge, NaN if reading it fails"""
+    try:
+        return float(function())
+    except Exception:
+        return float("nan")
+
+#------------------------------------------------------------------------------
+# Per-Door Routing
+#------------------------------------------------------------------------------
+class MetricsRouter:
+    """
+    The `metrics` object every module records into
+
+    Records go to the registry bound to the calling thread, or to the default
+    registry. With several doors in one process each door's threads bind that
+    door's registry, so the shared capture/detect/encode code is attributed
+    to the right door without passing registries around.
+    """
+
+    def __init__(self, default):
+        self.default = default
+        self.registries = [default]
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def for_door(self, door):
+        """
+        Registry of a door, created on first use
+
+        Args:
+            door: Door name, exported as the door label
+
+        Returns:
+            Metrics: The door's registry
+        """
+        with self.lock:
+            for registry in self.registries:
+                if registry.labels.get("door") == door:
+                    return registry
+            registry = Metrics(dict(self.default.labels, door=door))
+            self.registries.append(registry)
+            return registry
+
+    def bind(self, registry):
+        """Sends the calling thread's records to a registry, None restores the default"""
+        self.local.registry = registry
+
+    def current(self):
+        """Registry the calling thread records into"""
+        return getattr(self.local, "registry", None) or self.default
+
+    def observe(self, stage, seconds):
+        self.current().observe(stage, seconds)
+
+    def increment(self, counter, amount=1):
+        self.current().increment(counter, amount)
+
+    def set_gauge(self, gauge, function):
+        self.current().set_gauge(gauge, function)
+
+    def timer(self, stage):
+        return _StageTimer(self.current(), stage)
+
+    def snapshot(self):
+        """Snapshot of the default registry, plus every door's under "doors" when there are several"""
+        snapshot = self.default.snapshot()
+        if len(self.registries) > 1:
+            snapshot["doors"] = {registry.labels.get("door"): registry.snapshot() for registry in self.registries[1:]}
+        return snapshot
+
+    def render_prometheus(self):
+        return render_prometheus(list(self.registries))
+
+
+metrics = MetricsRouter(Metrics(METRICS_LABELS))  # Process-wide metrics every module records into
+
+#------------------------------------------------------------------------------
+# Prometheus Endpoint
+#------------------------------------------------------------------------------
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """Serves /metrics (Prometheus text) and /stats.json (Metrics.snapshot)"""
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            body = self.server.metrics.render_prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        elif self.path == "/stats.json":
+            body = json.dumps(self.server.metrics.snapshot(), indent=2).encode("utf-8")
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes every few seconds would flood sys.log
+
+
+class MetricsServer:
+    """Localhost HTTP endpoint for Prometheus scrapes, served from a background thread"""
+
+    def __init__(self, registry=metrics, host=METRICS_HOST, port=METRICS_PORT):
+        """
+        Args:
+            registry: Metrics to serve
+            host: Address to bind, localhost by default so the endpoint is not exposed on the network
+            port: TCP port
+        """
+        self.server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        self.server.daemon_threads = True
+        self.server.metrics = registry
+        self.thread = None
+
+    def start(self):
+        """Starts serving"""
+        self.thread = threading.Thread(target=self.server.serve_forever, name="metrics-server", daemon=True)
+        self.thread.start()
+        host, port = self.server.server_address[:2]
+        logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+    def stop(self):
+        """Stops serving and closes the socket"""
+        self.server.shutdown()
+        self.server.server_close()
+
+#------------------------------------------------------------------------------
+# Stats File
+#------------------------------------------------------------------------------
+class StatsFileWriter:
+    """Background thread writing Metrics.snapshot() to a JSON file at a fixed interval"""
+
+    def __init__(self, registry=metrics, path=METRICS_STATS_FILE, interval=METRICS_FLUSH_INTERVAL):
+        """
+        Args:
+            registry: Metrics to write
+            path: Stats file path, replaced atomically on every flush
+            interval: Seconds between flushes
+        """
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        """Starts the writer thread"""
+        self.thread = threading.Thread(target=self._run, name="metrics-stats-file", daemon=True)
+        self.thread.start()
+        logger.info(f"Writing stats to {self.path} every {self.interval}s")
+
+    def stop(self):
+        """Stops the writer thread after a final flush"""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=self.interval * 2)
+        self.flush()
+
+    def flush(self):
+        """Writes the current snapshot"""
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, "w") as stats_file:
+                json.dump(self.registry.snapshot(), stats_file, indent=2)
+            os.replace(temp_path, self.path)  # Readers never see a half-written file
+        except OSError as e:
+            logger.warning(f"Error writing stats file {self.path}: {e}")
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            self.flush()
+
+#------------------------------------------------------------------------------
+# Exporters
+#------------------------------------------------------------------------------
+def start_exporters(registry=metrics):
+    """
+    Starts the exporters enabled in config.py
+
+    Args:
+        registry: Metrics to export
+
+    Returns:
+        list: Started exporters, each with a stop() method
+    """
+    exporters = []
+    if not METRICS_ENABLED:
+        return exporters
+    if METRICS_PORT:
+        try:
+            server = MetricsServer(registry)
+            server.start()
+            exporters.append(server)
+        except OSError as e:
+            logger.warning(f"Error starting metrics endpoint on port {METRICS_PORT}: {e}")
+    if METRICS_STATS_FILE:
+        writer = StatsFileWriter(registry)
+        writer.start()
+        exporters.append(writer)
+    return exporters
+
+
+def stop_exporters(exporters):
+    """Stops exporters returned by start_exporters"""
+    for exporter in exporters:
+        try:
+            exporter.stop()
+        except Exception as e:
+            logger.error(f"Error stopping metrics exporter: {e}")
@@ -0,0 +1,123 @@
+"""
+motion.py
+
+This script gates face detection on motion. A tiny grayscale thumbnail of
+every frame is compared against a running-average background, and while the
+hallway stays static detection is skipped and the camera drops to a low idle
+frame rate until motion returns.
+"""
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+import logging  # For logging events and errors
+import time     # For timing operations
+import cv2      # OpenCV for image processing
+import numpy as np  # For numerical operations
+from frame_source import DualStreamFrame  # Import dual-stream camera frames
+from config import *  # Import all configuration variables from config.py
+
+#------------------------------------------------------------------------------
+# Logging
+#------------------------------------------------------------------------------
+logger = logging.getLogger(__name__)  # Get a logger instance for this module
+
+#------------------------------------------------------------------------------
+# Motion Gate
+#------------------------------------------------------------------------------
+class MotionGate:
+    """
+    Frame-differencing gate in front of the face detector
+
+    The gate is active (detection runs) after motion is seen and goes idle
+    after MOTION_IDLE_AFTER seconds without motion. While idle the camera runs
+    at MOTION_IDLE_FPS and the caller sleeps MOTION_IDLE_INTERVAL between
+    checks, which bounds the wake latency.
+
+    Attributes:
+        active: True while detection should run
+        skipped: Number of frames not passed to detection
+    """
+
+    def __init__(self, camera=None):
+        """
+        Args:
+            camera: Optional FrameSource, switched to the idle frame rate while idle
+        """
+        self.camera = camera
+        self.active_fps = getattr(camera, "fps", None) or camera_config["fps"]  # Restored when motion returns
+        self.background = None  # float32 running-average thumbnail
+        self.active = True  # Start active so the first visitor is never delayed by warm-up
+        self.last_motion = time.monotonic()
+        self.skipped = 0
+
+    def check(self, frame):
+        """
+        Updates the background with a frame and decides whether to run detection
+
+        Args:
+            frame: Captured camera frame
+
+        Returns:
+            bool: True if the frame should go to the face detector
+        """
+        if not MOTION_GATE_ENABLED:
+            return True
+
+        now = time.monotonic()
+        moving = self._motion_in(frame)
+        if moving:
+            self.last_motion = now
+            if not self.active:
+                self._wake()
+        elif self.active and now - self.last_motion > MOTION_IDLE_AFTER:
+            self._sleep()
+
+        if not self.active:
+            self.skipped += 1
+        return self.active
+
+    def idle_delay(self):
+        """
+        Seconds the caller should wait before the next frame
+
+        Returns:
+            float: MOTION_IDLE_INTERVAL while idle, 0 while active
+        """
+        return MOTION_IDLE_INTERVAL if MOTION_GATE_ENABLED and not self.active else 0.0
+
+    def _motion_in(self, frame):
+        """True if enough of the thumbnail differs from the background"""
+        if isinstance(frame, DualStreamFrame):
+            frame = frame.gray  # Low-resolution luma, already grayscale
+        # Shrink before the color conversion, the gate only needs a few thousand pixels
+        small = cv2.resize(frame, MOTION_THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+        thumbnail = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY) if small.ndim == 3 else small
+        thumbnail = thumbnail.astype(np.float32)
+
+        if self.background is None:
+            self.background = thumbnail
+            return True
+
+        changed = cv2.absdiff(thumbnail, self.background) > MOTION_PIXEL_THRESHOLD
+        cv2.accumulateWeighted(thumbnail, self.background, MOTION_BACKGROUND_RATE)  # Slowly absorb lighting changes
+        return np.count_nonzero(changed) >= MOTION_AREA_THRESHOLD * changed.size
+
+    def _wake(self):
+        logger.info("Motion detected, resuming face detection")
+        self.active = True
+        self._set_frame_rate(self.active_fps)
+
+    def _sleep(self):
+        logger.info(f"No motion for {MOTION_IDLE_AFTER}s, entering idle mode")
+        self.active = False
+        self._set_frame_rate(MOTION_IDLE_FPS)
+
+    def _set_frame_rate(self, fps):
+        """Asks the frame source for a new frame rate"""
+        if self.camera is None:
+            return
+        try:
+            self.camera.set_frame_rate(fps)
+        except Exception as e:
+            logger.warning(f"Error changing camera frame rate: {e}")
@@ -0,0 +1,213 @@
+"""
+multi_door.py
+
+This script runs several camera/lock pairs ("doors") from one process. Every
+door has its own capture, detection and match threads, its own tracker,
+motion gate and serial worker, while all doors share one gallery and one
+pool of encoding workers. The pool serves the doors round-robin, so a busy
+entrance cannot starve the others.
+"""
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+import collections  # For the per-door encode queues
+import functools  # For binding each door's unlock to its serial port
+import logging  # For logging events and errors
+import threading  # For the shared encoder workers
+import time     # For timing operations
+from pipeline import FacePipeline  # Import staged capture/detect/encode/match pipeline
+from tracking import FaceTracker  # Import face tracker with verified-identity cache
+from motion import MotionGate  # Import motion gate for the idle mode
+from serial_comm import unlock_door, start_serial_worker  # Import door control and serial worker
+from metrics import metrics  # Import per-door metrics routing
+from faceID import encode_worker_count  # Import encode thread sizing for the encoder pool
+from config import *  # Import all configuration variables from config.py
+
+#------------------------------------------------------------------------------
+# Logging
+#------------------------------------------------------------------------------
+logger = logging.getLogger(__name__)  # Get a logger instance for this module
+
+#------------------------------------------------------------------------------
+# Fair Encoder Scheduler
+#------------------------------------------------------------------------------
+class EncoderScheduler:
+    """
+    Pool of encoding workers shared by every door
+
+    Each door has its own latest-wins queue of PIPELINE_QUEUE_SIZE faces.
+    Workers take from the doors in round-robin order, so every door with a
+    face waiting gets a worker within one round no matter how busy the
+    others are, and a flood at one door only replaces that door's own
+    oldest face.
+    """
+
+    def __init__(self, workers=None):
+        """
+        Args:
+            workers: Number of encoding threads shared by the doors, None sizes
+                them to the encoder pool (see faceID.encode_worker_count)
+        """
+        self.workers = workers or encode_worker_count()
+        self.queues = collections.OrderedDict()  # pipeline -> deque of candidates
+        self.dropped_counts = {}  # pipeline -> faces replaced by a newer one before encoding
+        self.next_door = 0  # Round-robin position in self.queues
+        self.condition = threading.Condition()
+        self.stop_event = threading.Event()
+        self.threads = []
+
+    def start(self):
+        """Starts the encoding threads"""
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"encoder-{number}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        logger.info(f"Shared encoder pool started with {self.workers} workers")
+
+    def stop(self):
+        """Stops the encoding threads"""
+        self.stop_event.set()
+        with self.condition:
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join(timeout=PIPELINE_POLL_INTERVAL * 10)
+
+    def register(self, pipeline):
+        """Adds a door's pipeline to the rotation"""
+        with self.condition:
+            self.queues[pipeline] = collections.deque()
+            self.dropped_counts[pipeline] = 0
+
+    def unregister(self, pipeline):
+        """Removes a door's pipeline from the rotation, its queued faces are dropped"""
+        with self.condition:
+            self.queues.pop(pipeline, None)
+
+    def submit(self, pipeline, candidate):
+        """
+        Queues a detected face for encoding, replacing the door's oldest face if its queue is full
+
+        Args:
+            pipeline: FacePipeline the face was detected by
+            candidate: Candidate with face_location set
+        """
+        with self.condition:
+            door_queue = self.queues.get(pipeline)
+            if door_queue is None:
+                return
+            if len(door_queue) >= PIPELINE_QUEUE_SIZE:
+                door_queue.popleft()  # A newer frame of the same door supersedes it
+                self.dropped_counts[pipeline] += 1
+            door_queue.append(candidate)
+            self.condition.notify()
+
+    def depth(self, pipeline):
+        """Faces of a door waiting for a worker"""
+        with self.condition:
+            return len(self.queues.get(pipeline, ()))
+
+    def dropped(self, pipeline):
+        """Faces of a door replaced by a newer one before a worker took them"""
+        with self.condition:
+            return self.dropped_counts.get(pipeline, 0)
+
+    def _next(self):
+        """Takes the next face in round-robin door order, the caller holds the condition"""
+        pipelines = list(self.queues)
+        for offset in range(len(pipelines)):
+            position = (self.next_door + offset) % len(pipelines)
+            door_queue = self.queues[pipelines[position]]
+            if door_queue:
+                self.next_door = position + 1  # The next worker starts with the following door
+                return pipelines[position], door_queue.popleft()
+        return None
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            with self.condition:
+                work = self._next()
+                while work is None and not self.stop_event.is_set():
+                    self.condition.wait(PIPELINE_POLL_INTERVAL)
+                    work = self._next()
+            if work is None:
+                return
+            pipeline, candidate = work
+            metrics.bind(pipeline.metrics)  # Encode timings belong to the door the face came from
+            try:
+                pipeline.encode_candidate(candidate)
+            except Exception as e:
+                logger.warning(f"Error encoding face for door {pipeline.door}: {e}")
+
+#------------------------------------------------------------------------------
+# Door Set
+#------------------------------------------------------------------------------
+class DoorSet:
+    """
+    Every configured door running against one shared gallery and encoder pool
+
+    Attributes:
+        pipelines: {door name: FacePipeline}
+        encoder: Shared EncoderScheduler
+    """
+
+    def __init__(self, doors, gallery, detector_factory):
+        """
+        Args:
+            doors: {door name: (opened FrameSource, serial port)}
+            gallery: Shared gallery (a LiveGallery, so reloads reach every door)
+            detector_factory: Callable returning a new face detector, each door needs its own
+        """
+        self.gallery = gallery
+        self.encoder = EncoderScheduler()
+        self.pipelines = {}
+        for name, (camera, serial_port) in doors.items():
+            tracker = FaceTracker()  # Tracks and cached identities are per camera
+            if hasattr(gallery, "on_swap"):
+                gallery.on_swap.append(tracker.forget_identities)  # A reloaded gallery may have revoked someone
+            start_serial_worker(serial_port, door=name)
+            self.pipelines[name] = FacePipeline(
+                camera, detector_factory(), gallery, detector_factory, tracker, MotionGate(camera),
+                encoder=self.encoder, unlock=functools.partial(unlock_door, serial_port), door=name)
+        self.started_at = None
+
+    def run_forever(self):
+        """Runs every door until all of their frame sources are exhausted"""
+        self.started_at = time.monotonic()
+        self.encoder.start()
+        for pipeline in self.pipelines.values():
+            pipeline.start()
+        try:
+            while any(not pipeline.stop_event.wait(PIPELINE_POLL_INTERVAL * 10) for pipeline in self.pipelines.values()):
+                pass
+        finally:
+            for pipeline in self.pipelines.values():
+                pipeline.stop()
+            self.encoder.stop()
+            self.log_stats()
+
+    def stats(self):
+        """
+        Per-door throughput and queue depth
+
+        Returns:
+            dict: {door name: {"frames", "frames_per_s", "encodings", "encode_queue_depth", "dropped"}}
+        """
+        elapsed = max(time.monotonic() - (self.started_at or time.monotonic()), 1e-9)
+        stats = {}
+        for name, pipeline in self.pipelines.items():
+            snapshot = pipeline.metrics.snapshot()
+            frames = snapshot["counters"].get("frames", 0)
+            stats[name] = {
+                "frames": frames,
+                "frames_per_s": frames / elapsed,
+                "encodings": snapshot["stages"].get("encode", {}).get("count", 0),
+                "encode_queue_depth": pipeline.encode_queue_depth(),
+                "dropped": pipeline.dropped(),
+            }
+        return stats
+
+    def log_stats(self):
+        for name, door_stats in self.stats().items():
+            logger.info(f"Door {name}: {door_stats['frames']} frames ({door_stats['frames_per_s']:.1f}/s), "
+                        f"{door_stats['encodings']} encodings, {door_stats['dropped']} dropped")
@@ -0,0 +1,351 @@
+"""
+pipeline.py
+
+This script runs capture, detection, encoding and matching as separate stages
+on their own threads, connected by small bounded queues. When a stage falls
+behind, the oldest queued item is dropped so the newest frame always wins and
+a stale frame is never verified.
+"""
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+import logging  # For logging events and errors
+import queue    # For bounded queues between stages
+import threading  # For stage worker threads
+import time     # For timing operations
+from faceID import detect_faces, encode_face, match_face, record_encode_failure, encoding_stats, encode_worker_count, EncodeSkipped  # Import face detection/verification steps
+from frame_source import full_resolution, release_frame  # Import on-demand full-resolution frames
+from serial_comm import unlock_door  # Import door control function
+from tracking import FaceTracker  # Import face tracker with verified-identity cache
+from motion import MotionGate  # Import motion gate for the idle mode
+from detectors import detection_scale  # Import the per-backend default detection scale
+from latency_controller import LatencyController, adjustable_settings  # Import adaptive frame interval / detection settings
+from audit_log import SECURITY  # Marks security events so they are never dropped
+from metrics import metrics  # Import per-door metrics routing
+from config import *  # Import all configuration variables from config.py
+
+#------------------------------------------------------------------------------
+# Logging
+#------------------------------------------------------------------------------
+logger = logging.getLogger(__name__)  # Get a logger instance for this module
+
+#------------------------------------------------------------------------------
+# Latest-Wins Queue
+#------------------------------------------------------------------------------
+class LatestQueue(queue.Queue):
+    """
+    Bounded queue that evicts its oldest item instead of blocking the producer
+
+    Attributes:
+        dropped: Number of items evicted because a newer one arrived
+    """
+
+    def __init__(self, maxsize=PIPELINE_QUEUE_SIZE):
+        super().__init__(maxsize)
+        self.dropped = 0
+        self.dropped_lock = threading.Lock()  # Several stage workers may put at once
+
+    def put_latest(self, item):
+        """
+        Adds an item, dropping the oldest queued item if the queue is full
+
+        Args:
+            item: Item to queue
+        """
+        while True:
+            try:
+                self.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    self.get_nowait()  # Evict the stale item, a newer frame supersedes it
+                    with self.dropped_lock:
+                        self.dropped += 1
+                except queue.Empty:
+                    pass  # A consumer took it first, retry the put
+
+#------------------------------------------------------------------------------
+# Pipeline Item
+#------------------------------------------------------------------------------
+class Candidate:
+    """
+    A captured frame on its way through the pipeline
+
+    Attributes:
+        sequence: Capture order of the frame, higher is newer
+        captured_at: time.monotonic() when the frame was captured
+        frame: The captured frame
+        face_location: (x, y, w, h) of the single detected face, set by the detect stage
+        face_encoding: 128-dimension encoding, set by the encode stage
+        track: FaceTracker track of the detected face, set by the detect stage
+    """
+    __slots__ = ("sequence", "captured_at", "frame", "face_location", "face_encoding", "track")
+
+    def __init__(self, sequence, captured_at, frame):
+        self.sequence = sequence
+        self.captured_at = captured_at
+        self.frame = frame
+        self.face_location = None
+        self.face_encoding = None
+        self.track = None
+
+    def age(self):
+        """Seconds since the frame was captured"""
+        return time.monotonic() - self.captured_at
+
+#------------------------------------------------------------------------------
+# Face Pipeline
+#------------------------------------------------------------------------------
+class FacePipeline:
+    """
+    Staged capture -> detect -> encode -> match pipeline
+
+    One capture thread owns the camera, detect and encode stages run
+    PIPELINE_DETECT_WORKERS and PIPELINE_ENCODE_WORKERS threads, and a single
+    match thread verifies and unlocks. A candidate is dropped as stale when it
+    is older than PIPELINE_MAX_FRAME_AGE or when a newer frame has already
+    reached the match stage.
+    """
+
+    def __init__(self, camera, face_detector, gallery, detector_factory=None, tracker=None, motion_gate=None,
+                 encoder=None, unlock=unlock_door, door=None, controller=None):
+        """
+        Args:
+            camera: Opened FrameSource
+            face_detector: Initialized face detector, used by the first detect worker
+            gallery: FaceGallery of authorized face encodings
+            detector_factory: Callable returning a new face detector for every additional
+                detect worker, since cascade classifiers are not shared across threads
+            tracker: FaceTracker whose cached identities let faces skip encoding
+            motion_gate: MotionGate deciding which frames reach detection
+            encoder: Shared EncoderScheduler serving several doors, None runs
+                encode threads of its own (see faceID.encode_worker_count)
+            unlock: Callable unlocking this pipeline's door, returns True on success
+            door: Door name for logs and per-door metrics, None for the single-door setup
+            controller: LatencyController adapting this pipeline's detection, None starts one
+                at the fastest frame interval so the camera alone paces capture
+        """
+        self.camera = camera
+        self.encoder = encoder
+        self.unlock = unlock
+        self.door = door
+        self.metrics = metrics.for_door(door) if door is not None else metrics.default
+        self.gallery = gallery
+        self.tracker = tracker if tracker is not None else FaceTracker()
+        self.motion_gate = motion_gate if motion_gate is not None else MotionGate(camera)
+        if controller is None:
+            controller = LatencyController(frame_interval=0.0, adjustable=adjustable_settings(face_detector, camera),
+                                           detection_scale=detection_scale(face_detector),
+                                           min_scale=detection_scale(face_detector, None))
+        self.controller = controller
+        self.detectors = [face_detector]
+        for _ in range(1, PIPELINE_DETECT_WORKERS):
+            self.detectors.append(detector_factory() if detector_factory else face_detector)
+
+        self.frames = LatestQueue()      # capture -> detect
+        self.faces = LatestQueue()       # detect -> encode
+        self.encodings = LatestQueue()   # encode -> match
+        self.stop_event = threading.Event()
+        self.threads = []
+        self.latest_sequence = -1  # Newest frame that has reached the match stage
+        self.stale_dropped = 0
+        self.stale_lock = threading.Lock()  # Every stage checks staleness, guards the two above
+
+    #--------------------------------------------------------------------------
+    # Lifecycle
+    #--------------------------------------------------------------------------
+    def start(self):
+        """Starts every stage thread"""
+        self.metrics.set_gauge("frame_queue_depth", self.frames.qsize)
+        self.metrics.set_gauge("encode_queue_depth", self.encode_queue_depth)
+        self.metrics.set_gauge("frames_dropped", self.dropped)
+        self.controller.register_gauges(self.metrics)
+        self._spawn("capture", self._capture_loop)
+        for number, detector in enumerate(self.detectors):
+            self._spawn(f"detect-{number}", self._detect_loop, detector)
+        encode_workers = encode_worker_count()
+        if self.encoder is None:
+            for number in range(encode_workers):
+                self._spawn(f"encode-{number}", self._encode_loop)
+        else:
+            self.encoder.register(self)
+        self._spawn("match", self._match_loop)
+        logger.info(f"Face pipeline{self._door_suffix()} started with {len(self.detectors)} detect and "
+                    f"{'shared' if self.encoder else encode_workers} encode workers")
+
+    def stop(self):
+        """Signals every stage to finish and waits for the threads to exit"""
+        self.stop_event.set()
+        if self.encoder is not None:
+            self.encoder.unregister(self)
+        for thread in self.threads:
+            thread.join(timeout=PIPELINE_POLL_INTERVAL * 10)
+        logger.info(f"Face pipeline{self._door_suffix()} stopped ({self.dropped()} frames dropped, "
+                    f"encoding stats {encoding_stats}, {self.tracker.cache_hits} tracker cache hits, "
+                    f"{self.motion_gate.skipped} idle frames skipped)")
+
+    def run_forever(self):
+        """Starts the pipeline and blocks until a stage stops it"""
+        self.start()
+        try:
+            while not self.stop_event.wait(PIPELINE_POLL_INTERVAL * 10):
+                pass
+        finally:
+            self.stop()
+
+    def dropped(self):
+        """Total number of frames dropped as superseded or stale"""
+        dropped = self.frames.dropped + self.faces.dropped + self.encodings.dropped + self.stale_dropped
+        if self.encoder is not None:
+            dropped += self.encoder.dropped(self)
+        return dropped
+
+    def encode_queue_depth(self):
+        """Faces waiting to be encoded for this pipeline"""
+        return self.faces.qsize() if self.encoder is None else self.encoder.depth(self)
+
+    def _door_suffix(self):
+        return f" for door {self.door}" if self.door is not None else ""
+
+    def _spawn(self, name, target, *args):
+        thread_name = f"pipeline-{self.door}-{name}" if self.door is not None else f"pipeline-{name}"
+        thread = threading.Thread(target=self._guard, args=(name, target) + args, name=thread_name, daemon=True)
+        thread.start()
+        self.threads.append(thread)
+
+    def _guard(self, name, target, *args):
+        """Keeps a stage running through errors, like the sequential detection loop does"""
+        metrics.bind(self.metrics)  # Stage timings and counters of this thread belong to this door
+        while not self.stop_event.is_set():
+            try:
+                target(*args)
+            except Exception as e:
+                logger.warning(f"Error in pipeline stage {name}: {e}")
+                logger.debug(f"Restarting pipeline stage {name}...")
+                time.sleep(1)  # Wait before retrying
+
+    def _take(self, source):
+        """Gets the next item from a queue, or None if the pipeline is stopping"""
+        while not self.stop_event.is_set():
+            try:
+                return source.get(timeout=PIPELINE_POLL_INTERVAL)
+            except queue.Empty:
+                continue
+        return None
+
+    def _is_stale(self, candidate, claim=False):
+        """
+        True if the candidate is too old or a newer frame already reached the match stage
+
+        Args:
+            candidate: Candidate to check
+            claim: True for the match stage, a fresh candidate then makes every older one stale
+        """
+        with self.stale_lock:
+            if candidate.sequence <= self.latest_sequence or candidate.age() > PIPELINE_MAX_FRAME_AGE:
+                self.stale_dropped += 1
+                return True
+            if claim:
+                self.latest_sequence = candidate.sequence  # Anything older than this frame is now stale
+            return False
+
+    #--------------------------------------------------------------------------
+    # Stages
+    #--------------------------------------------------------------------------
+    def _capture_loop(self):
+        sequence = 0
+        next_capture = time.monotonic()
+        while not self.stop_event.is_set():
+            # Spaced by the controller's frame interval, which only exceeds the camera's when the board is slow or hot
+            if self.stop_event.wait(max(0.0, next_capture - time.monotonic())):
+                return
+            next_capture = time.monotonic() + self.controller.frame_interval
+            frame = self.camera.read()  # Capture a frame from the frame source, paced by its frame rate
+            if frame is None:
+                logger.info("Frame source exhausted, stopping pipeline")
+                self.stop_event.set()
+                return
+            if not self.motion_gate.check(frame):  # Static scene, nobody to detect
+                self.stop_event.wait(self.motion_gate.idle_delay())
+                continue
+            self.frames.put_latest(Candidate(sequence, time.monotonic(), frame))
+            sequence += 1
+
+    def _detect_loop(self, face_detector):
+        while not self.stop_event.is_set():
+            candidate = self._take(self.frames)
+            if candidate is None or self._is_stale(candidate):
+                continue
+            frame = candidate.frame
+            try:
+                self._detect(face_detector, candidate)
+            finally:
+                release_frame(frame)  # Detection is done and the full frame fetched, the camera may reuse its buffers
+
+    def _detect(self, face_detector, candidate):
+        """Detects the face of one candidate and passes it on to encoding if it needs verifying"""
+        face_found = detect_faces(face_detector, candidate.frame, self.controller.detection_scale,
+                                  self.controller.scale_factor)
+        self.controller.observe(candidate.age())
+        if len(face_found) != 1:  # Ensure only one face is in frame for safety, ensuring no forced entry
+            return
+        candidate.face_location = face_found[0]
+        candidate.track = self.tracker.update(face_found, candidate.captured_at)[0]
+        if not self.tracker.needs_verification(candidate.track, candidate.captured_at):
+            return  # Same face as a recent verification, reuse the cached identity
+        logger.debug(f"Face detected (track {candidate.track.track_id}), beginning facial verification...")
+        # Copy the full-resolution frame out of the camera, which holds it until the frame is released
+        candidate.frame = full_resolution(candidate.frame)
+        if candidate.frame is None:
+            return
+        if self.encoder is None:
+            self.faces.put_latest(candidate)
+        else:
+            self.encoder.submit(self, candidate)  # Shared workers, scheduled fairly across doors
+
+    def _encode_loop(self):
+        while not self.stop_event.is_set():
+            candidate = self._take(self.faces)
+            if candidate is not None:
+                self.encode_candidate(candidate)
+
+    def encode_candidate(self, candidate):
+        """
+        Encodes a detected face and hands it to the match stage, also called by shared encoder workers
+
+        Args:
+            candidate: Candidate with face_location set by the detect stage
+        """
+        if self._is_stale(candidate):
+            return
+        try:
+            candidate.face_encoding = encode_face(candidate.frame, candidate.face_location)
+        except EncodeSkipped:
+            self.tracker.cancel(candidate.track)  # Nothing was decided, the next frame of the face retries
+            return
+        finally:
+            candidate.frame = None  # Release the full frame, only the encoding is needed from here on
+        if candidate.face_encoding is not None:
+            self.encodings.put_latest(candidate)
+        else:
+            record_encode_failure(self.door, candidate.captured_at)
+            self.tracker.record(candidate.track, None, candidate.face_location)
+
+    def _match_loop(self):
+        while not self.stop_event.is_set():
+            candidate = self._take(self.encodings)
+            if candidate is None or self._is_stale(candidate, claim=True):
+                continue
+            name = match_face(candidate.face_encoding, self.gallery, self.door, candidate.captured_at)
+            if name is not None:  # Check if the face in the frame is authorized
+                logger.info(f"Unlocking door{self._door_suffix()}... (frame age {candidate.age() * 1000:.0f} ms)", extra=SECURITY)
+                if self.unlock():  # If the face is authorized, unlock the door
+                    logger.info("Door unlocked successfully", extra=SECURITY)
+                    self.tracker.record(candidate.track, name, candidate.face_location)
+                else:
+                    logger.error("Failed to unlock door, retry face verification", extra=SECURITY)
+                    self.tracker.cancel(candidate.track)  # Not cached, the next frame verifies again
+            else:
+                logger.warning("Unauthorized face detected, continuing to monitor...", extra=SECURITY)
+                self.tracker.record(candidate.track, None, candidate.face_location)
@@ -4,13 +4,30 @@ serial_comm.py
 This script handles serial communication with the Arduino/microcontroller
 for controlling the door lock mechanism.
 
+A SerialWorker thread owns each port (one per door lock). Commands are queued to it, every
+command waits for the device to acknowledge it, a heartbeat detects a dead
+link between unlocks, and a lost connection is re-established in the
+background with exponential backoff. Nothing connects at import time.
+
+UNLOCK is never sent twice: once written, a slow acknowledgement is waited
+for until the command's deadline (and still counts as success) instead of
+retrying on a new connection, which could open the door twice.
+
+Line protocol (newline terminated):
+    UNLOCK -> ACK UNLOCK
+    PING   -> PONG
 """
 
 #------------------------------------------------------------------------------
 # Imports
 #------------------------------------------------------------------------------
 import logging  # For logging events and errors
+import queue    # For the command queue
+import threading  # For the serial worker thread
+import time     # For timing operations
 import serial   # PySerial library for serial communication
+from metrics import metrics  # Import per-stage latency metrics
+from audit_log import SECURITY  # Marks security events so they are never dropped
 from config import *  # Import all configuration variables from config.py
 
 #------------------------------------------------------------------------------
@@ -21,50 +38,328 @@ logger = logging.getLogger(__name__)  # Get a logger instance for this module
 #------------------------------------------------------------------------------
 # Serial Connection Initialization
 #------------------------------------------------------------------------------
-def initialize_serial_connection():
-    """Attempts to establish a serial connection with the microcontroller"""
+def initialize_serial_connection(port=SERIAL_PORT, baud_rate=BAUD_RATE):
+    """
+    Attempts to establish a serial connection with the microcontroller
+
+    Args:
+        port: Serial device path
+        baud_rate: Communication speed
+
+    Returns:
+        serial.Serial: Open connection, or None if the connection fails
+    """
     try:
         logger.debug("Initializing serial connection...")
-        ser = serial.Serial(SERIAL_PORT, BAUD_RATE)  # Create serial connection using config values
+        # Short read timeout so the worker can poll for acknowledgements without blocking shutdown
+        ser = serial.Serial(port, baud_rate, timeout=SERIAL_READ_TIMEOUT, write_timeout=SERIAL_ACK_TIMEOUT)
         logger.info("Serial connection initialized successfully")
         return ser
     except Exception as e:
         logger.error(f"Error initializing serial connection: {e}")
         return None  # Return None if connection fails
 
-# Initialize serial connection with retry mechanism
-current_attempts = 0  # Counter for connection attempts
-ser = None  # Serial connection object, initially None
-while current_attempts < MAX_ATTEMPTS:  # Try to connect up to MAX_ATTEMPTS times
-    ser = initialize_serial_connection()
-    if ser is not None:
-        break  # Exit the loop if connection is successful
-    logger.info(f"Serial connection failed. Retrying...")
-    current_attempts += 1  # Increment attempt counter if connection failed
+#------------------------------------------------------------------------------
+# Serial Command
+#------------------------------------------------------------------------------
+class SerialCommand:
+    """
+    A command queued to the serial worker
+
+    Attributes:
+        name: Command word sent to the device, e.g. "UNLOCK"
+        reply: Line the device answers with, e.g. "ACK UNLOCK"
+        deadline: time.monotonic() after which the command is abandoned
+        retry: True if the command may be sent again after a missed acknowledgement
+        done: Event set once the command succeeded or failed
+        ok: True if the device acknowledged the command
+        rtt: Round-trip time in seconds from write to acknowledgement
+    """
+    __slots__ = ("name", "reply", "deadline", "retry", "done", "ok", "rtt", "lock")
+
+    def __init__(self, name, reply, timeout, retry=True):
+        self.name = name
+        self.reply = reply
+        self.deadline = time.monotonic() + timeout
+        self.retry = retry
+        self.done = threading.Event()
+        self.ok = False
+        self.rtt = None
+        self.lock = threading.Lock()  # The worker and a caller giving up may finish it at the same time
+
+    def finish(self, ok, rtt=None):
+        """
+        Records the outcome and wakes the caller, the first outcome wins
+
+        Returns:
+            bool: False if the command was already finished, e.g. given up on by the caller
+        """
+        with self.lock:
+            if self.done.is_set():
+                return False
+            self.ok = ok
+            self.rtt = rtt
+            self.done.set()
+            return True
+
+#------------------------------------------------------------------------------
+# Serial Worker
+#------------------------------------------------------------------------------
+class SerialWorker:
+    """
+    Background thread owning the serial port
+
+    Attributes:
+        connected: True while the port is open and answering
+        last_rtt: Round-trip time of the last acknowledged command in seconds
+        reconnects: Number of connections established after the first
+    """
+
+    def __init__(self, port=SERIAL_PORT, baud_rate=BAUD_RATE, door=None):
+        """
+        Args:
+            port: Serial device path
+            baud_rate: Communication speed
+            door: Door name the worker's metrics are recorded under, None for the default
+        """
+        self.port = port
+        self.door = door
+        self.baud_rate = baud_rate
+        self.commands = queue.Queue()
+        self.stop_event = threading.Event()
+        self.connection = None
+        self.connected = False
+        self.connected_once = threading.Event()  # Set after the first successful connection
+        self.last_rtt = None
+        self.reconnects = 0
+        self.thread = None
+
+    def start(self):
+        """Starts the worker thread, which connects in the background"""
+        self.thread = threading.Thread(target=self._run, name=f"serial-worker-{self.door or self.port}", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stops the worker thread and closes the port, queued commands fail"""
+        self.stop_event.set()
+        self.commands.put(None)  # Wakes the worker if it is waiting for a command
+        if self.thread is not None:
+            self.thread.join(timeout=SERIAL_ACK_TIMEOUT + 1)
+        self._fail_queued()
+
+    def send(self, name, reply, timeout=SERIAL_COMMAND_TIMEOUT, retry=True):
+        """
+        Queues a command and waits for the device to acknowledge it
+
+        Args:
+            name: Command word, e.g. "UNLOCK"
+            reply: Expected acknowledgement line, e.g. "ACK UNLOCK"
+            timeout: Seconds to wait, including time spent reconnecting
+            retry: False for commands that must not run twice, they are written
+                once and their acknowledgement is awaited until the timeout
+
+        Returns:
+            SerialCommand: The finished command, check .ok and .rtt
+        """
+        command = SerialCommand(name, reply, timeout, retry)
+        self.commands.put(command)
+        if not command.done.wait(timeout + SERIAL_ACK_TIMEOUT):
+            command.finish(False)  # Worker is stuck, the caller must not block forever
+        return command
+
+    #--------------------------------------------------------------------------
+    # Worker Thread
+    #--------------------------------------------------------------------------
+    def _run(self):
+        if self.door is not None:
+            metrics.bind(metrics.for_door(self.door))
+        backoff = SERIAL_RECONNECT_MIN_DELAY
+        while not self.stop_event.is_set():
+            if self.connection is None:
+                if self._connect():
+                    backoff = SERIAL_RECONNECT_MIN_DELAY
+                else:
+                    self._fail_expired()
+                    logger.warning(f"Serial connection failed. Retrying in {backoff:.1f}s...")
+                    self.stop_event.wait(backoff)
+                    backoff = min(backoff * 2, SERIAL_RECONNECT_MAX_DELAY)
+                    continue
+
+            try:
+                command = self.commands.get(timeout=SERIAL_HEARTBEAT_INTERVAL)
+            except queue.Empty:
+                if not self._exchange("PING", "PONG"):  # Idle link, check the device is still there
+                    logger.error("Heartbeat not answered, reconnecting to serial port", extra=SECURITY)
+                    self._disconnect()
+                continue
+            if command is None:
+                break  # Stop sentinel
+
+            if command.done.is_set() or time.monotonic() > command.deadline:
+                command.finish(False)
+                continue
+            started = time.perf_counter()
+            # A command that must not run twice waits for its acknowledgement as long as the caller does
+            ack_timeout = SERIAL_ACK_TIMEOUT if command.retry else max(SERIAL_ACK_TIMEOUT, command.deadline - time.monotonic())
+            if self._exchange(command.name, command.reply, ack_timeout):
+                rtt = time.perf_counter() - started
+                self.last_rtt = rtt
+                metrics.observe("serial_rtt", rtt)
+                if not command.finish(True, rtt):
+                    logger.warning(f"{command.name} acknowledged after the caller gave up ({rtt:.1f}s)", extra=SECURITY)
+            else:
+                logger.error(f"{command.name} not acknowledged, reconnecting to serial port", extra=SECURITY)
+                self._disconnect()
+                if command.retry:
+                    self._requeue(command)  # Retried on the new connection until its deadline
+                else:
+                    command.finish(False)  # Never resent, the device may have acted on it
+
+        self._disconnect()
+
+    def _connect(self):
+        """Opens the port and checks the device answers, True on success"""
+        self.connection = initialize_serial_connection(self.port, self.baud_rate)
+        if self.connection is None:
+            return False
+        self.connection.reset_input_buffer()  # Drop boot messages and stale replies
+        if not self._exchange("PING", "PONG"):
+            logger.error("Serial device did not answer the heartbeat")
+            self._disconnect()
+            return False
+        if self.connected_once.is_set():
+            self.reconnects += 1
+            metrics.increment("serial_reconnects")
+        self.connected = True
+        self.connected_once.set()
+        logger.info(f"Serial device on {self.port} is answering")
+        return True
+
+    def _disconnect(self):
+        self.connected = False
+        if self.connection is not None:
+            try:
+                self.connection.close()
+            except Exception as e:
+                logger.debug(f"Error closing serial port: {e}")
+            self.connection = None
+
+    def _exchange(self, name, reply, timeout=SERIAL_ACK_TIMEOUT):
+        """
+        Writes a command and reads lines until the expected reply arrives
+
+        Args:
+            name: Command word
+            reply: Expected acknowledgement line
+            timeout: Seconds the device has to answer
+
+        Returns:
+            bool: True if the reply arrived within timeout
+        """
+        try:
+            with metrics.timer("serial_write"):
+                self.connection.write(f"{name}\n".encode("ascii"))
+            deadline = time.monotonic() + timeout
+            while time.monotonic() < deadline and not self.stop_event.is_set():
+                line = self.connection.readline().decode("ascii", "replace").strip()
+                if line == reply:
+                    return True
+                if line:
+                    logger.debug(f"Ignoring serial line {line!r} while waiting for {reply!r}")
+            metrics.increment("serial_ack_timeouts")
+            return False
+        except Exception as e:
+            logger.error(f"Error on serial port: {e}")
+            return False
+
+    def _requeue(self, command):
+        """Puts a failed command back at the front of the queue"""
+        with self.commands.mutex:
+            self.commands.queue.appendleft(command)
+            self.commands.unfinished_tasks += 1
+            self.commands.not_empty.notify()
+
+    def _fail_expired(self):
+        """Fails commands whose deadline passed while the port was down"""
+        now = time.monotonic()
+        with self.commands.mutex:
+            pending = list(self.commands.queue)
+            self.commands.queue.clear()
+            for command in pending:
+                if command is None:
+                    self.commands.queue.append(command)  # Stop sentinel
+                elif now > command.deadline:
+                    command.finish(False)
+                else:
+                    self.commands.queue.append(command)
+
+    def _fail_queued(self):
+        while True:
+            try:
+                command = self.commands.get_nowait()
+            except queue.Empty:
+                return
+            if command is not None:
+                command.finish(False)
+
+#------------------------------------------------------------------------------
+# Worker Lifecycle
+#------------------------------------------------------------------------------
+_workers = {}  # Serial port -> running SerialWorker, one per door lock
+_workers_lock = threading.Lock()
+
+
+def start_serial_worker(port=SERIAL_PORT, baud_rate=BAUD_RATE, door=None):
+    """
+    Starts the serial worker for a port if it is not running yet
+
+    Args:
+        port: Serial device path
+        baud_rate: Communication speed
+        door: Door name the worker's metrics are recorded under
+
+    Returns:
+        SerialWorker: The running worker for the port
+    """
+    with _workers_lock:
+        worker = _workers.get(port)
+        if worker is None:
+            worker = _workers[port] = SerialWorker(port, baud_rate, door)
+            worker.start()
+        return worker
+
+
+def stop_serial_worker():
+    """Stops every serial worker"""
+    with _workers_lock:
+        workers = list(_workers.values())
+        _workers.clear()
+    for worker in workers:
+        worker.stop()
 
 #------------------------------------------------------------------------------
 # Door Control Functions
 #------------------------------------------------------------------------------
-def unlock_door():
+def unlock_door(port=SERIAL_PORT):
     """
     Send unlock signal to the connected Arduino/microcontroller
+
+    Args:
+        port: Serial port of the door's controller, SERIAL_PORT for the single-door setup
+
+    Returns:
+        bool: True once the device acknowledged the unlock
     """
     try:
-        if ser and ser.is_open:  # Check if serial connection exists and is open
-            ser.write(b'UNLOCK\n')  # Send the unlock command as bytes to Arduino
-            logger.info("Unlock signal sent successfully")
+        command = start_serial_worker(port).send("UNLOCK", "ACK UNLOCK", retry=False)  # Never unlock twice
+        if command.ok:
+            logger.info(f"Unlock signal acknowledged in {command.rtt * 1000:.0f} ms", extra=SECURITY)
+            metrics.increment("unlocks")
             return True  # Return success
-        else:
-            logger.error("Cannot unlock door: Serial connection not established")
-            logger.info("Attempting to reconnect to serial port...")
-            ser = initialize_serial_connection()
-            if ser and ser.is_open:
-                ser.write(b'UNLOCK\n')
-                logger.info("Unlock signal sent successfully")
-                return True
-            else:
-                logger.error("Failed to reconnect to serial port")
-                return False  # Return failure if no connection    
+        logger.error("Cannot unlock door: Serial device did not acknowledge the unlock", extra=SECURITY)
+        metrics.increment("unlock_failures")
+        return False  # Return failure if the device never answered
     except Exception as e:
-        logger.error(f"Error sending unlock signal: {e}")
+        logger.error(f"Error sending unlock signal: {e}", extra=SECURITY)
+        metrics.increment("unlock_failures")
         return False  # Return failure if any exception occurs
@@ -0,0 +1,18 @@
+"""
+conftest.py
+
+Shared setup for the test suite. Tests import the modules from the repository
+root, and run without a camera, a microcontroller or dlib: when
+face_recognition is not installed, tests/fakes provides a stand-in whose
+encodings are derived from the pixels, so identical crops give identical
+encodings.
+"""
+
+import importlib.util
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))  # Repository root
+if importlib.util.find_spec("face_recognition") is None:
+    sys.path.append(os.path.join(TESTS_DIR, "fakes"))  # Worker processes inherit sys.path
@@ -0,0 +1,30 @@
+"""
+face_recognition.py
+
+Stand-in for the face_recognition package used by the tests when dlib is not
+installed. Encodings are 128 numbers derived from the mean color of each face
+box, faces are the centre half of the image.
+"""
+
+import cv2
+import numpy as np
+
+
+def face_locations(img, number_of_times_to_upsample=1, model="hog"):
+    height, width = img.shape[:2]
+    return [(height // 4, 3 * width // 4, 3 * height // 4, width // 4)]
+
+
+def face_encodings(face_image, known_face_locations=None, num_jitters=1, model="small"):
+    if known_face_locations is None:
+        known_face_locations = face_locations(face_image)
+    encodings = []
+    for top, right, bottom, left in known_face_locations:
+        crop = face_image[top:bottom, left:right].reshape(-1, face_image.shape[2]) / 255.0
+        mean = crop.mean(axis=0)
+        encodings.append(np.resize(mean, 128) * np.linspace(0.5, 1.0, 128))
+    return encodings
+
+
+def load_image_file(file, mode="RGB"):
+    return cv2.cvtColor(cv2.imread(file), cv2.COLOR_BGR2RGB)
@@ -0,0 +1,148 @@
+"""Access event store: batched writes, queries, retention, encode failures and skips, and the query CLI"""
+
+import time
+
+import numpy as np
+import pytest
+
+import access_events
+import faceID
+import pipeline
+from access_events import AccessEventStore, open_database, query_events, summarize_events
+from tracking import FaceTracker
+
+
+@pytest.fixture
+def db(tmp_path):
+    return str(tmp_path / "events.db")
+
+
+@pytest.fixture
+def store(db, monkeypatch):
+    store = AccessEventStore(db, flush_interval=0.05)
+    store.start()
+    monkeypatch.setattr(access_events, "event_store", store)
+    yield store
+    access_events.stop_event_store()
+
+
+def written(store, count, timeout=5):
+    deadline = time.monotonic() + timeout
+    while store.written < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return store.written >= count
+
+
+def test_events_are_written_and_queried(store, db):
+    store.record("front", "alice", "alice", 0.31, 0.12)
+    store.record("back", None, "bob", 0.72, 0.2)
+    store.record("front", "bob", "bob", 0.35, None)
+    assert written(store, 3)
+
+    connection = open_database(db, read_only=True)
+    try:
+        assert [row[2] for row in query_events(connection, door="front")] == ["bob", "alice"]
+        rejected = query_events(connection, granted=False)
+        assert len(rejected) == 1 and rejected[0][1:4] == ("back", None, "bob")
+        assert query_events(connection, identity="alice")[0][5] == pytest.approx(120.0)
+        assert query_events(connection, since=time.time() + 60) == []
+        summary = {(door, identity): (granted, refused) for door, identity, granted, refused, _ in
+                   summarize_events(connection)}
+        assert summary == {("back", None): (0, 1), ("front", "alice"): (1, 0), ("front", "bob"): (1, 0)}
+    finally:
+        connection.close()
+
+
+def test_stop_writes_queued_events(db):
+    store = AccessEventStore(db, flush_interval=10)
+    store.start()
+    for number in range(50):
+        store.record("front", f"user{number}", f"user{number}", 0.3, 0.1)
+    store.stop()
+
+    assert store.written == 50
+
+
+def test_retention_deletes_old_events(db):
+    connection = open_database(db)
+    with connection:
+        connection.execute(access_events.INSERT, (time.time() - 10 * 24 * 60 * 60, "front", "old", "old", 0.3, 1.0, 1))
+        connection.execute(access_events.INSERT, (time.time(), "front", "new", "new", 0.3, 1.0, 1))
+    connection.close()
+    store = AccessEventStore(db, flush_interval=0.05, retention_days=7)
+    store.start()
+    store.stop()
+
+    assert store.deleted == 1
+    connection = open_database(db, read_only=True)
+    assert [row[2] for row in query_events(connection)] == ["new"]
+    connection.close()
+
+
+def test_encode_failure_is_recorded_as_rejection(store, db, monkeypatch):
+    monkeypatch.setattr(faceID, "encode_face", lambda frame, face_location: None)
+
+    assert faceID.identify_face(np.zeros((10, 10, 3), np.uint8), (0, 0, 5, 5), gallery=None, door="side",
+                                captured_at=time.monotonic()) is None
+    assert written(store, 1)
+
+    connection = open_database(db, read_only=True)
+    (event,) = query_events(connection)
+    connection.close()
+    assert event[1:5] == ("side", None, None, None) and event[6] == 0
+
+
+def test_cli_reports_a_missing_database(tmp_path, capsys):
+    assert access_events.main(["--db", str(tmp_path / "missing.db")]) == 1
+
+    assert "not found" in capsys.readouterr().err
+    assert not (tmp_path / "missing.db").exists()
+
+
+def test_cli_lists_events(store, db, capsys):
+    store.record("front", "alice", "alice", 0.31, 0.12)
+    store.record("front", None, None, None, 0.05)
+    assert written(store, 2)
+
+    assert access_events.main(["--db", db, "--door", "front"]) == 0
+
+    output = capsys.readouterr().out
+    assert "granted  alice" in output and "rejected (no encoding)" in output
+    assert "2 rows" in output
+
+
+class BusyPool:
+    """Encoder pool with no worker free"""
+
+    def encode(self, bgr_crop, box=None):
+        return None
+
+
+def test_busy_encoder_is_not_recorded(store, monkeypatch):
+    monkeypatch.setattr(faceID, "encoder_pool", BusyPool())
+    frame = np.zeros((100, 100, 3), np.uint8)
+
+    with pytest.raises(faceID.EncodeSkipped):
+        faceID.identify_face(frame, (25, 25, 50, 50), gallery=None, door="side", captured_at=time.monotonic())
+    store.stop()
+
+    assert store.written == 0
+
+
+def test_pipeline_retries_a_skipped_face_without_recording_it(store, monkeypatch):
+    monkeypatch.setattr(faceID, "encoder_pool", BusyPool())
+    tracker = FaceTracker()
+    face_pipeline = pipeline.FacePipeline(None, None, gallery=None, tracker=tracker, motion_gate=object(),
+                                          controller=object())
+    box = (25, 25, 50, 50)
+    candidate = pipeline.Candidate(0, time.monotonic(), np.zeros((100, 100, 3), np.uint8))
+    candidate.face_location = box
+    candidate.track = tracker.update([box])[0]
+    assert tracker.needs_verification(candidate.track)
+
+    face_pipeline.encode_candidate(candidate)
+    store.stop()
+
+    assert store.written == 0
+    assert face_pipeline.encodings.empty()
+    assert tracker.needs_verification(candidate.track)  # Not waiting for the pending timeout
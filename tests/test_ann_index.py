@@ -0,0 +1,99 @@
+"""IVF index: fingerprint, build and search recall, save/load and remapping"""
+
+import numpy as np
+import pytest
+
+from ann_index import IVFIndex, gallery_fingerprint
+from gallery import FaceGallery
+
+
+def clustered_gallery(people=200, seed=0):
+    """Gallery of random synthetic people, far apart compared to the probe noise used below"""
+    rng = np.random.default_rng(seed)
+    encodings = rng.normal(0.0, 0.1, (people, 128)).astype(np.float32)
+    return FaceGallery(encodings, [f"person{number}" for number in range(people)])
+
+
+def test_fingerprint_changes_with_any_embedding():
+    gallery = clustered_gallery(10)
+    fingerprint = gallery_fingerprint(gallery)
+
+    negated = gallery.encodings.copy()
+    negated[3] = -negated[3]  # Same norm, different embedding
+    swapped = gallery.encodings[[1, 0] + list(range(2, 10))]
+
+    assert gallery_fingerprint(FaceGallery(gallery.encodings.copy(), gallery.names)) == fingerprint
+    assert gallery_fingerprint(FaceGallery(negated, gallery.names)) != fingerprint
+    assert gallery_fingerprint(FaceGallery(swapped, gallery.names)) != fingerprint
+    assert gallery_fingerprint(gallery.quantized("int8")) != fingerprint
+
+
+def test_index_finds_the_nearest_face():
+    gallery = clustered_gallery()
+    index = IVFIndex.build(gallery, nlist=8, nprobe=3)
+    assert gallery.attach_index(index)
+    rng = np.random.default_rng(1)
+
+    hits = 0
+    for number in rng.choice(len(gallery), 50, replace=False):
+        probe = gallery.encodings[number] + rng.normal(0.0, 0.01, 128).astype(np.float32)
+        name, distance, _ = gallery.match(probe)
+        hits += name == gallery.names[number]
+    assert hits >= 45
+
+
+def test_lists_cover_every_row_once():
+    gallery = clustered_gallery()
+    index = IVFIndex.build(gallery, nlist=8)
+
+    assert sorted(index.list_ids) == list(range(len(gallery)))
+    assert index.list_offsets[-1] == len(gallery)
+    assert len(np.concatenate([index.candidates(row) for row in gallery.encodings[:5]])) > 0
+
+
+def test_save_and_load_round_trip(tmp_path):
+    gallery = clustered_gallery()
+    index = IVFIndex.build(gallery, nlist=8)
+    path = str(tmp_path / "index.npz")
+
+    index.save(path)
+    loaded = IVFIndex.load(path, nprobe=2)
+
+    assert loaded.fingerprint == index.fingerprint
+    assert np.array_equal(loaded.list_ids, index.list_ids)
+    assert np.array_equal(loaded.centroids, index.centroids)
+    assert loaded.nprobe == 2
+    assert gallery.attach_index(loaded)
+
+
+def test_stale_index_is_not_attached():
+    index = IVFIndex.build(clustered_gallery(seed=0), nlist=8)
+    other = clustered_gallery(seed=1)
+
+    assert not other.attach_index(index)
+    assert other.index is None
+
+
+def test_remapped_index_keeps_lists_of_unchanged_rows():
+    old_gallery = clustered_gallery()
+    index = IVFIndex.build(old_gallery, nlist=8)
+    rng = np.random.default_rng(2)
+    added = rng.normal(0.0, 0.1, (5, 128)).astype(np.float32)
+    new_gallery = FaceGallery(np.vstack([old_gallery.encodings[10:], added]),
+                              list(old_gallery.names[10:]) + [f"new{number}" for number in range(5)])
+
+    remapped = index.remapped(old_gallery, new_gallery)
+
+    assert new_gallery.attach_index(remapped)
+    assert np.array_equal(remapped.labels()[:len(old_gallery) - 10], index.labels()[10:])
+    assert sorted(remapped.list_ids) == list(range(len(new_gallery)))
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_index_works_on_quantized_galleries(dtype):
+    gallery = clustered_gallery().quantized(dtype)
+    assert gallery.attach_index(IVFIndex.build(gallery, nlist=8, nprobe=8))
+
+    name, _, _ = gallery.match(gallery.float_encodings()[7])
+
+    assert name == "person7"
@@ -0,0 +1,90 @@
+"""Audit log: security records are never dropped, DEBUG sampling and deduplication of repeats"""
+
+import logging
+import queue
+
+import pytest
+
+from audit_log import SECURITY, AuditLogWriter, AuditQueueHandler
+
+
+class CollectingHandler(logging.Handler):
+    """Stands in for the RotatingLogFileHandler, keeps the written messages"""
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+    def sync(self):
+        pass
+
+
+@pytest.fixture
+def audit_logger():
+    """Logger that logs through a fresh AuditQueueHandler, built by calling it with the handler's settings"""
+    logger = logging.getLogger("test_audit_log")
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+
+    def attach(max_pending=1000, debug_sample_every=1):
+        handler = AuditQueueHandler(queue.Queue(), max_pending, debug_sample_every)
+        logger.addHandler(handler)
+        return logger, handler
+
+    yield attach
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+
+def write_all(queue_handler, dedup_window=0):
+    """Runs a writer over everything queued so far, returns the written messages"""
+    collected = CollectingHandler()
+    writer = AuditLogWriter(queue_handler.records, collected, queue_handler, dedup_window, flush_interval=0.05)
+    writer.start()
+    writer.stop()
+    return collected.messages
+
+
+def test_security_records_survive_a_full_queue(audit_logger):
+    logger, queue_handler = audit_logger(max_pending=5)
+
+    for number in range(20):
+        logger.debug(f"Frame {number} has no face")
+    for number in range(3):
+        logger.warning("Unauthorized face detected", extra=SECURITY)
+        logger.debug(f"Frame {20 + number} has no face")
+
+    assert queue_handler.dropped == 18
+    assert queue_handler.records.qsize() == 8
+    messages = write_all(queue_handler, dedup_window=60)
+    assert messages.count("Unauthorized face detected") == 3  # Neither dropped nor deduplicated
+    assert "Log queue full, dropped 18 records" in messages
+
+
+def test_debug_records_are_sampled_per_call_site(audit_logger):
+    logger, queue_handler = audit_logger(debug_sample_every=4)
+
+    for number in range(10):
+        logger.debug(f"Detection took {number} ms")
+        logger.info(f"Motion score {number}")
+
+    assert queue_handler.sampled_out == 7
+    messages = write_all(queue_handler)
+    assert [message for message in messages if message.startswith("Detection")] == [
+        "Detection took 0 ms", "Detection took 4 ms", "Detection took 8 ms"]
+    assert len([message for message in messages if message.startswith("Motion")]) == 10
+
+
+def test_repeated_records_are_collapsed_into_a_count(audit_logger):
+    logger, queue_handler = audit_logger()
+
+    for distance in (0.41, 0.43, 0.5):
+        logger.info(f"Face distance {distance}")
+    logger.info("Camera reconnected")
+
+    messages = write_all(queue_handler, dedup_window=60)
+    assert messages[:2] == ["Face distance 0.41", "Camera reconnected"]
+    assert len(messages) == 3 and messages[2].startswith("Face distance 0.5 (repeated 2 times")
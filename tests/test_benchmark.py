@@ -0,0 +1,45 @@
+"""Benchmark helpers that share state with the running system"""
+
+import numpy as np
+
+import benchmark
+import faceID
+from config import cascade_classifier_config
+
+
+def test_detect_variants_leave_the_shared_cascade_config_alone():
+    before = dict(cascade_classifier_config)
+    frames = [np.zeros((120, 160, 3), dtype=np.uint8)]
+
+    variants = {"base": ({}, None), "coarse": ({"scaleFactor": 1.3, "minSize": (40, 40)}, 1.0)}
+
+    results = benchmark.benchmark_detect(frames, variants)
+
+    assert cascade_classifier_config == before
+    assert results["coarse"]["config"]["scaleFactor"] == 1.3
+    assert results["coarse"]["config"]["minSize"] == (40, 40)
+    assert results["base"]["config"]["minSize"] == before["minSize"]
+
+
+def test_detect_reports_recall_against_full_resolution_faces(monkeypatch):
+    face = np.array([[100, 80, 120, 120]])  # Lost below half resolution
+    monkeypatch.setattr(faceID, "detect_faces",
+                        lambda face_detector, frame, scale=1.0: face if scale >= 0.5 else face[:0])
+    frames = [np.zeros((480, 640, 3), dtype=np.uint8)] * 3
+
+    results = benchmark.benchmark_detect(frames, {"full": ({}, 1.0), "small": ({}, 0.3)})
+
+    assert results["full"]["reference_faces"] == 3
+    assert results["full"]["recall"] == 1.0
+    assert results["small"]["recall"] == 0.0
+
+
+def test_detect_times_the_detector_apart_from_the_conversions():
+    frames = [np.random.default_rng(0).integers(0, 255, (480, 640, 3), dtype=np.uint8)] * 3
+
+    results = benchmark.benchmark_detect(frames, {"half": ({}, 0.5)}, repeat=2)
+
+    detector, step = results["half"]["detector"], results["half"]
+    assert detector["p50_ms"] > 0
+    assert detector["p50_ms"] <= step["p50_ms"]
+    assert detector["throughput_per_s"] >= step["throughput_per_s"]
@@ -0,0 +1,85 @@
+"""Detector backends: box conversion to (x, y, w, h), size limits at a downscale and the backend factory"""
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import detectors
+from detectors import DnnDetector, HogDetector, _within_size_limits, create_face_detector
+
+
+class StubNet:
+    """Stands in for a cv2.dnn network, returns fixed SSD detections"""
+
+    def __init__(self, detections):
+        self.detections = np.array(detections, dtype=np.float32).reshape(1, 1, -1, 7)
+        self.inputs = []
+
+    def setInput(self, blob):
+        self.inputs.append(blob)
+
+    def forward(self):
+        return self.detections
+
+
+def dnn_detector(detections, confidence=0.6):
+    detector = DnnDetector.__new__(DnnDetector)  # No model file needed
+    detector.net = StubNet(detections)
+    detector.confidence = confidence
+    detector.input_size = (300, 300)
+    detector.mean = (104.0, 177.0, 123.0)
+    return detector
+
+
+def test_hog_css_locations_become_xywh_boxes():
+    detector = HogDetector()
+    # (top, right, bottom, left): a face within the size limits and one below minSize
+    locations = [(20, 250, 220, 50), (0, 400, 40, 360)]
+    detector.face_recognition = SimpleNamespace(face_locations=lambda image, **kwargs: locations)
+
+    boxes = detector.detect(np.zeros((480, 640), dtype=np.uint8))
+
+    assert boxes.tolist() == [[50, 20, 200, 200]]
+
+
+def test_hog_without_faces_returns_an_empty_box_array():
+    detector = HogDetector()
+    detector.face_recognition = SimpleNamespace(face_locations=lambda image, **kwargs: [])
+
+    assert detector.detect(np.zeros((480, 640), dtype=np.uint8)).shape == (0, 4)
+
+
+def test_dnn_relative_corners_become_pixel_boxes():
+    detector = dnn_detector([
+        [0, 1, 0.9, 0.1, 0.2, 0.4, 0.7],     # Within the frame
+        [0, 1, 0.95, -0.1, 0.5, 0.3, 1.2],   # Corners outside the frame are clipped to it
+        [0, 1, 0.3, 0.5, 0.5, 0.8, 0.9],     # Below the confidence threshold
+    ])
+
+    boxes = detector.detect(np.zeros((400, 600, 3), dtype=np.uint8))
+
+    assert boxes.tolist() == [[60, 80, 180, 200], [0, 200, 180, 200]]
+    assert detector.net.inputs[0].shape == (1, 3, 300, 300)
+
+
+def test_dnn_accepts_grayscale_frames():
+    detector = dnn_detector([[0, 1, 0.9, 0.1, 0.2, 0.4, 0.7]])
+
+    boxes = detector.detect(np.zeros((400, 600), dtype=np.uint8))
+
+    assert boxes.tolist() == [[60, 80, 180, 200]]
+
+
+def test_size_limits_are_scaled_with_the_image(monkeypatch):
+    monkeypatch.setitem(detectors.cascade_classifier_config, "minSize", (100, 100))
+    monkeypatch.setitem(detectors.cascade_classifier_config, "maxSize", (300, 300))
+    boxes = np.array([[0, 0, 40, 40], [0, 0, 50, 50], [0, 0, 150, 150], [0, 0, 160, 160], [0, 0, 60, 200]])
+
+    assert _within_size_limits(boxes, 0.5).tolist() == [[0, 0, 50, 50], [0, 0, 150, 150]]
+    assert _within_size_limits(boxes, 1.0).tolist() == [[0, 0, 150, 150], [0, 0, 160, 160]]
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError, match="haar, hog, dnn"):
+        create_face_detector("mtcnn")
@@ -0,0 +1,73 @@
+"""Enrollment: incremental encoding into the binary and legacy JSON galleries"""
+
+import json
+import os
+
+import cv2
+import numpy as np
+
+import encode_faces
+from config import ANN_INDEX_FILE
+from encode_faces import enroll
+from gallery import load_gallery, resolve_gallery_file
+
+
+def write_face(path, value):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    cv2.imwrite(path, np.full((80, 80, 3), value, dtype=np.uint8))
+
+
+def enroll_into(tmp_path, **kwargs):
+    paths = {name: str(tmp_path / name) for name in ("faces.fidg", "faces.json", "manifest.json")}
+    count = enroll(str(tmp_path / "known_faces"), paths["faces.fidg"], paths["manifest.json"], workers=1,
+                   json_path=paths["faces.json"], **kwargs)
+    return count, paths
+
+
+def test_enroll_writes_both_galleries(tmp_path):
+    write_face(str(tmp_path / "known_faces" / "alice.jpg"), 60)
+    write_face(str(tmp_path / "known_faces" / "bob.jpg"), 180)
+
+    count, paths = enroll_into(tmp_path)
+
+    assert count == 2
+    assert sorted(load_gallery(paths["faces.fidg"]).names) == ["alice", "bob"]
+    with open(paths["faces.json"]) as json_file:
+        assert sorted(json.load(json_file)) == ["alice", "bob"]
+    assert resolve_gallery_file(paths["faces.fidg"], paths["faces.json"]) == paths["faces.fidg"]
+
+
+def test_reenroll_only_encodes_changes(tmp_path, capsys):
+    write_face(str(tmp_path / "known_faces" / "alice.jpg"), 60)
+    write_face(str(tmp_path / "known_faces" / "bob.jpg"), 180)
+    enroll_into(tmp_path)
+    os.remove(str(tmp_path / "known_faces" / "bob.jpg"))
+    write_face(str(tmp_path / "known_faces" / "carol" / "1.jpg"), 120)
+    write_face(str(tmp_path / "known_faces" / "carol" / "2.jpg"), 130)
+    capsys.readouterr()
+
+    count, paths = enroll_into(tmp_path)
+
+    assert "1 unchanged, 2 to encode, 1 removed" in capsys.readouterr().out
+    assert sorted(load_gallery(paths["faces.fidg"]).names) == ["alice", "carol", "carol"]
+    with open(paths["faces.json"]) as json_file:
+        assert sorted(json.load(json_file)) == ["alice", "bob"]  # Cannot hold carol's two images, left as it was
+    assert resolve_gallery_file(paths["faces.fidg"], paths["faces.json"]) == paths["faces.fidg"]
+
+
+def test_index_is_written_next_to_the_gallery(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # ANN_INDEX_FILE would land here
+    monkeypatch.setattr(encode_faces, "ANN_MIN_GALLERY_SIZE", 2)
+    write_face(str(tmp_path / "known_faces" / "alice.jpg"), 60)
+    write_face(str(tmp_path / "known_faces" / "bob.jpg"), 180)
+    index_path = str(tmp_path / "faces.ivf.npz")
+
+    enroll_into(tmp_path)
+
+    assert os.path.exists(index_path)
+    assert not os.path.exists(ANN_INDEX_FILE)
+
+    monkeypatch.setattr(encode_faces, "ANN_MIN_GALLERY_SIZE", 10)
+    enroll_into(tmp_path)
+
+    assert not os.path.exists(index_path)  # Too small for an index now, the stale one is removed
@@ -0,0 +1,49 @@
+"""Encoder pool: shared-memory encoding in worker processes and their logging"""
+
+import logging
+
+import numpy as np
+import pytest
+
+import face_recognition
+from encoder_pool import EncoderPool
+
+
+@pytest.fixture
+def pool():
+    pool = EncoderPool(processes=2, max_crop=(200, 200))
+    assert pool.start(timeout=30)
+    yield pool
+    pool.stop()
+
+
+def test_encodings_match_in_process(pool):
+    crop = np.random.default_rng(0).integers(0, 255, (120, 100, 3), dtype=np.uint8)
+    box = (10, 90, 110, 10)
+
+    encodings = pool.encode(crop, box)
+
+    expected = face_recognition.face_encodings(crop[:, :, ::-1].copy(), known_face_locations=[box])
+    assert len(encodings) == 1
+    np.testing.assert_allclose(encodings[0], expected[0])
+
+
+def test_oversized_crop_is_downscaled(pool):
+    crop = np.full((400, 300, 3), 90, dtype=np.uint8)
+
+    encodings = pool.encode(crop, (0, 300, 400, 0))
+
+    assert encodings is not None and len(encodings) == 1
+
+
+def test_worker_logs_reach_parent(caplog):
+    caplog.set_level(logging.INFO)
+    pool = EncoderPool(processes=1, max_crop=(64, 64))
+    try:
+        assert pool.start(timeout=30)
+    finally:
+        pool.stop()
+
+    worker_records = [record for record in caplog.records
+                      if record.name == "encoder_pool" and "loaded its models" in record.getMessage()]
+    assert len(worker_records) == 1
@@ -0,0 +1,57 @@
+"""Cascade box conversion: (x, y, w, h) to face_recognition's (top, right, bottom, left), padding and frame edges"""
+
+import numpy as np
+import pytest
+
+import faceID
+from faceID import cascade_box_to_css, encode_face_from_box
+
+
+def test_box_becomes_css():
+    assert cascade_box_to_css((10, 20, 30, 40), padding=0.0) == (20, 40, 60, 10)
+
+
+def test_padding_grows_or_shrinks_the_box():
+    assert cascade_box_to_css((10, 20, 30, 40), padding=0.1) == (16, 43, 64, 7)
+    assert cascade_box_to_css((10, 20, 30, 40), padding=-0.1) == (24, 37, 56, 13)
+
+
+def test_box_is_clamped_to_the_frame():
+    assert cascade_box_to_css((-5, -8, 50, 50), padding=0.0, frame_shape=(40, 30, 3)) == (0, 30, 40, 0)
+    assert cascade_box_to_css((-5, -8, 50, 50), padding=0.0) == (-8, 45, 42, -5)  # Unclamped without a frame
+
+
+@pytest.fixture
+def encoded_crops(monkeypatch):
+    """Replaces dlib with a recorder of the (crop, known location) pairs it would be given"""
+    crops = []
+
+    def face_encodings(crop, box=None):
+        crops.append((crop, box))
+        return [np.zeros(128)]
+
+    monkeypatch.setattr(faceID, "_face_encodings", face_encodings)
+    monkeypatch.setattr(faceID, "ENCODE_BOX_PADDING", 0.0)
+    monkeypatch.setattr(faceID, "ENCODE_CROP_CONTEXT", 0.25)
+    return crops
+
+
+def test_encoding_crop_keeps_context_around_the_box(encoded_crops):
+    frame = np.zeros((100, 100, 3), dtype=np.uint8)
+
+    assert encode_face_from_box(frame, (40, 30, 20, 20)) is not None
+
+    ((crop, box),) = encoded_crops
+    assert crop.shape[:2] == (30, 30)  # 5 px of context on every side
+    assert box == (5, 25, 25, 5)
+
+
+def test_box_at_the_frame_edge_stays_inside_the_crop(encoded_crops):
+    frame = np.zeros((100, 100, 3), dtype=np.uint8)
+
+    assert encode_face_from_box(frame, (80, 85, 40, 40)) is not None
+
+    ((crop, (top, right, bottom, left)),) = encoded_crops
+    assert crop.shape[:2] == (18, 25)
+    assert (top, right, bottom, left) == (3, 25, 18, 5)
+    assert 0 <= top < bottom <= crop.shape[0] and 0 <= left < right <= crop.shape[1]
@@ -0,0 +1,179 @@
+"""Pi camera: single-stream configuration, dual-stream captures stay held until detection has finished with them"""
+
+import gc
+import sys
+import threading
+import time
+import types
+
+import numpy as np
+import pytest
+
+import pipeline
+from frame_source import DualStreamFrame, PicameraSource
+
+FULL_SIZE, LORES_SIZE = (320, 240), (160, 120)
+
+
+class FakeRequest:
+    """Camera request whose pixels all equal its capture number"""
+
+    def __init__(self, camera, number):
+        self.camera = camera
+        self.number = number
+        self.lores = np.full((LORES_SIZE[1] * 3 // 2, LORES_SIZE[0]), number % 256, dtype=np.uint8)  # YUV420
+
+    def make_array(self, stream):
+        assert not self.camera.released[self.number], "full frame read from a released request"
+        return np.full((FULL_SIZE[1], FULL_SIZE[0], 3), self.number % 256, dtype=np.uint8)
+
+    def release(self):
+        self.camera.released[self.number] = True
+
+
+class FakePicamera2:
+    """Sensor delivering 30 frames per second"""
+
+    def __init__(self, camera_num=0):
+        self.released = {}
+        self.next_capture = time.monotonic()
+        self.configured = None
+
+    def create_video_configuration(self, **kwargs):
+        return kwargs
+
+    def configure(self, config):
+        self.configured = config
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def close(self):
+        pass
+
+    def set_controls(self, controls):
+        pass
+
+    def capture_request(self):
+        time.sleep(max(0.0, self.next_capture - time.monotonic()))
+        self.next_capture = time.monotonic() + 1 / 30
+        request = FakeRequest(self, len(self.released))
+        self.released[request.number] = False
+        return request
+
+
+class FakeMappedArray:
+    def __init__(self, request, stream):
+        self.array = request.lores
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+@pytest.fixture
+def camera(monkeypatch):
+    monkeypatch.setitem(sys.modules, "picamera2",
+                        types.SimpleNamespace(Picamera2=FakePicamera2, MappedArray=FakeMappedArray))
+    config = {"size": FULL_SIZE, "fps": 30, "format": "BGR888", "lores": {"size": LORES_SIZE},
+              "held_requests": 3, "hold_timeout": 1.0}
+    source = PicameraSource(config, warm_up=0)
+    yield source
+    source.close()
+
+
+def test_single_stream_config_leaves_out_the_source_settings(monkeypatch):
+    monkeypatch.setitem(sys.modules, "picamera2",
+                        types.SimpleNamespace(Picamera2=FakePicamera2, MappedArray=FakeMappedArray))
+    config = {"size": FULL_SIZE, "fps": 30, "format": "BGR888", "controls": {"AfMode": 2}, "lores": None,
+              "held_requests": 3, "hold_timeout": 1.0, "buffer_count": 6}
+
+    source = PicameraSource(config, warm_up=0)
+    source.close()
+
+    assert source.camera.configured == {"size": FULL_SIZE, "fps": 30, "format": "BGR888", "controls": {"AfMode": 2}}
+
+
+def test_slow_detection_keeps_full_frame(camera):
+    frame = camera.read()
+    stop = threading.Event()
+
+    def capture():
+        while not stop.is_set():
+            camera.read()  # Dropped at once, like a frame superseded in the detect queue
+
+    capture_thread = threading.Thread(target=capture)
+    capture_thread.start()
+    time.sleep(0.3)  # Slow detection: about nine captures go by
+    full = frame.full()
+    stop.set()
+    capture_thread.join()
+
+    assert full is not None and full.shape == (FULL_SIZE[1], FULL_SIZE[0], 3)
+    assert (full == 0).all()
+    assert camera.camera.released[0]
+    assert camera.sequence > 5  # Capture kept going with the other buffers
+
+
+def test_dropped_frames_are_released(camera):
+    frames = [camera.read() for _ in range(3)]
+    assert not camera.gray_buffers
+    del frames
+    gc.collect()
+
+    frame = camera.read()  # Would wait for hold_timeout if the dropped frames were not freed
+
+    assert frame.sequence == 3 and (frame.gray == 3).all()
+    assert all(camera.camera.released[number] for number in range(3))
+
+
+def test_capture_reclaims_after_hold_timeout(camera):
+    camera.hold_timeout = 0.1
+    held = [camera.read() for _ in range(3)]
+
+    frame = camera.read()
+
+    assert frame.sequence == 3
+    assert held[0].full() is None  # Oldest capture reclaimed
+    assert held[1].full() is not None
+
+
+class AlwaysMoving:
+    skipped = 0
+
+    def check(self, frame):
+        return True
+
+
+class SlowDetector:
+    """Finds one face in every frame, taking longer than several frame periods"""
+    name = "slow"
+    needs_color = False
+
+    def detect(self, image, scale=1.0, scale_factor=None):
+        time.sleep(0.25)
+        height, width = image.shape[:2]
+        return np.array([[width // 4, height // 4, width // 2, height // 2]])
+
+
+def test_pipeline_encodes_full_frame_after_slow_detection(camera, monkeypatch):
+    encoded = []
+    monkeypatch.setattr(pipeline, "encode_face", lambda frame, box: encoded.append(frame) or np.zeros(128))
+    monkeypatch.setattr(pipeline, "match_face", lambda *args: "alice")
+    unlocked = threading.Event()
+    face_pipeline = pipeline.FacePipeline(camera, SlowDetector(), gallery=None, motion_gate=AlwaysMoving(),
+                                          unlock=lambda: unlocked.set() or True)
+
+    face_pipeline.start()
+    try:
+        assert unlocked.wait(5)
+    finally:
+        face_pipeline.stop()
+
+    assert encoded and not any(isinstance(frame, DualStreamFrame) for frame in encoded)
+    assert encoded[0].shape == (FULL_SIZE[1], FULL_SIZE[0], 3)
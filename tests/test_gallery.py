@@ -0,0 +1,96 @@
+"""Gallery: binary format round-trip, quantized storage and JSON resolution"""
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+from gallery import (FaceGallery, GalleryWriter, convert_json_gallery, load_gallery, quantize, dequantize,
+                     read_gallery_metadata, resolve_gallery_file, save_gallery)
+
+
+def random_gallery(rows=40, seed=0):
+    rng = np.random.default_rng(seed)
+    encodings = rng.normal(0.0, 0.1, (rows, 128)).astype(np.float32)
+    return FaceGallery(encodings, [f"person{row}" for row in range(rows)])
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16", "int8"])
+def test_round_trip(tmp_path, dtype):
+    gallery = random_gallery()
+    path = str(tmp_path / "gallery.fidg")
+
+    save_gallery(gallery, path, {"source": "test"}, dtype)
+    loaded = load_gallery(path)
+
+    assert list(loaded.names) == list(gallery.names)
+    assert loaded.dtype == dtype
+    assert read_gallery_metadata(path)["source"] == "test"
+    tolerance = {"float32": 1e-7, "float16": 1e-3, "int8": 2e-3}[dtype]
+    np.testing.assert_allclose(loaded.float_encodings(), gallery.float_encodings(), atol=tolerance)
+
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_quantized_match_agrees_with_float32(tmp_path, dtype):
+    gallery = random_gallery(rows=2500)  # Spans several GALLERY_BLOCK_ROWS blocks, the last one partial
+    path = str(tmp_path / "gallery.fidg")
+    save_gallery(gallery, path, dtype=dtype)
+    quantized = load_gallery(path)
+    probes = gallery.float_encodings()[::97] + np.float32(0.01)
+
+    for probe in probes:
+        name, distance, _ = gallery.match(probe)
+        quantized_name, quantized_distance, _ = quantized.match(probe)
+        assert quantized_name == name
+        assert quantized_distance == pytest.approx(distance, abs=0.01)
+
+
+def test_int8_quantization_keeps_per_row_scale():
+    encodings = np.zeros((2, 128), dtype=np.float32)
+    encodings[0, :3] = (0.5, -0.25, 0.0)
+    encodings[1, :3] = (0.01, 0.02, -0.03)
+
+    rows, scales = quantize(encodings, "int8")
+
+    assert rows.dtype == np.int8
+    np.testing.assert_allclose(dequantize(rows, scales), encodings, atol=scales.max())
+    assert scales[0] > scales[1]  # A small row keeps its precision
+
+
+def test_failed_write_leaves_existing_gallery(tmp_path):
+    path = str(tmp_path / "gallery.fidg")
+    save_gallery(random_gallery(rows=3), path)
+
+    with pytest.raises(RuntimeError):
+        with GalleryWriter(path) as writer:
+            writer.add("intruder", np.zeros(128))
+            raise RuntimeError("interrupted")
+
+    assert "intruder" not in list(load_gallery(path).names)
+    assert not os.path.exists(f"{path}.tmp")
+
+
+def write_json(path, names):
+    with open(path, "w") as json_file:
+        json.dump({name: [0.01 * number] * 128 for number, name in enumerate(names, 1)}, json_file)
+
+
+def test_resolve_prefers_binary_gallery_unless_json_is_newer(tmp_path):
+    json_path, gallery_path = str(tmp_path / "faces.json"), str(tmp_path / "faces.fidg")
+    write_json(json_path, ["alice"])
+    convert_json_gallery(json_path, gallery_path)
+    os.utime(json_path, ns=(1, 1))
+
+    assert resolve_gallery_file(gallery_path, json_path) == gallery_path
+    assert list(load_gallery(gallery_path).names) == ["alice"]
+
+    write_json(json_path, ["alice", "bob"])  # Edited after the binary gallery was built
+    os.utime(gallery_path, ns=(1, 1))
+
+    assert resolve_gallery_file(gallery_path, json_path) == gallery_path
+    assert list(load_gallery(gallery_path).names) == ["alice", "bob"]
+
+
+def test_resolve_without_any_gallery(tmp_path):
+    assert resolve_gallery_file(str(tmp_path / "missing.fidg"), str(tmp_path / "missing.json")) is None
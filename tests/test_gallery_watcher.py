@@ -0,0 +1,48 @@
+"""Gallery watcher: hot reload from whichever gallery file is newest"""
+
+import json
+import os
+
+from gallery import FaceGallery, save_gallery
+from gallery_watcher import GalleryWatcher, LiveGallery
+
+
+def write_json(path, names, mtime_ns=None):
+    with open(path, "w") as json_file:
+        json.dump({name: [0.01 * number] * 128 for number, name in enumerate(names, 1)}, json_file)
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def make_watcher(tmp_path):
+    gallery_path, json_path = str(tmp_path / "faces.fidg"), str(tmp_path / "faces.json")
+    write_json(json_path, ["alice"], 10**9)
+    with open(json_path) as json_file:
+        live = LiveGallery(FaceGallery.from_dict(json.load(json_file)))
+    return live, GalleryWatcher(live, gallery_path, json_path, str(tmp_path / "faces.ivf")), gallery_path, json_path
+
+
+def test_follows_binary_gallery_written_after_start(tmp_path):
+    live, watcher, gallery_path, json_path = make_watcher(tmp_path)
+    enrolled = FaceGallery.from_dict({"alice": [0.01] * 128, "bob": [0.02] * 128})
+
+    save_gallery(enrolled, gallery_path)  # encode_faces.py writing the binary gallery only
+
+    assert watcher.check()
+    assert sorted(live.current.names) == ["alice", "bob"]
+    assert not watcher.check()
+
+
+def test_json_edit_rebuilds_binary_gallery(tmp_path):
+    live, watcher, gallery_path, json_path = make_watcher(tmp_path)
+    save_gallery(FaceGallery.from_dict({"alice": [0.01] * 128}), gallery_path)
+    os.utime(gallery_path, ns=(2 * 10**9, 2 * 10**9))
+    assert watcher.check()
+
+    write_json(json_path, ["alice", "carol"])  # Hand edit, newer than the binary gallery
+
+    assert watcher.check()
+    assert sorted(live.current.names) == ["alice", "carol"]
+    assert os.stat(gallery_path).st_mtime_ns >= os.stat(json_path).st_mtime_ns  # Rebuilt from the JSON
+    assert not watcher.check()
+    assert live.version == 2
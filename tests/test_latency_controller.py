@@ -0,0 +1,181 @@
+"""Latency controller: over budget, hot CPU and relax paths, bounds and adjustable settings"""
+
+import pytest
+
+from config import (CPU_TEMP_LIMIT, DETECTION_SCALE_BOUNDS, DETECTION_SCALE_MARGIN, FRAME_INTERVAL_BOUNDS,
+                    LATENCY_RELAX_WINDOWS, SCALE_FACTOR_BOUNDS, cascade_classifier_config)
+from detectors import DnnDetector, HaarDetector, HogDetector, detection_scale
+from latency_controller import LatencyController, adjustable_settings
+
+TARGET = 0.1
+
+
+class Board:
+    """Simulated CPU state, replaceable mid-test"""
+    temperature = 50.0
+    load = 0.2
+
+    def __call__(self):
+        return self.temperature, self.load
+
+
+def run_window(controller, latency):
+    """Feeds one full window of frames at the same latency, returns whether a setting moved"""
+    return [controller.observe(latency) for _ in range(controller.window)][-1]
+
+
+@pytest.fixture
+def board():
+    return Board()
+
+
+@pytest.fixture
+def controller(board):
+    return LatencyController(target=TARGET, window=5, frame_interval=0.1, enabled=True, cpu_state=board)
+
+
+def test_over_budget_cheapens_in_order(controller):
+    start = controller.settings()
+
+    assert run_window(controller, TARGET * 2)
+    assert controller.scale_factor > start["scale_factor"]
+    assert controller.detection_scale == start["detection_scale"]
+
+    while controller.scale_factor < SCALE_FACTOR_BOUNDS[1]:
+        run_window(controller, TARGET * 2)
+    run_window(controller, TARGET * 2)
+
+    assert controller.detection_scale < start["detection_scale"]
+    assert controller.frame_interval == start["frame_interval"]
+
+
+def test_settings_stay_within_bounds(controller):
+    for _ in range(100):
+        run_window(controller, TARGET * 10)
+
+    assert controller.scale_factor == SCALE_FACTOR_BOUNDS[1]
+    assert controller.detection_scale == DETECTION_SCALE_BOUNDS[0]
+    assert controller.frame_interval == FRAME_INTERVAL_BOUNDS[1]
+    assert not run_window(controller, TARGET * 10)  # Nothing left to cheapen
+
+
+def test_hot_cpu_lengthens_frame_interval_only(controller, board):
+    board.temperature = CPU_TEMP_LIMIT + 1
+
+    assert run_window(controller, TARGET / 2)
+
+    assert controller.frame_interval > 0.1
+    assert controller.scale_factor == cascade_classifier_config["scaleFactor"]
+    assert controller.history[-1][1] == "frame_interval"
+
+
+def test_relax_waits_for_calm_windows_and_undoes_newest_first(controller, board):
+    start = controller.settings()
+    run_window(controller, TARGET * 2)  # scale_factor
+    board.temperature = CPU_TEMP_LIMIT + 1
+    run_window(controller, TARGET / 2)  # frame_interval
+    board.temperature = 50.0
+    cheapened = controller.settings()
+
+    for _ in range(LATENCY_RELAX_WINDOWS - 1):
+        assert not run_window(controller, TARGET / 10)
+    assert run_window(controller, TARGET / 10)
+    assert controller.frame_interval == start["frame_interval"]
+    assert controller.scale_factor == cheapened["scale_factor"]
+
+    for _ in range(LATENCY_RELAX_WINDOWS):
+        run_window(controller, TARGET / 10)
+    assert controller.settings() == start
+
+
+def test_relax_never_goes_past_starting_settings(controller):
+    start = controller.settings()
+
+    for _ in range(LATENCY_RELAX_WINDOWS * 5):
+        assert not run_window(controller, TARGET / 10)
+
+    assert controller.settings() == start
+    assert controller.frame_interval > FRAME_INTERVAL_BOUNDS[0]
+
+
+def test_calm_streak_is_reset_by_a_busy_window(controller):
+    run_window(controller, TARGET * 2)
+    for _ in range(LATENCY_RELAX_WINDOWS - 1):
+        run_window(controller, TARGET / 10)
+    run_window(controller, TARGET * 0.9)  # Within budget but not calm
+
+    assert not run_window(controller, TARGET / 10)
+
+
+def test_disabled_controller_only_measures(board):
+    controller = LatencyController(target=TARGET, window=5, enabled=False, cpu_state=board)
+    start = controller.settings()
+
+    assert not run_window(controller, TARGET * 10)
+
+    assert controller.settings() == start
+    assert controller.last_p95 == pytest.approx(TARGET * 10)
+
+
+def test_unsupported_settings_are_skipped(board):
+    controller = LatencyController(target=TARGET, window=5, frame_interval=0.1, enabled=True, cpu_state=board,
+                                   adjustable=("frame_interval",))
+    start = controller.settings()
+
+    assert run_window(controller, TARGET * 2)
+
+    assert controller.frame_interval > start["frame_interval"]
+    assert controller.scale_factor == start["scale_factor"]
+    assert controller.detection_scale == start["detection_scale"]
+
+
+class DualStreamCamera:
+    downscalable = False
+
+
+def test_adjustable_settings_follow_detector_and_camera():
+    haar = HaarDetector.__new__(HaarDetector)  # Class attributes only, no cascade file needed
+    haar.smallest_face = 24
+    hog = HogDetector.__new__(HogDetector)
+    hog.smallest_face = 80
+    dnn = DnnDetector.__new__(DnnDetector)
+
+    assert adjustable_settings(haar) == ("scale_factor", "detection_scale", "frame_interval")
+    assert adjustable_settings(haar, DualStreamCamera()) == ("scale_factor", "frame_interval")
+    assert adjustable_settings(hog) == ("frame_interval",)  # 80 px window, minSize faces need the full frame
+    assert adjustable_settings(dnn, DualStreamCamera()) == ("frame_interval",)
+
+
+def test_detection_scale_keeps_min_size_a_margin_above_the_smallest_face():
+    haar = HaarDetector()
+    hog = HogDetector.__new__(HogDetector)
+    hog.smallest_face = 80
+    dnn = DnnDetector.__new__(DnnDetector)
+    min_size = min(cascade_classifier_config["minSize"])
+
+    assert min_size * detection_scale(haar, None) >= DETECTION_SCALE_MARGIN * haar.smallest_face
+    assert detection_scale(haar, None) < 1.0
+    assert min_size * detection_scale(hog, None) >= 80
+    assert detection_scale(dnn, None) == 1.0
+    assert detection_scale(haar, 0.5) == 0.5  # A configured scale is used as is
+
+
+def test_controller_starts_from_the_detection_scale(board):
+    controller = LatencyController(target=TARGET, window=5, enabled=True, cpu_state=board,
+                                   adjustable=("detection_scale",), detection_scale=0.25)
+
+    assert controller.detection_scale == 0.25
+    assert run_window(controller, TARGET * 2)
+    assert controller.detection_scale < 0.25
+    assert controller.detection_scale >= DETECTION_SCALE_BOUNDS[0]
+
+
+def test_controller_stays_above_the_detectors_smallest_scale(board):
+    min_scale = detection_scale(HaarDetector(), None)
+    controller = LatencyController(target=TARGET, window=5, enabled=True, cpu_state=board,
+                                   adjustable=("detection_scale",), detection_scale=1.0, min_scale=min_scale)
+
+    while run_window(controller, TARGET * 2):
+        pass
+
+    assert controller.detection_scale == min_scale
@@ -0,0 +1,51 @@
+"""Single-door detection loop: unlocks go to the configured door's serial port, failed unlocks are retried"""
+
+import time
+
+import numpy as np
+import pytest
+
+import main
+from test_pipeline import AlwaysMoving, CentreDetector, enrolled_gallery, face_frame
+
+
+class FiniteCamera:
+    """Frame source returning the same frame a few times, then None"""
+    downscalable = True
+
+    def __init__(self, frame, count=10):
+        self.frame = frame
+        self.count = count
+
+    def read(self):
+        if self.count == 0:
+            return None
+        self.count -= 1
+        time.sleep(1 / 30)
+        return self.frame.copy()
+
+
+@pytest.mark.parametrize("pipeline_enabled", [True, False])
+def test_single_door_unlocks_its_own_serial_port(monkeypatch, pipeline_enabled):
+    ports = []
+    monkeypatch.setattr(main, "unlock_door", lambda port: ports.append(port) or True)
+    monkeypatch.setattr(main, "MotionGate", lambda camera: AlwaysMoving())
+    monkeypatch.setattr(main, "PIPELINE_ENABLED", pipeline_enabled)
+    frame = face_frame((40, 120, 200))
+
+    main.detect_face(FiniteCamera(frame), CentreDetector(), enrolled_gallery(frame), "front", "/dev/ttyUSB1")
+
+    assert ports and set(ports) == {"/dev/ttyUSB1"}
+
+
+@pytest.mark.parametrize("pipeline_enabled", [True, False])
+def test_failed_unlock_is_verified_again(monkeypatch, pipeline_enabled):
+    attempts = []
+    monkeypatch.setattr(main, "unlock_door", lambda port: attempts.append(port) and False)
+    monkeypatch.setattr(main, "MotionGate", lambda camera: AlwaysMoving())
+    monkeypatch.setattr(main, "PIPELINE_ENABLED", pipeline_enabled)
+    frame = face_frame((40, 120, 200))
+
+    main.detect_face(FiniteCamera(frame, count=10), CentreDetector(), enrolled_gallery(frame), "front")
+
+    assert len(attempts) > 1  # Not cached as verified for TRACK_IDENTITY_TTL
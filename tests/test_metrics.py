@@ -0,0 +1,84 @@
+"""Metrics: per-door registries rendered as one Prometheus text exposition"""
+
+import re
+import threading
+
+import pytest
+
+from metrics import Metrics, MetricsRouter
+
+SAMPLE = re.compile(r'^(?P<name>[a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(?P<labels>[^}]*)\})? (?P<value>\S+)$')
+LABEL = re.compile(r'(\w+)="([^"]*)"')
+
+
+def parse_exposition(text):
+    """Parses Prometheus text into {family: type} and [(name, labels, value)], failing on any malformed line"""
+    families, samples = {}, []
+    for line in text.splitlines():
+        if line.startswith("# TYPE "):
+            _, _, family, kind = line.split(" ")
+            assert family not in families, f"{family} declared twice"
+            families[family] = kind
+            continue
+        match = SAMPLE.match(line)
+        assert match, f"malformed line {line!r}"
+        labels = dict(LABEL.findall(match["labels"] or ""))
+        samples.append((match["name"], labels, float(match["value"])))
+    return families, samples
+
+
+def value(samples, name, **labels):
+    (found,) = [sample_value for sample_name, sample_labels, sample_value in samples
+                if sample_name == name and sample_labels == labels]
+    return found
+
+
+@pytest.fixture
+def router():
+    return MetricsRouter(Metrics({"site": "lab"}))
+
+
+def record_door(router, door, detect_seconds, unlocks):
+    """Records from a thread bound to the door's registry, the way each door's pipeline threads do"""
+    def run():
+        router.bind(router.for_door(door))
+        for seconds in detect_seconds:
+            router.observe("detect", seconds)
+        router.increment("unlocks", unlocks)
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+
+
+def test_doors_are_exported_under_their_own_labels(router):
+    record_door(router, "front", [0.004, 0.02], unlocks=2)
+    record_door(router, "back", [0.3], unlocks=0)
+
+    families, samples = parse_exposition(router.render_prometheus())
+
+    assert families["faceid_unlocks_total"] == "counter"
+    assert families["faceid_stage_latency_seconds"] == "histogram"
+    assert value(samples, "faceid_unlocks_total", site="lab", door="front") == 2
+    assert value(samples, "faceid_unlocks_total", site="lab", door="back") == 0
+    assert value(samples, "faceid_unlocks_total", site="lab") == 0  # The default registry saw nothing
+    assert value(samples, "faceid_stage_latency_seconds_count", site="lab", door="front", stage="detect") == 2
+    assert value(samples, "faceid_stage_latency_seconds_sum", site="lab", door="front", stage="detect") == \
+        pytest.approx(0.024)
+    assert value(samples, "faceid_stage_latency_seconds_bucket", site="lab", door="back", stage="detect",
+                 le="0.25") == 0
+    assert value(samples, "faceid_stage_latency_seconds_bucket", site="lab", door="back", stage="detect",
+                 le="0.5") == 1
+
+
+def test_histogram_buckets_are_cumulative(router):
+    record_door(router, "front", [0.0005, 0.004, 0.02, 0.02, 3.0], unlocks=0)
+
+    _, samples = parse_exposition(router.render_prometheus())
+    buckets = [(labels["le"], count) for name, labels, count in samples
+               if name == "faceid_stage_latency_seconds_bucket" and labels.get("door") == "front"]
+
+    counts = [count for _, count in buckets]
+    assert counts == sorted(counts)
+    assert buckets[0] == ("0.001", 1)
+    assert buckets[-1] == ("+Inf", 5)
+    assert value(samples, "faceid_stage_latency_seconds_count", site="lab", door="front", stage="detect") == 5
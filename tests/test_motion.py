@@ -0,0 +1,76 @@
+"""Motion gate: static frames go idle after MOTION_IDLE_AFTER, skipping detection and backing off, motion wakes it"""
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import motion
+from config import MOTION_IDLE_AFTER, MOTION_IDLE_FPS, MOTION_IDLE_INTERVAL
+from motion import MotionGate
+
+
+class RateCamera:
+    """Frame source that only records frame rate changes"""
+    fps = 30
+
+    def __init__(self):
+        self.rates = []
+
+    def set_frame_rate(self, fps):
+        self.rates.append(fps)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replaces the gate's monotonic clock, advance it by setting clock.now"""
+    clock = SimpleNamespace(now=100.0)
+    monkeypatch.setattr(motion, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def hallway(person=False):
+    frame = np.full((240, 320, 3), 90, dtype=np.uint8)
+    if person:
+        frame[40:220, 120:200] = 220
+    return frame
+
+
+def test_static_frames_go_idle_and_motion_wakes_the_gate(clock):
+    camera = RateCamera()
+    gate = MotionGate(camera)
+
+    assert [gate.check(hallway()) for _ in range(3)] == [True, True, True]  # Active until MOTION_IDLE_AFTER passes
+    assert gate.idle_delay() == 0.0
+
+    clock.now += MOTION_IDLE_AFTER + 0.1
+    assert [gate.check(hallway()) for _ in range(3)] == [False, False, False]
+    assert gate.skipped == 3
+    assert gate.idle_delay() == MOTION_IDLE_INTERVAL
+    assert camera.rates == [MOTION_IDLE_FPS]
+
+    clock.now += 1.0
+    assert gate.check(hallway(person=True))
+    assert gate.skipped == 3
+    assert gate.idle_delay() == 0.0
+    assert camera.rates == [MOTION_IDLE_FPS, RateCamera.fps]
+
+
+def test_motion_keeps_the_gate_active(clock):
+    gate = MotionGate()
+    gate.check(hallway())
+
+    for number in range(5):
+        clock.now += MOTION_IDLE_AFTER / 2
+        assert gate.check(hallway(person=number % 2 == 0))
+
+    assert gate.skipped == 0
+
+
+def test_disabled_gate_passes_every_frame(clock, monkeypatch):
+    monkeypatch.setattr(motion, "MOTION_GATE_ENABLED", False)
+    gate = MotionGate()
+
+    clock.now += MOTION_IDLE_AFTER * 2
+    assert gate.check(hallway()) and gate.check(hallway())
+    assert gate.skipped == 0 and gate.idle_delay() == 0.0
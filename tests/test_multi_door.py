@@ -0,0 +1,95 @@
+"""Shared encoder scheduler: per-door latest-wins queues and round-robin fairness between doors"""
+
+import threading
+
+import pytest
+
+import multi_door
+from metrics import metrics
+from multi_door import EncoderScheduler
+
+
+class RecordingDoor:
+    """Stands in for a door's FacePipeline, records the candidates it is asked to encode"""
+
+    def __init__(self, door, served):
+        self.door = door
+        self.metrics = metrics.default
+        self.served = served
+
+    def encode_candidate(self, candidate):
+        self.served.append((self.door, candidate))
+
+
+@pytest.fixture
+def deep_queues(monkeypatch):
+    monkeypatch.setattr(multi_door, "PIPELINE_QUEUE_SIZE", 4)
+
+
+def take(scheduler):
+    with scheduler.condition:
+        pipeline, candidate = scheduler._next()
+    return pipeline.door, candidate
+
+
+def test_flooded_door_only_replaces_its_own_faces(deep_queues):
+    scheduler = EncoderScheduler(workers=1)
+    busy, quiet = RecordingDoor("busy", []), RecordingDoor("quiet", [])
+    scheduler.register(busy)
+    scheduler.register(quiet)
+
+    for number in range(10):
+        scheduler.submit(busy, number)
+    scheduler.submit(quiet, "face")
+
+    assert scheduler.depth(busy) == 4 and scheduler.dropped(busy) == 6
+    assert scheduler.depth(quiet) == 1 and scheduler.dropped(quiet) == 0
+
+
+def test_waiting_door_is_served_within_one_round(deep_queues):
+    scheduler = EncoderScheduler(workers=1)
+    busy, quiet = RecordingDoor("busy", []), RecordingDoor("quiet", [])
+    scheduler.register(busy)
+    scheduler.register(quiet)
+    for number in range(10):
+        scheduler.submit(busy, number)
+
+    assert take(scheduler) == ("busy", 6)
+    scheduler.submit(quiet, "face")  # Arrives while the busy door still has three faces waiting
+    for number in range(10, 20):
+        scheduler.submit(busy, number)
+
+    assert take(scheduler) == ("quiet", "face")
+    assert take(scheduler) == ("busy", 16)
+
+
+def test_workers_serve_a_quiet_door_during_a_flood(deep_queues):
+    served = []
+    scheduler = EncoderScheduler(workers=1)
+    quiet_served = threading.Event()
+
+    class FloodingDoor(RecordingDoor):
+        def encode_candidate(self, candidate):
+            super().encode_candidate(candidate)
+            if candidate == 0:
+                scheduler.submit(quiet, "face")
+            if not quiet_served.is_set():
+                for number in range(4):
+                    scheduler.submit(self, candidate + number + 1)  # Always a full queue behind the quiet face
+
+    class QuietDoor(RecordingDoor):
+        def encode_candidate(self, candidate):
+            super().encode_candidate(candidate)
+            quiet_served.set()
+
+    busy, quiet = FloodingDoor("busy", served), QuietDoor("quiet", served)
+    scheduler.register(busy)
+    scheduler.register(quiet)
+    scheduler.submit(busy, 0)
+    scheduler.start()
+    try:
+        assert quiet_served.wait(5)
+    finally:
+        scheduler.stop()
+
+    assert served.index(("quiet", "face")) == 1  # Straight after the busy door's face that was being encoded
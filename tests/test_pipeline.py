@@ -0,0 +1,114 @@
+"""Face pipeline: capture to unlock with the real encode and match stages, stale-frame dropping"""
+
+import threading
+import time
+
+import numpy as np
+
+import faceID
+import pipeline
+from config import PIPELINE_MAX_FRAME_AGE
+from gallery import FaceGallery
+
+
+class ReplayCamera:
+    """Frame source returning the same BGR frame at about 30 fps"""
+    downscalable = True
+
+    def __init__(self, frame):
+        self.frame = frame
+
+    def read(self):
+        time.sleep(1 / 30)
+        return self.frame.copy()
+
+
+class CentreDetector:
+    """Finds one face in the centre of every image"""
+    name = "centre"
+    needs_color = False
+
+    def detect(self, image, scale=1.0, scale_factor=None):
+        height, width = image.shape[:2]
+        return np.array([[width // 4, height // 4, width // 2, height // 2]])
+
+
+class AlwaysMoving:
+    skipped = 0
+
+    def check(self, frame):
+        return True
+
+
+def face_frame(color):
+    frame = np.zeros((240, 320, 3), dtype=np.uint8)
+    frame[60:180, 80:240] = color
+    return frame
+
+
+def run_until_decision(monkeypatch, frame, gallery):
+    """Runs a pipeline on a replayed frame until the match stage decides, True if it unlocked"""
+    decided = threading.Event()
+    unlocked = []
+    match_face = pipeline.match_face
+    monkeypatch.setattr(pipeline, "match_face", lambda *args: [match_face(*args), decided.set()][0])
+    face_pipeline = pipeline.FacePipeline(ReplayCamera(frame), CentreDetector(), gallery,
+                                          motion_gate=AlwaysMoving(), unlock=lambda: unlocked.append(True) or True)
+
+    face_pipeline.start()
+    try:
+        assert decided.wait(10)
+    finally:
+        face_pipeline.stop()
+    return bool(unlocked)
+
+
+def enrolled_gallery(frame):
+    face = CentreDetector().detect(frame)[0]
+    return FaceGallery([faceID.encode_face(frame, face)], ["alice"])
+
+
+def test_pipeline_unlocks_for_an_enrolled_face(monkeypatch):
+    frame = face_frame((40, 120, 200))
+
+    assert run_until_decision(monkeypatch, frame, enrolled_gallery(frame))
+
+
+def test_pipeline_rejects_an_unknown_face(monkeypatch):
+    gallery = enrolled_gallery(face_frame((40, 120, 200)))
+
+    assert not run_until_decision(monkeypatch, face_frame((200, 30, 30)), gallery)
+
+
+def make_pipeline():
+    return pipeline.FacePipeline(ReplayCamera(face_frame(0)), CentreDetector(), gallery=None,
+                                 motion_gate=AlwaysMoving(), unlock=lambda: True)
+
+
+def test_older_frames_are_stale_once_a_newer_one_is_matched():
+    face_pipeline = make_pipeline()
+    now = time.monotonic()
+
+    assert not face_pipeline._is_stale(pipeline.Candidate(5, now, None), claim=True)
+
+    assert face_pipeline._is_stale(pipeline.Candidate(3, now, None))
+    assert not face_pipeline._is_stale(pipeline.Candidate(6, now, None))
+    assert face_pipeline._is_stale(pipeline.Candidate(7, now - PIPELINE_MAX_FRAME_AGE - 1, None))
+    assert face_pipeline.stale_dropped == 2
+
+
+def test_stale_count_is_exact_across_stage_threads():
+    face_pipeline = make_pipeline()
+    old = pipeline.Candidate(0, time.monotonic() - PIPELINE_MAX_FRAME_AGE - 1, None)
+
+    def check():
+        for _ in range(2000):
+            face_pipeline._is_stale(old)
+
+    threads = [threading.Thread(target=check) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert face_pipeline.stale_dropped == 8 * 2000
@@ -0,0 +1,90 @@
+"""Serial worker against the fake microcontroller: ACK, late ACK, timeout, reconnect and shutdown"""
+
+import threading
+import time
+
+import pytest
+
+from config import SERIAL_ACK_TIMEOUT
+from fake_mcu import FakeMCU
+from serial_comm import SerialWorker, stop_serial_worker, unlock_door
+
+
+@pytest.fixture
+def mcu():
+    mcu = FakeMCU().start()
+    yield mcu
+    mcu.stop()
+
+
+@pytest.fixture
+def worker(mcu):
+    worker = SerialWorker(mcu.port)
+    worker.start()
+    assert worker.connected_once.wait(5)
+    yield worker
+    worker.stop()
+
+
+def test_unlock_acknowledged(mcu):
+    try:
+        assert unlock_door(mcu.port)
+    finally:
+        stop_serial_worker()
+    assert mcu.unlocks() == 1
+
+
+def test_late_ack_counts_as_success_without_resending(mcu, worker):
+    mcu.ack_delay = SERIAL_ACK_TIMEOUT * 1.5
+
+    command = worker.send("UNLOCK", "ACK UNLOCK", timeout=SERIAL_ACK_TIMEOUT * 3, retry=False)
+
+    assert command.ok
+    assert command.rtt > SERIAL_ACK_TIMEOUT
+    assert mcu.unlocks() == 1
+
+
+def test_missed_unlock_is_not_resent_and_link_recovers(mcu, worker):
+    mcu.silent = True
+
+    command = worker.send("UNLOCK", "ACK UNLOCK", timeout=SERIAL_ACK_TIMEOUT * 1.5, retry=False)
+
+    assert not command.ok
+    assert mcu.unlocks() == 1
+    mcu.silent = False
+    deadline = time.monotonic() + 5
+    while worker.reconnects == 0 and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert worker.reconnects == 1
+    assert worker.send("UNLOCK", "ACK UNLOCK", retry=False).ok
+    assert mcu.unlocks() == 2
+
+
+def test_idempotent_command_is_retried_after_reconnect(mcu, worker):
+    mcu.silent = True
+    threading.Timer(SERIAL_ACK_TIMEOUT * 1.2, setattr, (mcu, "silent", False)).start()
+
+    command = worker.send("PING", "PONG", timeout=SERIAL_ACK_TIMEOUT * 4)
+
+    assert command.ok
+    assert worker.reconnects == 1
+
+
+def test_stop_does_not_wait_for_heartbeat(mcu):
+    worker = SerialWorker(mcu.port)
+    worker.start()
+    assert worker.connected_once.wait(5)
+    started = time.monotonic()
+
+    worker.stop()
+
+    assert time.monotonic() - started < 0.5
+    assert not worker.thread.is_alive()
+
+
+def test_finish_keeps_first_outcome(worker):
+    command = worker.send("PING", "PONG")
+
+    assert command.ok
+    assert not command.finish(False)
+    assert command.ok
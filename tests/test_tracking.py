@@ -0,0 +1,99 @@
+"""Face tracker: track assignment, eviction and the verified-identity cache"""
+
+from config import TRACK_IDENTITY_TTL, TRACK_MAX_AGE, TRACK_MAX_TRACKS, TRACK_PENDING_TIMEOUT, TRACK_REJECT_TTL
+from tracking import FaceTracker, box_iou, centroid_shift
+
+BOX = (100, 100, 80, 80)
+
+
+def moved(box, dx, dy=0):
+    x, y, w, h = box
+    return (x + dx, y + dy, w, h)
+
+
+def test_box_helpers():
+    assert box_iou(BOX, BOX) == 1.0
+    assert box_iou(BOX, moved(BOX, 200)) == 0.0
+    assert box_iou(BOX, moved(BOX, 40)) == (40 * 80) / (2 * 80 * 80 - 40 * 80)
+    assert centroid_shift(BOX, moved(BOX, 40)) == 0.5
+
+
+def test_detections_continue_their_tracks():
+    tracker = FaceTracker()
+    first, second = tracker.update([BOX, moved(BOX, 300)], now=0.0)
+
+    assert tracker.update([moved(BOX, 10)], now=0.1)[0] is first
+    assert tracker.update([moved(BOX, 300, 5)], now=0.2)[0] is second
+    assert tracker.update([moved(BOX, 150)], now=0.3)[0] not in (first, second)
+
+
+def test_unseen_tracks_are_evicted():
+    tracker = FaceTracker()
+    (track,) = tracker.update([BOX], now=0.0)
+
+    assert tracker.update([BOX], now=TRACK_MAX_AGE + 0.1)[0] is not track
+    for number in range(TRACK_MAX_TRACKS + 4):
+        tracker.update([moved(BOX, 1000 * (number + 1))], now=TRACK_MAX_AGE + 0.2 + number * 0.01)
+    assert len(tracker.tracks) == TRACK_MAX_TRACKS
+
+
+def test_cached_identity_is_reused_until_it_expires():
+    tracker = FaceTracker()
+    (track,) = tracker.update([BOX], now=0.0)
+    assert tracker.needs_verification(track, now=0.0)
+    tracker.record(track, "alice", now=0.1)
+
+    assert not tracker.needs_verification(track, now=0.2)
+    assert tracker.cache_hits == 1
+    assert tracker.needs_verification(track, now=0.1 + TRACK_IDENTITY_TTL)
+
+
+def test_rejections_expire_sooner():
+    tracker = FaceTracker()
+    (track,) = tracker.update([BOX], now=0.0)
+    tracker.needs_verification(track, now=0.0)
+    tracker.record(track, None, now=0.0)
+
+    assert tracker.needs_verification(track, now=TRACK_REJECT_TTL)
+
+
+def test_verification_in_flight_is_not_repeated():
+    tracker = FaceTracker()
+    (track,) = tracker.update([BOX], now=0.0)
+
+    assert tracker.needs_verification(track, now=0.0)
+    assert not tracker.needs_verification(track, now=TRACK_PENDING_TIMEOUT / 2)
+    assert tracker.needs_verification(track, now=TRACK_PENDING_TIMEOUT)
+
+
+def test_result_is_cached_for_the_encoded_box():
+    tracker = FaceTracker()
+    (track,) = tracker.update([BOX], now=0.0)
+    tracker.needs_verification(track, now=0.0)
+    tracker.update([moved(BOX, 30)], now=0.1)  # The face moves on while BOX is being encoded
+    tracker.record(track, "alice", BOX, now=0.2)
+
+    assert track.verified_box == BOX
+    assert tracker.needs_verification(track, now=0.3)  # The latest box overlaps the encoded one too little
+
+
+def test_moved_face_is_verified_again():
+    tracker = FaceTracker()
+    (track,) = tracker.update([BOX], now=0.0)
+    tracker.needs_verification(track, now=0.0)
+    tracker.record(track, "alice", BOX, now=0.0)
+
+    tracker.update([moved(BOX, 30)], now=0.1)
+
+    assert tracker.needs_verification(track, now=0.1)
+
+
+def test_forget_identities_forces_verification():
+    tracker = FaceTracker()
+    (track,) = tracker.update([BOX], now=0.0)
+    tracker.needs_verification(track, now=0.0)
+    tracker.record(track, "alice", now=0.0)
+
+    tracker.forget_identities()
+
+    assert tracker.needs_verification(track, now=0.1)
@@ -0,0 +1,231 @@
+"""
+tracking.py
+
+This script follows detected faces across frames with a lightweight IoU and
+centroid tracker, and caches the verified identity of every track so a
+person lingering at the door is not re-encoded on every frame.
+"""
+
+#------------------------------------------------------------------------------
+# Imports
+#------------------------------------------------------------------------------
+import logging  # For logging events and errors
+import threading  # For sharing the tracker between pipeline workers
+import time     # For timing operations
+from config import *  # Import all configuration variables from config.py
+
+#------------------------------------------------------------------------------
+# Logging
+#------------------------------------------------------------------------------
+logger = logging.getLogger(__name__)  # Get a logger instance for this module
+
+#------------------------------------------------------------------------------
+# Box Helpers
+#------------------------------------------------------------------------------
+def box_iou(box_a, box_b):
+    """
+    Intersection over union of two (x, y, w, h) boxes
+
+    Returns:
+        float: Overlap between 0 (disjoint) and 1 (identical)
+    """
+    ax, ay, aw, ah = box_a
+    bx, by, bw, bh = box_b
+    overlap_w = min(ax + aw, bx + bw) - max(ax, bx)
+    overlap_h = min(ay + ah, by + bh) - max(ay, by)
+    if overlap_w <= 0 or overlap_h <= 0:
+        return 0.0
+    intersection = overlap_w * overlap_h
+    return intersection / float(aw * ah + bw * bh - intersection)
+
+
+def centroid_shift(box_a, box_b):
+    """
+    Distance between the centres of two (x, y, w, h) boxes, relative to the size of box_a
+
+    Returns:
+        float: Centre distance divided by the larger side of box_a
+    """
+    ax, ay, aw, ah = box_a
+    bx, by, bw, bh = box_b
+    dx = (bx + bw / 2.0) - (ax + aw / 2.0)
+    dy = (by + bh / 2.0) - (ay + ah / 2.0)
+    return (dx * dx + dy * dy) ** 0.5 / float(max(aw, ah, 1))
+
+#------------------------------------------------------------------------------
+# Track
+#------------------------------------------------------------------------------
+class Track:
+    """
+    A face followed across frames
+
+    Attributes:
+        track_id: Identifier that stays the same while the face is followed
+        box: Latest (x, y, w, h) of the face
+        last_seen: time.monotonic() of the latest detection
+        identity: Cached verification result, a name or None for a rejected face
+        verified_at: time.monotonic() of the cached result, None if never verified
+        verified_box: Box the cached result was computed from
+        pending_since: time.monotonic() a verification was handed out, None when none is in flight
+    """
+
+    def __init__(self, track_id, box, now):
+        self.track_id = track_id
+        self.box = tuple(int(value) for value in box)
+        self.last_seen = now
+        self.identity = None
+        self.verified_at = None
+        self.verified_box = None
+        self.pending_since = None
+
+#------------------------------------------------------------------------------
+# Face Tracker
+#------------------------------------------------------------------------------
+class FaceTracker:
+    """
+    Greedy IoU tracker with a centroid fallback and a per-track identity cache
+
+    A detection joins the existing track it overlaps most (IoU at least
+    TRACK_MIN_IOU), or failing that the nearest track whose centre moved less
+    than TRACK_MAX_CENTROID_SHIFT box sizes. Tracks unseen for TRACK_MAX_AGE
+    seconds are evicted together with their cached identity.
+    """
+
+    def __init__(self):
+        self.tracks = {}
+        self.next_track_id = 0
+        self.lock = threading.Lock()
+        self.cache_hits = 0
+        self.verifications = 0
+
+    def update(self, boxes, now=None):
+        """
+        Assigns detections to tracks, creating tracks for new faces
+
+        Args:
+            boxes: Sequence of (x, y, w, h) detections from one frame
+            now: Optional time.monotonic() of the frame
+
+        Returns:
+            list: Track for every box, in the same order
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self._evict(now)
+            assigned = []
+            free = set(self.tracks)
+            for box in boxes:
+                track = self._closest_track(box, free)
+                if track is None:
+                    track = Track(self.next_track_id, box, now)
+                    self.tracks[track.track_id] = track
+                    self.next_track_id += 1
+                    logger.debug(f"New face track {track.track_id}")
+                else:
+                    free.discard(track.track_id)
+                    track.box = tuple(int(value) for value in box)
+                    track.last_seen = now
+                assigned.append(track)
+            self._limit()
+            return assigned
+
+    def needs_verification(self, track, now=None):
+        """
+        Decides whether a track has to be encoded and matched again
+
+        A cached identity is reused until it is older than TRACK_IDENTITY_TTL
+        (TRACK_REJECT_TTL for rejected faces), or until the face has moved
+        enough that the track may now belong to someone else.
+
+        Args:
+            track: Track returned by update
+            now: Optional time.monotonic() of the frame
+
+        Returns:
+            bool: True if the face must be verified, False if the cached identity holds
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            if track.pending_since is not None and now - track.pending_since < TRACK_PENDING_TIMEOUT:
+                return False  # A verification of this track is already in flight
+            if self._cached_identity_valid(track, now):
+                self.cache_hits += 1
+                return False
+            track.pending_since = now
+            return True
+
+    def _cached_identity_valid(self, track, now):
+        """True if the track has a cached result that is fresh and still matches the face"""
+        if track.verified_at is None:
+            return False
+        ttl = TRACK_IDENTITY_TTL if track.identity is not None else TRACK_REJECT_TTL
+        if now - track.verified_at >= ttl:
+            return False
+        return box_iou(track.verified_box, track.box) >= TRACK_REVERIFY_IOU  # A moved face warrants a fresh look
+
+    def record(self, track, identity, box=None, now=None):
+        """
+        Caches the verification result of a track
+
+        Args:
+            track: Track that was verified
+            identity: Verified name, or None if the face was rejected
+            box: (x, y, w, h) the face was encoded from, None uses the track's latest box.
+                The track may have moved on while the encoding was computed.
+            now: Optional time.monotonic() of the verification
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            track.identity = identity
+            track.verified_at = now
+            track.verified_box = tuple(int(value) for value in box) if box is not None else track.box
+            track.pending_since = None
+            self.verifications += 1
+
+    def cancel(self, track):
+        """
+        Abandons a verification handed out by needs_verification without a
+        result, e.g. the face was not encoded, so the next frame retries
+
+        Args:
+            track: Track whose verification was abandoned
+        """
+        with self.lock:
+            track.pending_since = None
+
+    def forget_identities(self):
+        """Drops every cached identity, e.g. after the gallery changed and someone may have been revoked"""
+        with self.lock:
+            for track in self.tracks.values():
+                track.identity = None
+                track.verified_at = None
+                track.verified_box = None
+
+    def _closest_track(self, box, candidates):
+        """Best unassigned track for a detection, or None if none is close enough"""
+        best_track, best_iou = None, TRACK_MIN_IOU
+        for track_id in candidates:
+            iou = box_iou(self.tracks[track_id].box, box)
+            if iou >= best_iou:
+                best_track, best_iou = self.tracks[track_id], iou
+        if best_track is not None:
+            return best_track
+
+        best_shift = TRACK_MAX_CENTROID_SHIFT
+        for track_id in candidates:
+            shift = centroid_shift(self.tracks[track_id].box, box)
+            if shift <= best_shift:
+                best_track, best_shift = self.tracks[track_id], shift
+        return best_track
+
+    def _evict(self, now):
+        """Drops tracks that have not been seen for TRACK_MAX_AGE seconds"""
+        for track_id in [track_id for track_id, track in self.tracks.items() if now - track.last_seen > TRACK_MAX_AGE]:
+            logger.debug(f"Face track {track_id} expired")
+            del self.tracks[track_id]
+
+    def _limit(self):
+        """Drops the least recently seen tracks beyond TRACK_MAX_TRACKS"""
+        while len(self.tracks) > TRACK_MAX_TRACKS:
+            oldest = min(self.tracks.values(), key=lambda track: track.last_seen)
+            del self.tracks[oldest.track_id]